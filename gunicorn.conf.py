@@ -0,0 +1,18 @@
+# gunicorn.conf.py — gunicorn подхватывает его сам из рабочего каталога (/app)
+# Нужен для multiprocess-метрик Prometheus (см. monitoring.instrumentation).
+import os
+import shutil
+
+
+def on_starting(server):
+    # данные прошлого запуска не должны попасть в сумму
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,13 +1,46 @@
-from fastapi import FastAPI
-import random
+"""
+Мок машин для docker compose: FastAPI-обёртка над monitoring.mockserver.MockServer.
+Ответы /m/<id>/metrics (задержки, ошибки, «зависания», некорректные тела) —
+целиком из MockServer, здесь только параметры из окружения и /m/list для seed_all.
+
+Переменные окружения (см. python -m monitoring.mockserver --help):
+  MOCK_MACHINES        — сколько машин отдаёт /m/list (30)
+  MOCK_LATENCY_MS      — медиана задержки ответа, мс (0 — без задержки)
+  MOCK_LATENCY_SIGMA   — разброс задержки (логнормальное распределение), 0.5
+  MOCK_ERROR_RATE      — доля ответов HTTP 500
+  MOCK_TIMEOUT_RATE    — доля запросов, которые «зависают» на MOCK_HANG_SEC секунд
+  MOCK_INVALID_RATE    — доля ответов с некорректным телом
+  MOCK_HOT_RATE        — доля машин со значениями выше порогов правил (0.05)
+"""
+import os
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI, Response
+
+# корень проекта смонтирован в контейнер мока вместе с mock/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from monitoring.mockserver import MockServer  # noqa: E402
+
+MACHINES = int(os.getenv("MOCK_MACHINES", "30"))
+
+server = MockServer(
+    latency_ms=float(os.getenv("MOCK_LATENCY_MS", "0")),
+    latency_sigma=float(os.getenv("MOCK_LATENCY_SIGMA", "0.5")),
+    error_rate=float(os.getenv("MOCK_ERROR_RATE", "0")),
+    timeout_rate=float(os.getenv("MOCK_TIMEOUT_RATE", "0")),
+    invalid_rate=float(os.getenv("MOCK_INVALID_RATE", "0")),
+    hang_sec=float(os.getenv("MOCK_HANG_SEC", "60")),
+    hot_rate=float(os.getenv("MOCK_HOT_RATE", "0.05")),
+)
 
 app = FastAPI()
 
+@app.get("/m/list")
+def machines():
+    return [{"id": i, "name": f"node-{i:02d}"} for i in range(1, MACHINES + 1)]
+
 @app.get("/m/{mid}/metrics")
-def metrics(mid: int):
-    return {
-        "cpu": random.randint(1, 95),
-        "mem": f"{random.randint(10, 85)}%",
-        "disk": f"{random.randint(5, 90)}%",
-        "uptime": f"{random.randint(0,5)}d {random.randint(0,23)}h {random.randint(0,59)}m {random.randint(0,59)}s",
-    }
+async def metrics(mid: int):
+    status, body = await server.respond(b"GET /m/%d/metrics" % mid)
+    return Response(body, status_code=status, media_type="application/json")
@@ -83,17 +83,41 @@ WSGI_APPLICATION = 'monitor_site.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": env("MYSQL_DATABASE"),
-        "USER": env("MYSQL_USER"),
-        "PASSWORD": env("MYSQL_PASSWORD"),
-        "HOST": env("MYSQL_HOST"),
-        "PORT": env("MYSQL_PORT"),
-        "OPTIONS": {"charset": "utf8mb4"},
+# SQLITE_PATH задан — локальный режим без внешних сервисов (бенчмарки, разработка):
+# SQLite вместо MySQL и брокер Celery в памяти
+SQLITE_PATH = env.str("SQLITE_PATH", "")
+
+if SQLITE_PATH:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": SQLITE_PATH,
+            "OPTIONS": {"timeout": 30},
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.mysql",
+            "NAME": env("MYSQL_DATABASE"),
+            "USER": env("MYSQL_USER"),
+            "PASSWORD": env("MYSQL_PASSWORD"),
+            "HOST": env("MYSQL_HOST"),
+            "PORT": env("MYSQL_PORT"),
+            "OPTIONS": {"charset": "utf8mb4"},
+        }
+    }
+
+
+# Кэш: общий Redis, если задан CACHE_URL, иначе память процесса (для разработки)
+CACHE_URL = env.str("CACHE_URL", "")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
     }
-}
 
 
 # Password validation
@@ -138,17 +162,112 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CELERY_BROKER_URL = env("CELERY_BROKER_URL")
-CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND")
+if SQLITE_PATH:
+    CELERY_BROKER_URL = env.str("CELERY_BROKER_URL", "memory://")
+    CELERY_RESULT_BACKEND = env.str("CELERY_RESULT_BACKEND", "cache+memory://")
+else:
+    CELERY_BROKER_URL = env("CELERY_BROKER_URL")
+    CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND")
 CELERY_TIMEZONE = TIME_ZONE
 
 CELERY_BEAT_SCHEDULE = {
-    "fetch-every-15-min": {
+    "fetch-due-every-minute": {
         "task": "monitoring.tasks.schedule_fetch_all",
-        "schedule": crontab(minute="*/15"),
+        "schedule": crontab(),
     },
     "evaluate-incidents-every-5-min": {
         "task": "monitoring.tasks.evaluate_incidents_all",
         "schedule": crontab(minute="*/5"),
     },
-}
\ No newline at end of file
+    "update-rollups-every-15-min": {
+        "task": "monitoring.tasks.update_metric_rollups",
+        "schedule": crontab(minute="5-59/15"),
+    },
+    "purge-expired-daily": {
+        "task": "monitoring.tasks.purge_expired_data",
+        "schedule": crontab(hour=3, minute=40),
+    },
+}
+
+# Сбор метрик: "async" — параллельный опрос, "sync" — последовательный (fallback)
+MONITORING_FETCH_MODE = env.str("MONITORING_FETCH_MODE", "async")
+MONITORING_FETCH_CONCURRENCY = env.int("MONITORING_FETCH_CONCURRENCY", 200)
+MONITORING_FETCH_TIMEOUT = env.float("MONITORING_FETCH_TIMEOUT", 10.0)
+
+# Запись метрик пачками: сброс по размеру пачки или по времени (сек)
+MONITORING_INGEST_BATCH_SIZE = env.int("MONITORING_INGEST_BATCH_SIZE", 500)
+MONITORING_INGEST_FLUSH_INTERVAL = env.float("MONITORING_INGEST_FLUSH_INTERVAL", 5.0)
+
+# Сколько машин опрашивает одна задача-шард fetch_shard
+MONITORING_FETCH_SHARD_SIZE = env.int("MONITORING_FETCH_SHARD_SIZE", 500)
+
+# Как часто воркер перечитывает правила инцидентов из БД (сек)
+MONITORING_RULES_TTL = env.int("MONITORING_RULES_TTL", 60)
+
+# Открывать/закрывать инциденты сразу при записи метрик (см. monitoring.streaming);
+# периодическая evaluate_incidents_all остаётся как сверка
+MONITORING_STREAMING_DETECTION = env.bool("MONITORING_STREAMING_DETECTION", True)
+
+# Агрегаты метрик: сколько сырых строк обрабатывать за шаг и сколько секунд
+# не трогать самые свежие строки (ещё могут коммититься)
+MONITORING_ROLLUP_BATCH_SIZE = env.int("MONITORING_ROLLUP_BATCH_SIZE", 20000)
+MONITORING_ROLLUP_LAG = env.int("MONITORING_ROLLUP_LAG", 60)
+
+# Хранение: сколько дней держать сырые метрики и закрытые инциденты;
+# удаление порциями с паузой и ограничением по времени на запуск (сек)
+MONITORING_METRIC_RETENTION_DAYS = env.int("MONITORING_METRIC_RETENTION_DAYS", 30)
+MONITORING_INCIDENT_RETENTION_DAYS = env.int("MONITORING_INCIDENT_RETENTION_DAYS", 90)
+MONITORING_PURGE_BATCH_SIZE = env.int("MONITORING_PURGE_BATCH_SIZE", 5000)
+MONITORING_PURGE_PAUSE = env.float("MONITORING_PURGE_PAUSE", 0.2)
+MONITORING_PURGE_TIME_BUDGET = env.float("MONITORING_PURGE_TIME_BUDGET", 600)
+
+# Секционирование таблицы метрик по received_at (только MySQL, см. monitoring.partitions):
+# "daily" | "weekly", пусто — выключено; таблицу один раз переводит partition_metrics --enable.
+# Секции создаются на AHEAD_DAYS вперёд и удаляются целиком при ежедневной очистке
+MONITORING_METRIC_PARTITIONING = env.str("MONITORING_METRIC_PARTITIONING", "")
+MONITORING_PARTITION_AHEAD_DAYS = env.int("MONITORING_PARTITION_AHEAD_DAYS", 14)
+
+# Блокировка проверки инцидентов (одна evaluate_incidents_all одновременно) в общем кэше;
+# TTL — с запасом больше самой долгой проверки, снимает блокировку упавшего воркера
+MONITORING_EVALUATION_LOCK_TTL = env.int("MONITORING_EVALUATION_LOCK_TTL", 600)
+
+# Сколько секунд живёт закэшированный ответ /api/incidents/json
+MONITORING_INCIDENTS_CACHE_TTL = env.int("MONITORING_INCIDENTS_CACHE_TTL", 60)
+
+# Снимок обзора парка (/fleet) обновляется после каждого прохода сбора;
+# TTL ограничивает его возраст, если проходов нет (push-машины)
+MONITORING_OVERVIEW_TTL = env.int("MONITORING_OVERVIEW_TTL", 300)
+
+# Redis pub/sub для живой ленты инцидентов (SSE); пусто — лента выключена,
+# страница инцидентов работает опросом
+MONITORING_EVENTS_REDIS_URL = env.str("MONITORING_EVENTS_REDIS_URL", "")
+
+# Приём метрик от агентов (POST /api/ingest): токен в заголовке
+# "Authorization: Bearer <token>"; пусто — приём выключен
+MONITORING_INGEST_TOKEN = env.str("MONITORING_INGEST_TOKEN", "")
+MONITORING_INGEST_MAX_SAMPLES = env.int("MONITORING_INGEST_MAX_SAMPLES", 10000)
+# Время сэмпла "at" от агента: не дальше SKEW сек в будущем (часы агента)
+# и не старше MAX_AGE сек (сэмплы из буфера ретранслятора)
+MONITORING_INGEST_MAX_SKEW_SEC = env.int("MONITORING_INGEST_MAX_SKEW_SEC", 300)
+MONITORING_INGEST_MAX_AGE_SEC = env.int("MONITORING_INGEST_MAX_AGE_SEC", 24 * 3600)
+
+# Импорт инвентаря машин (POST /api/machines/import, см. monitoring.inventory):
+# токен в заголовке "Authorization: Bearer <token>"; пусто — импорт через API выключен
+MONITORING_INVENTORY_TOKEN = env.str("MONITORING_INVENTORY_TOKEN", "")
+
+# Расписание опроса (см. monitoring.polling): обычный интервал, интервал для машин
+# с активным инцидентом (0 — как обычно), после скольких неудач подряд машина
+# проверяется только пробой раз в COOLDOWN секунд
+MONITORING_POLL_INTERVAL_SEC = env.int("MONITORING_POLL_INTERVAL_SEC", 15 * 60)
+MONITORING_POLL_INCIDENT_INTERVAL_SEC = env.int("MONITORING_POLL_INCIDENT_INTERVAL_SEC", 5 * 60)
+MONITORING_POLL_CIRCUIT_FAILURES = env.int("MONITORING_POLL_CIRCUIT_FAILURES", 5)
+MONITORING_POLL_CIRCUIT_COOLDOWN_SEC = env.int("MONITORING_POLL_CIRCUIT_COOLDOWN_SEC", 60 * 60)
+
+# Окна правил считаются по времени точек; разрыв между точками больше этого
+# (мин) прерывает серию нарушений
+MONITORING_WINDOW_MAX_GAP_MIN = env.int("MONITORING_WINDOW_MAX_GAP_MIN", 30)
+
+# Метрики мониторинга для Prometheus: веб отдаёт /metrics, воркер Celery —
+# отдельный HTTP-порт (0 — не поднимать). Для нескольких процессов задайте
+# PROMETHEUS_MULTIPROC_DIR (см. monitoring.instrumentation)
+MONITORING_WORKER_METRICS_PORT = env.int("MONITORING_WORKER_METRICS_PORT", 0)
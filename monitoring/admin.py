@@ -1,21 +1,143 @@
 from django.contrib import admin
-from .models import Machine, Metric, Incident
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connection
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Machine, Metric, Incident, IncidentRule, IncidentRuleOverride
+
+# Списки больших таблиц (Metric, Incident) не должны зависеть от размера таблицы:
+# - без точного COUNT(*) — оценка из статистики MySQL или подсчёт с ограничением;
+# - машина выбирается автодополнением, а не выпадающим списком всего парка;
+# - без параметров список открывается с ограничивающим фильтром по индексу: метрики —
+#   на сегодняшнем дне (date_hierarchy → диапазон), инциденты — активные (начавшиеся
+#   и раньше); сортировка — по индексированным колонкам.
+COUNT_LIMIT = 100_000
+
+
+def table_rows_estimate(model):
+    """Оценка числа строк таблицы из статистики MySQL (information_schema); None — не MySQL."""
+    if connection.vendor != "mysql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Без фильтров — оценка из статистики таблицы; с фильтрами — точное число,
+    но не больше COUNT_LIMIT (подсчёт останавливается на лимите).
+    Последние страницы по оценке могут оказаться пустыми или недоступными.
+    """
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = table_rows_estimate(qs.model)
+            if estimate is not None:
+                return estimate
+        return qs[:COUNT_LIMIT].count()
+
+
+class MachineFilter(admin.SimpleListFilter):
+    """Фильтр по машине с автодополнением (admin autocomplete по MachineAdmin.search_fields)."""
+    title = "machine"
+    parameter_name = "machine"
+    template = "admin/monitoring/machine_filter.html"
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(machine_id=int(self.value()))
+        return queryset
+
+    def choices(self, changelist):
+        value = self.value() if self.value() and self.value().isdigit() else None
+        yield {
+            "value": value,
+            "selected": Machine.objects.filter(id=value).values_list("name", flat=True).first() if value else None,
+            "clear_query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            # выбор машины добавляет machine=<id> к этой строке и начинает с первой страницы
+            "query_string": changelist.get_query_string(remove=[self.parameter_name, "p"]),
+            "app_label": changelist.model._meta.app_label,
+            "model_name": changelist.model._meta.model_name,
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    ordering = ("-id",)
+    list_select_related = ("machine",)
+    autocomplete_fields = ("machine",)
+
+    # строка запроса списка без параметров; None — сегодняшний день по date_hierarchy
+    default_query = None
+
+    def get_default_query(self):
+        if self.default_query is not None or not self.date_hierarchy:
+            return self.default_query
+        today, field = timezone.localdate(), self.date_hierarchy
+        return f"{field}__year={today.year}&{field}__month={today.month}&{field}__day={today.day}"
+
+    def changelist_view(self, request, extra_context=None):
+        # без параметров — фильтр по умолчанию, а не вся таблица;
+        # с любым параметром (сортировка, фильтр) список открывается как есть
+        if request.method == "GET" and not request.GET:
+            query = self.get_default_query()
+            if query:
+                return redirect(f"{request.path}?{query}")
+        return super().changelist_view(request, extra_context)
+
+    @property
+    def media(self):
+        # select2 и autocomplete.js для MachineFilter
+        return super().media + AutocompleteSelect(self.model._meta.get_field("machine"), self.admin_site).media
 
 
 @admin.register(Machine)
 class MachineAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "endpoint", "active", "created_at")
-    list_filter = ("active",)
+    list_display = ("id", "name", "endpoint", "collection_mode", "active", "next_poll_at", "poll_failures", "parse_errors", "created_at")
+    list_filter = ("active", "collection_mode")
     search_fields = ("name", "endpoint")
+    ordering = ("name",)  # уникальный индекс; нужен автодополнению машин
 
 @admin.register(Metric)
-class MetricAdmin(admin.ModelAdmin):
-    list_display = ("id", "machine", "cpu", "mem_percent", "disk_percent", "uptime", "received_at")
-    list_filter = ("machine",)
-    search_fields = ("machine__name", "uptime")
+class MetricAdmin(LargeTableAdmin):
+    list_display = ("id", "machine", "cpu", "mem_percent", "disk_percent", "uptime_sec", "received_at")
+    list_filter = (MachineFilter,)
+    date_hierarchy = "received_at"
+    sortable_by = ("id", "received_at")
 
 @admin.register(Incident)
-class IncidentAdmin(admin.ModelAdmin):
+class IncidentAdmin(LargeTableAdmin):
     list_display = ("id", "machine", "type", "is_active", "started_at", "last_seen_at", "resolved_at")
-    list_filter = ("type", "is_active", "machine")
-    search_fields = ("machine__name",)
\ No newline at end of file
+    list_filter = ("type", "is_active", MachineFilter)
+    date_hierarchy = "started_at"
+    sortable_by = ("id", "started_at")
+    # за ними открывают список: активные, в том числе начавшиеся не сегодня
+    default_query = "is_active__exact=1"
+
+class IncidentRuleOverrideInline(admin.TabularInline):
+    model = IncidentRuleOverride
+    extra = 0
+    raw_id_fields = ("machine",)
+
+@admin.register(IncidentRule)
+class IncidentRuleAdmin(admin.ModelAdmin):
+    list_display = ("code", "metric", "comparator", "threshold", "window_min", "enabled")
+    list_filter = ("enabled", "metric")
+    inlines = (IncidentRuleOverrideInline,)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MonitoringConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'monitoring'
+
+    def ready(self):
+        from . import checks, feed, instrumentation, rules  # noqa: F401 — проверки, сигналы кэшей, правил и метрик
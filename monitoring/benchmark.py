@@ -0,0 +1,343 @@
+# monitoring/benchmark.py
+"""
+Нагрузочный стенд: синтетический парк машин, история метрик и замеры.
+
+- эмулятор машин — monitoring.mockserver в отдельном процессе: задержка,
+  доля ошибок 500, «зависаний» и некорректных ответов настраиваются;
+- seed_fleet — N машин bench-00001… одним bulk_create (повторный запуск
+  переиспользует их и переключает endpoint на текущий мок);
+- generate_history — история Metric за несколько дней с явным received_at,
+  пачками bulk_create, с эпизодами перегрузки у горячих машин;
+- run_sweep / run_evaluation / load_api — замеры прохода сбора, проверки правил
+  и API инцидентов под конкурентной нагрузкой (Django test Client в потоках).
+
+Задачи выполняются в текущем процессе, без Celery-воркеров, Redis и внешних
+сервисов: достаточно SQLite (SQLITE_PATH) или локального MySQL. Отчёт — JSON
+с коммитом, СУБД и настройками, чтобы сравнивать прогоны между коммитами.
+"""
+import logging
+import platform
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+
+from . import instrumentation, polling, state
+from .evaluation import evaluate_all
+from .mockserver import MockProcess, is_hot
+from .models import Incident, Machine, Metric
+from .rollups import percentile, update_rollups
+from .tasks import fetch_shard, finish_fetch_sweep
+
+logger = logging.getLogger(__name__)
+
+BENCH_PREFIX = "bench-"
+
+# Настройки, от которых зависят результаты, — попадают в отчёт
+REPORTED_SETTINGS = (
+    "MONITORING_FETCH_MODE", "MONITORING_FETCH_CONCURRENCY", "MONITORING_FETCH_TIMEOUT",
+    "MONITORING_FETCH_SHARD_SIZE", "MONITORING_INGEST_BATCH_SIZE", "MONITORING_STREAMING_DETECTION",
+    "MONITORING_POLL_INTERVAL_SEC", "MONITORING_WINDOW_MAX_GAP_MIN",
+)
+
+# Эндпоинты API под нагрузкой; {ids} — несколько машин парка
+API_PATHS = (
+    "/api/incidents/json",
+    "/api/incidents/changes",
+    "/api/incidents/history?limit=500",
+    "/api/metrics/series?machine={ids}&points=300",
+    "/api/fleet/status",
+    "/fleet",
+)
+
+
+# ----------------------- Парк и история -----------------------
+
+def seed_fleet(count, host, prefix=BENCH_PREFIX, batch_size=1000):
+    """
+    Парк из count pull-машин prefix00001…: недостающие создаются, существующие
+    включаются и получают endpoint на host, лишние (с большим номером) выключаются.
+    Возвращает id машин парка по возрастанию.
+    """
+    host = host.rstrip("/")
+    names = {f"{prefix}{i:05d}" for i in range(1, count + 1)}
+    existing = set(Machine.objects.filter(name__startswith=prefix).values_list("name", flat=True))
+    Machine.objects.bulk_create(
+        [Machine(name=name, collection_mode=Machine.Mode.PULL) for name in sorted(names - existing)],
+        batch_size=batch_size,
+    )
+    fleet = []
+    for machine in Machine.objects.filter(name__startswith=prefix).only("id", "name"):
+        if machine.name in names:
+            machine.endpoint = f"{host}/m/{machine.id}/metrics"
+            fleet.append(machine)
+    Machine.objects.bulk_update(fleet, ["endpoint"], batch_size=batch_size)
+    # номера дополнены нулями, поэтому «лишние» — это имена после последнего (без длинного IN)
+    last = f"{prefix}{count:05d}"
+    Machine.objects.filter(name__startswith=prefix, name__gt=last).update(active=False)
+    Machine.objects.filter(name__startswith=prefix, name__lte=last).update(
+        active=True, collection_mode=Machine.Mode.PULL, next_poll_at=None, poll_failures=0,
+    )
+    return sorted(m.id for m in fleet)
+
+
+class _Profile:
+    """Поведение одной машины в синтетической истории."""
+    # длительность эпизода перегрузки, сек: CPU — короткий всплеск, MEM и DISK — дольше окон правил
+    EPISODES = {"cpu": 30 * 60, "mem": 90 * 60, "disk": 4 * 3600}
+    EPISODES_PER_DAY = 2
+
+    def __init__(self, rng, hot, booted):
+        self.cpu = rng.uniform(5, 55)
+        self.mem = rng.uniform(20, 70)
+        self.disk = rng.uniform(10, 80)
+        self.hot = hot
+        self.booted = booted
+        self.kind = None
+        self.until = None
+
+    def point(self, rng, at, interval):
+        if self.hot and (self.until is None or at >= self.until) \
+                and rng.random() < self.EPISODES_PER_DAY * interval / 86400:
+            self.kind = rng.choice(tuple(self.EPISODES))
+            self.until = at + timedelta(seconds=self.EPISODES[self.kind])
+        episode = self.kind if self.until is not None and at < self.until else None
+        cpu = rng.randint(86, 100) if episode == "cpu" else min(80, max(0, round(rng.gauss(self.cpu, 8))))
+        mem = rng.uniform(91, 99) if episode == "mem" else min(85.0, max(1.0, rng.gauss(self.mem, 5)))
+        disk = rng.uniform(96, 99) if episode == "disk" else self.disk
+        return cpu, round(mem, 1), round(disk, 1), int((at - self.booted).total_seconds())
+
+
+def generate_history(machine_ids, days, interval_sec=None, end=None, hot_rate=0.05, seed=0, batch_size=5000):
+    """
+    История метрик за days дней до end (по умолчанию — сейчас) с шагом interval_sec
+    (по умолчанию — MONITORING_POLL_INTERVAL_SEC). Точки вставляются в порядке
+    времени, как при реальном сборе, bulk_create пачками по batch_size;
+    в конце пересчитывается MachineState. Возвращает число строк.
+    """
+    interval = interval_sec or settings.MONITORING_POLL_INTERVAL_SEC
+    end = end or timezone.now()
+    steps = int(days * 86400 // interval)
+    start = end - timedelta(seconds=interval * steps)
+    rng = random.Random(seed)
+    profiles = {
+        mid: _Profile(rng, is_hot(mid, hot_rate), start - timedelta(seconds=rng.randint(0, 30 * 86400)))
+        for mid in machine_ids
+    }
+
+    written = 0
+    batch = []
+    for step in range(steps + 1):
+        at = start + timedelta(seconds=interval * step)
+        for mid, profile in profiles.items():
+            cpu, mem, disk, uptime = profile.point(rng, at, interval)
+            batch.append(Metric(machine_id=mid, cpu=cpu, mem_percent=mem, disk_percent=disk,
+                                uptime_sec=uptime, received_at=at))
+            if len(batch) >= batch_size:
+                Metric.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+    if batch:
+        Metric.objects.bulk_create(batch)
+        written += len(batch)
+    state.rebuild(machine_ids)
+    return written
+
+
+# ----------------------- Замеры -----------------------
+
+def timed(label, fn, *args, **kwargs):
+    """(результат fn, {seconds, queries, db_seconds})."""
+    started = time.perf_counter()
+    with instrumentation.track_db(f"benchmark_{label}") as db:
+        result = fn(*args, **kwargs)
+    return result, {
+        "seconds": round(time.perf_counter() - started, 3),
+        "queries": db["queries"],
+        "db_seconds": round(db["seconds"], 3),
+    }
+
+
+def run_sweep():
+    """
+    Один проход сбора по всем активным pull-машинам, синхронно в этом процессе:
+    шарды по очереди через fetch_shard (как один воркер), итог — finish_fetch_sweep.
+    """
+    started = time.time()
+    tick = polling.current_tick(timezone.now())
+    Machine.objects.filter(active=True, collection_mode=Machine.Mode.PULL).update(next_poll_at=None)
+    ids = polling.claim_due(tick)
+    size = settings.MONITORING_FETCH_SHARD_SIZE
+    shards = [fetch_shard(ids[i:i + size], tick.isoformat()) for i in range(0, len(ids), size)]
+    if not shards:
+        return {"total": 0}
+    summary = finish_fetch_sweep(shards, started)
+    summary["shard_seconds"] = [r["duration"] for r in summary.pop("per_shard")]
+    return summary
+
+
+def run_evaluation():
+    return evaluate_all()
+
+
+def _client():
+    # авторизация — сессионная (см. SimpleAuthMiddleware), логин через форму не нужен
+    client = Client(raise_request_exception=False)
+    session = client.session
+    session["auth_user"] = "benchmark"
+    session.save()
+    return client
+
+
+def _latency_summary(samples, wall):
+    ordered = sorted(samples)
+    return {
+        "requests": len(ordered),
+        "rps": round(len(ordered) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def load_api(paths, requests_per_path=200, concurrency=4):
+    """
+    Каждый путь — requests_per_path GET-запросов из concurrency потоков
+    (у каждого свой Client и своё соединение с БД). Результат — задержки и статусы по путям.
+    """
+    report = {}
+    for path in paths:
+        samples = []  # (секунды, статус); list.append потокобезопасен
+
+        def worker(count):
+            try:
+                client = _client()
+                for _ in range(count):
+                    started = time.perf_counter()
+                    status = client.get(path).status_code
+                    samples.append((time.perf_counter() - started, status))
+            finally:
+                connections.close_all()
+
+        per_worker = [requests_per_path // concurrency + (i < requests_per_path % concurrency)
+                      for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(worker, [n for n in per_worker if n]))
+        wall = time.perf_counter() - started
+        statuses = {}
+        for _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[path] = {**_latency_summary([s for s, _ in samples], wall), "statuses": statuses}
+    return report
+
+
+# ----------------------- Отчёт -----------------------
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """Коммит, СУБД и настройки — по ним сопоставляются отчёты разных прогонов."""
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "database": connection.vendor,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "settings": {name: getattr(settings, name) for name in REPORTED_SETTINGS},
+    }
+
+
+def table_counts():
+    return {
+        "machines_active": Machine.objects.filter(active=True).count(),
+        "metrics": Metric.objects.count(),
+        "incidents_active": Incident.objects.filter(is_active=True).count(),
+        "incidents_total": Incident.objects.count(),
+    }
+
+
+def run(machines=1000, days=7, interval_sec=None, hot_rate=0.05, sweeps=3, evaluations=2,
+        api_requests=200, concurrency=4, mock=None, mock_host=None, seed=0):
+    """
+    Полный прогон: парк, история, проходы сбора, проверка правил, агрегаты, API.
+    mock — параметры mockserver.MockServer (если mock_host не задан, поднимается встроенный).
+    """
+    report = {"started_at": timezone.now().isoformat(), "environment": environment(), "params": {
+        "machines": machines, "days": days, "interval_sec": interval_sec or settings.MONITORING_POLL_INTERVAL_SEC,
+        "hot_rate": hot_rate, "sweeps": sweeps, "evaluations": evaluations, "api_requests": api_requests,
+        "concurrency": concurrency, "mock": mock_host or dict(mock or {}), "seed": seed,
+    }, "steps": {}}
+    steps = report["steps"]
+    server = None if mock_host else MockProcess(hot_rate=hot_rate, seed=seed, **(mock or {})).start()
+    try:
+        ids, steps["seed_fleet"] = timed("seed_fleet", seed_fleet, machines, mock_host or server.url)
+        if days:
+            rows, steps["history"] = timed(
+                "history", generate_history, ids, days, interval_sec, hot_rate=hot_rate, seed=seed,
+            )
+            steps["history"]["rows"] = rows
+            steps["history"]["rows_per_sec"] = round(rows / steps["history"]["seconds"]) if rows else 0
+            result, steps["rollups"] = timed("rollups", update_rollups)
+            steps["rollups"]["result"] = result
+        steps["sweeps"] = []
+        for _ in range(sweeps):
+            result, timing = timed("sweep", run_sweep)
+            steps["sweeps"].append({**timing, "result": result})
+        steps["evaluations"] = []
+        for _ in range(evaluations):
+            result, timing = timed("evaluation", run_evaluation)
+            steps["evaluations"].append({**timing, "result": result})
+        if api_requests:
+            sample = ",".join(str(mid) for mid in ids[:5])
+            paths = [p.format(ids=sample) for p in API_PATHS]
+            steps["api"] = load_api(paths, api_requests, concurrency)
+    finally:
+        if server is not None:
+            server.stop()
+    report["counts"] = table_counts()
+    report["finished_at"] = timezone.now().isoformat()
+    return report
+
+
+def summary_lines(report):
+    """Короткая сводка отчёта для консоли."""
+    steps = report["steps"]
+    lines = [f"commit {report['environment']['commit']} on {report['environment']['database']}"]
+    if "history" in steps:
+        h = steps["history"]
+        lines.append(f"history: {h['rows']} rows in {h['seconds']}s ({h['rows_per_sec']} rows/s)")
+    for i, s in enumerate(steps.get("sweeps", []), 1):
+        r = s["result"]
+        lines.append(
+            f"sweep {i}: {s['seconds']}s, {s['queries']} queries, "
+            f"ok={r.get('ok', 0)} failed={r.get('failed', 0)} timed_out={r.get('timed_out', 0)}"
+        )
+    for i, s in enumerate(steps.get("evaluations", []), 1):
+        r = s["result"]
+        lines.append(
+            f"evaluation {i}: {s['seconds']}s, {s['queries']} queries, "
+            f"opened={r['opened']} touched={r['touched']} resolved={r['resolved']}"
+        )
+    for path, a in steps.get("api", {}).items():
+        lines.append(
+            f"{path}: p50={a['p50_ms']}ms p95={a['p95_ms']}ms p99={a['p99_ms']}ms "
+            f"{a['rps']} rps {a['statuses']}"
+        )
+    return lines
@@ -0,0 +1,15 @@
+# monitoring/checks.py
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    # блокировка проверки инцидентов, лента и снимок обзора парка рассчитаны на общий Redis
+    if settings.CACHE_URL:
+        return []
+    return [Warning(
+        "CACHE_URL is not set: the cache and the incident evaluation lock are local to each process",
+        hint="Set CACHE_URL to a Redis shared by the web processes and Celery workers.",
+        id="monitoring.W001",
+    )]
@@ -0,0 +1,168 @@
+# monitoring/collector.py
+"""
+Опрос endpoint-ов машин.
+
+Два режима (settings.MONITORING_FETCH_MODE):
+- "async" — параллельный опрос через httpx.AsyncClient: общий пул соединений
+  с keep-alive по хостам, глобальный лимит конкурентности и дедлайн на запрос;
+- "sync"  — прежний последовательный опрос через requests.Session (fallback).
+
+Модуль не работает с БД и не разбирает ответы: результаты (сырые байты тела)
+отдаются итератором по мере готовности, разбор и сохранение метрик остаются
+на вызывающем коде (задачи Celery).
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+import httpx
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MODE_ASYNC = "async"
+MODE_SYNC = "sync"
+
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+
+@dataclass
+class FetchResult:
+    machine_id: int
+    endpoint: str
+    status: str
+    body: bytes | None = None  # сырое тело ответа; разбор — monitoring.parser
+    error: str = ""
+    elapsed: float = 0.0
+
+
+@dataclass
+class SweepStats:
+    """Итоги одного прохода по машинам."""
+    total: int = 0
+    ok: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    duration: float = 0.0
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    def add(self, result: FetchResult):
+        self.total += 1
+        if result.status == OK:
+            self.ok += 1
+        elif result.status == TIMEOUT:
+            self.timed_out += 1
+        else:
+            self.failed += 1
+
+    def finish(self):
+        self.duration = time.monotonic() - self.started
+        return self
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "ok": self.ok,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "duration": round(self.duration, 3),
+        }
+
+
+def _result(machine_id, endpoint, status_code, body, started):
+    elapsed = time.monotonic() - started
+    if status_code != 200:
+        return FetchResult(machine_id, endpoint, FAILED, error=f"HTTP {status_code}", elapsed=elapsed)
+    return FetchResult(machine_id, endpoint, OK, body=body, elapsed=elapsed)
+
+
+# ----------------------- sync -----------------------
+
+def _iter_sync(machines, timeout):
+    with requests.Session() as session:
+        for mid, endpoint in machines:
+            started = time.monotonic()
+            try:
+                resp = session.get(endpoint, timeout=timeout)
+            except requests.Timeout:
+                yield FetchResult(mid, endpoint, TIMEOUT, error="timeout", elapsed=time.monotonic() - started)
+                continue
+            except requests.RequestException as e:
+                yield FetchResult(mid, endpoint, FAILED, error=str(e), elapsed=time.monotonic() - started)
+                continue
+            yield _result(mid, endpoint, resp.status_code, resp.content, started)
+
+
+# ----------------------- async -----------------------
+
+async def _fetch_one(client, sem, mid, endpoint, timeout):
+    async with sem:
+        started = time.monotonic()
+        try:
+            # wait_for — жёсткий дедлайн на весь запрос, а не только на отдельные фазы
+            resp = await asyncio.wait_for(client.get(endpoint), timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            return FetchResult(mid, endpoint, TIMEOUT, error="timeout", elapsed=time.monotonic() - started)
+        except httpx.HTTPError as e:
+            return FetchResult(mid, endpoint, FAILED, error=str(e) or type(e).__name__,
+                               elapsed=time.monotonic() - started)
+        return _result(mid, endpoint, resp.status_code, resp.content, started)
+
+
+async def _run_async(machines, concurrency, timeout, emit):
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        jobs = [_fetch_one(client, sem, mid, endpoint, timeout) for mid, endpoint in machines]
+        for fut in asyncio.as_completed(jobs):
+            emit(await fut)
+
+
+_DONE = object()
+
+
+def _iter_async(machines, concurrency, timeout):
+    # event loop живёт в отдельном потоке, чтобы ORM-код вызывающей стороны
+    # оставался синхронным и получал результаты по мере их готовности
+    results = queue.Queue()
+    errors = []
+
+    def runner():
+        try:
+            asyncio.run(_run_async(machines, concurrency, timeout, results.put))
+        except Exception as e:  # пробрасываем в основной поток
+            errors.append(e)
+        finally:
+            results.put(_DONE)
+
+    thread = threading.Thread(target=runner, name="metrics-collector", daemon=True)
+    thread.start()
+    while (item := results.get()) is not _DONE:
+        yield item
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def collect(machines, mode=None, concurrency=None, timeout=None):
+    """
+    Опрашивает машины и отдаёт FetchResult по мере готовности.
+    machines — последовательность пар (machine_id, endpoint).
+    """
+    machines = list(machines)
+    mode = mode or settings.MONITORING_FETCH_MODE
+    timeout = timeout or settings.MONITORING_FETCH_TIMEOUT
+    if not machines:
+        return iter(())
+    if mode == MODE_SYNC:
+        return _iter_sync(machines, timeout)
+    if mode != MODE_ASYNC:
+        raise ValueError(f"unknown fetch mode: {mode!r}")
+    concurrency = concurrency or settings.MONITORING_FETCH_CONCURRENCY
+    return _iter_async(machines, concurrency, timeout)
@@ -0,0 +1,265 @@
+# monitoring/evaluation.py
+"""
+Пакетная проверка правил инцидентов (сами правила — см. monitoring.rules).
+
+Вместо нескольких запросов на каждую машину:
+- последнюю точку каждой машины берём из MachineState одним запросом; правилам
+  без окна (CPU) её достаточно, как и всем правилам, если она ни одно окно не нарушает;
+- остальным машинам метрики за последние ruleset.span секунд берём
+  диапазонным запросом по индексу (machine, received_at) — по одному на пачку машин;
+- одним запросом берём все активные инциденты;
+- переходы open / touch / resolve считаем в памяти и применяем пачкой
+  (bulk_create + два UPDATE ... WHERE id IN (...)).
+Количество запросов почти не зависит от размера парка.
+
+Переходы безопасны при параллельных проверках (пакетная и потоковая, см.
+monitoring.streaming): один активный инцидент на (машину, тип) гарантирует
+уникальный ключ Incident.active_key, открытие — INSERT с пропуском конфликтов,
+touch и resolve — UPDATE только ещё активных; в отчёт, логи и метрики попадают
+только переходы, действительно записанные этим вызовом. Саму пакетную проверку
+задача evaluate_incidents_all запускает под блокировкой в Redis (evaluation_lock).
+
+Окна правил считаются по времени точек (см. RuleSet.evaluate). Машина, у которой
+последняя точка старше допустимого разрыва, не проверяется вовсе: по устаревшим
+данным инциденты не открываются и не закрываются, пока опрос не восстановится.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import feed, instrumentation, state
+from .models import Incident, Machine, Metric
+from .rules import AT, get_ruleset, max_gap
+
+logger = logging.getLogger(__name__)
+
+# Сколько машин в одном диапазонном запросе метрик
+WINDOW_BATCH_SIZE = 500
+
+LOCK_KEY = "incidents:evaluate:lock"
+# снять блокировку, только если она всё ещё наша (а не взята другим воркером после TTL)
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_redis = {}
+
+
+@dataclass
+class Transitions:
+    opens: list = field(default_factory=list)     # (machine_id, type, details)
+    touches: list = field(default_factory=list)   # Incident
+    resolves: list = field(default_factory=list)  # Incident
+
+    def __bool__(self):
+        return bool(self.opens or self.touches or self.resolves)
+
+
+def load_windows(since, machine_ids=None, batch_size=WINDOW_BATCH_SIZE):
+    """
+    Метрики активных машин (или только machine_ids) с received_at >= since.
+    Возвращает {machine_id: [(cpu, mem, disk, received_at), ...]} — свежие первыми.
+    """
+    if machine_ids is None:
+        machine_ids = list(Machine.objects.filter(active=True).order_by("id").values_list("id", flat=True))
+    windows = defaultdict(list)
+    for i in range(0, len(machine_ids), batch_size):
+        rows = (
+            Metric.objects.filter(machine_id__in=machine_ids[i:i + batch_size], received_at__gte=since)
+            .order_by("machine_id", "-received_at")
+            .values_list("machine_id", "cpu", "mem_percent", "disk_percent", "received_at")
+        )
+        for mid, cpu, mem, disk, at in rows:
+            windows[mid].append((cpu, mem, disk, at))
+    return windows
+
+
+def fresh_windows(windows, now):
+    """Только машины, чья последняя точка не старше допустимого разрыва."""
+    stale_before = now - timedelta(seconds=max_gap())
+    return {mid: points for mid, points in windows.items() if points and points[0][AT] >= stale_before}
+
+
+def load_active_incidents(machine_ids=None):
+    """Все активные инциденты активных машин (или только machine_ids): {(machine_id, type): Incident}."""
+    qs = Incident.objects.filter(is_active=True, machine__active=True).only("id", "machine_id", "type")
+    if machine_ids is not None:
+        qs = qs.filter(machine_id__in=machine_ids)
+    return {(i.machine_id, i.type): i for i in qs}
+
+
+def diff_transitions(found_by_machine, active):
+    """
+    Сравнивает нарушенные правила {machine_id: {type: details}} с активными инцидентами.
+    Машины без записи в found_by_machine не рассматриваются.
+    """
+    by_machine = defaultdict(dict)
+    for (mid, itype), incident in active.items():
+        by_machine[mid][itype] = incident
+
+    result = Transitions()
+    for mid, found in found_by_machine.items():
+        incidents = by_machine.get(mid, {})
+        for itype, details in found.items():
+            if itype in incidents:
+                result.touches.append(incidents[itype])
+            else:
+                result.opens.append((mid, itype, details))
+        # активные инциденты без нарушения (в том числе по выключенным правилам) закрываем
+        result.resolves.extend(i for itype, i in incidents.items() if itype not in found)
+    return result
+
+
+def compute_transitions(ruleset, windows, active):
+    """Машины без точек в windows не рассматриваются — их инциденты остаются как есть."""
+    found = {mid: ruleset.evaluate(mid, points) for mid, points in windows.items()}
+    return diff_transitions(found, active)
+
+
+def _open(opens):
+    """
+    Создаёт инциденты; возвращает действительно открытые (machine_id, type, details).
+    Обычно — одним INSERT. Если параллельная проверка уже открыла какой-то из них
+    (incident_one_active), пачка откатывается до точки сохранения и инциденты
+    создаются по одному, конфликтующие пропускаются.
+    """
+    def build(mid, itype, details):
+        return Incident(machine_id=mid, type=itype, is_active=True, active_key=True, details=details or {})
+
+    try:
+        with transaction.atomic():
+            Incident.objects.bulk_create(build(*item) for item in opens)
+        return list(opens)
+    except IntegrityError:
+        pass
+    opened = []
+    for item in opens:
+        try:
+            with transaction.atomic():
+                Incident.objects.bulk_create([build(*item)])
+        except IntegrityError:
+            continue
+        opened.append(item)
+    return opened
+
+
+def _lock_active(incidents):
+    """id ещё активных из incidents; строки блокируются до конца транзакции."""
+    return set(
+        Incident.objects.select_for_update()
+        .filter(id__in=[i.id for i in incidents], is_active=True)
+        .values_list("id", flat=True)
+    )
+
+
+def apply_transitions(tr: Transitions, now=None):
+    """
+    now — время данных (last_seen_at, resolved_at); у потоковой проверки это время
+    метрик, оно может отставать от записи. changed_at — курсор ленты изменений
+    (monitoring.feed) — всегда момент записи: иначе курсор, уже ушедший вперёд,
+    пропустил бы изменение.
+    Возвращает записанные переходы: без инцидентов, которые параллельная проверка
+    уже открыла или закрыла (в том числе обновления закрытых за это время).
+    """
+    now = now or timezone.now()
+    applied = Transitions()
+    with transaction.atomic():
+        changed_at = timezone.now()
+        if tr.opens:
+            applied.opens = _open(tr.opens)
+        if tr.touches:
+            still_active = _lock_active(tr.touches)
+            applied.touches = [i for i in tr.touches if i.id in still_active]
+            Incident.objects.filter(id__in=still_active).update(last_seen_at=now, changed_at=changed_at)
+        if tr.resolves:
+            still_active = _lock_active(tr.resolves)
+            applied.resolves = [i for i in tr.resolves if i.id in still_active]
+            Incident.objects.filter(id__in=still_active).update(
+                is_active=False, active_key=None, resolved_at=now, changed_at=changed_at
+            )
+        feed.bump_version()
+    instrumentation.observe_transitions(applied)
+    for mid, itype, _ in applied.opens:
+        logger.info("Incident OPEN: %s on machine %s", itype, mid)
+    for i in applied.resolves:
+        logger.info("Incident RESOLVED: %s on machine %s", i.type, i.machine_id)
+    return applied
+
+
+def load_points(ruleset, since):
+    """
+    Точки для проверки правил: последняя точка каждой машины — из MachineState
+    (monitoring.state, один запрос), окно из Metric — только машинам, которым
+    оно нужно (RuleSet.needs_history) или у которых состояния ещё нет.
+    """
+    points = {}
+    need_window = []
+    for mid, point in state.load_latest().items():
+        if point is None or ruleset.needs_history(mid, point):
+            need_window.append(mid)
+        else:
+            points[mid] = [point]
+    if need_window:
+        points.update(load_windows(since, need_window))
+    return points
+
+
+def _lock_client():
+    url = settings.CACHE_URL
+    if not url:
+        return None
+    if url not in _redis:
+        _redis[url] = redis.Redis.from_url(url)
+    return _redis[url]
+
+
+@contextmanager
+def evaluation_lock():
+    """
+    Блокировка в общем Redis (CACHE_URL): SET NX PX с токеном; снимается
+    скриптом «удалить, если токен мой». TTL снимает блокировку упавшего воркера.
+    Без CACHE_URL — блокировка в кэше процесса: проверки в разных процессах
+    не сериализуются (предупреждение в логе и в manage.py check).
+    """
+    token = uuid.uuid4().hex
+    ttl = settings.MONITORING_EVALUATION_LOCK_TTL
+    client = _lock_client()
+    if client is None:
+        logger.warning("evaluation lock: CACHE_URL is not set, the lock only covers this process")
+        acquired = cache.add(LOCK_KEY, token, ttl)
+    else:
+        acquired = bool(client.set(LOCK_KEY, token, nx=True, px=int(ttl * 1000)))
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            if client is None:
+                cache.delete(LOCK_KEY)
+            else:
+                client.eval(_RELEASE_SCRIPT, 1, LOCK_KEY, token)
+
+
+def evaluate_all():
+    """Проверка всех правил по всем активным машинам за фиксированное число запросов."""
+    started = time.perf_counter()
+    now = timezone.now()
+    ruleset = get_ruleset()
+    windows = fresh_windows(load_points(ruleset, now - timedelta(seconds=ruleset.span)), now)
+    tr = compute_transitions(ruleset, windows, load_active_incidents())
+    if tr:
+        tr = apply_transitions(tr, now)
+    instrumentation.EVALUATION_DURATION.labels("batch").observe(time.perf_counter() - started)
+    return {"opened": len(tr.opens), "touched": len(tr.touches), "resolved": len(tr.resolves)}
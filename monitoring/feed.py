@@ -0,0 +1,142 @@
+# monitoring/feed.py
+"""
+Лента инцидентов: версия и кэш JSON-представления, выборка изменений по курсору.
+
+Любое изменение инцидентов (open / touch / resolve, правка в админке)
+вызывает bump_version(). Сериализованный ответ /api/incidents/json хранится
+в кэше под ключом текущей версии, поэтому опрос без изменений не ходит в БД,
+а одинаковое тело даёт одинаковый ETag и ответ 304.
+
+Кэш должен быть общим для веб-процессов и воркеров Celery (CACHE_URL → Redis);
+TTL дополнительно ограничивает устаревание (окно «последние 24 часа» сдвигается
+и без изменений инцидентов).
+
+Кроме того, bump_version() публикует событие в Redis pub/sub
+(MONITORING_EVENTS_REDIS_URL) — по нему веб-процессы рассылают изменения
+подключённым браузерам (см. monitoring.live).
+"""
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Incident
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "incidents:version"
+PAYLOAD_KEY = "incidents:payload:{version}"
+
+# Курсор не сдвигается ближе этого к текущему времени, чтобы не пропустить
+# изменения из ещё не закоммиченных транзакций; клиент сливает ответы по id,
+# поэтому повторы безопасны.
+CURSOR_LAG = timedelta(seconds=5)
+
+EVENTS_CHANNEL = "incidents:events"
+
+_redis = {}
+
+
+def _publish(version):
+    url = settings.MONITORING_EVENTS_REDIS_URL
+    if not url:
+        return
+    try:
+        if url not in _redis:
+            _redis[url] = redis.Redis.from_url(url)
+        _redis[url].publish(EVENTS_CHANNEL, str(version))
+    except redis.RedisError as e:
+        logger.warning("feed: cannot publish incident event: %s", e)
+
+
+def _changed():
+    version = time.time()
+    cache.set(VERSION_KEY, version, None)
+    _publish(version)
+
+
+def bump_version():
+    """Помечает ленту изменённой и оповещает веб-процессы (после коммита текущей транзакции)."""
+    transaction.on_commit(_changed)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def cached_payload(build):
+    """
+    Возвращает {"body": bytes, "etag": str, "last_modified": int} для текущей версии.
+    build() вызывается только если в кэше нет тела для этой версии.
+    """
+    version = get_version()
+    key = PAYLOAD_KEY.format(version=version)
+    entry = cache.get(key)
+    if entry is None:
+        body = build()
+        entry = {
+            "body": body,
+            "etag": '"%s"' % hashlib.md5(body).hexdigest(),
+            "last_modified": int(version),
+        }
+        cache.set(key, entry, settings.MONITORING_INCIDENTS_CACHE_TTL)
+    return entry
+
+
+def incident_dict(i):
+    return {
+        "id": i.id,
+        "machine": i.machine.name,
+        "type": i.type,
+        "is_active": i.is_active,
+        "started_at": i.started_at.isoformat(),
+        "last_seen_at": i.last_seen_at.isoformat(),
+        "resolved_at": i.resolved_at.isoformat() if i.resolved_at else None,
+    }
+
+
+def parse_cursor(raw):
+    try:
+        cursor = parse_datetime(raw)
+    except ValueError:
+        return None
+    if cursor is None or timezone.is_naive(cursor):
+        return None
+    return cursor
+
+
+def changes_since(cursor=None):
+    """
+    Инциденты за последние 24 часа, изменённые после cursor (None — все).
+    Возвращает (список словарей, новый курсор).
+    """
+    now = timezone.now()
+    qs = Incident.objects.select_related("machine").filter(started_at__gte=now - timedelta(days=1))
+    if cursor is not None:
+        qs = qs.filter(changed_at__gt=cursor)
+
+    items = list(qs.order_by("changed_at"))
+    new_cursor = now - CURSOR_LAG
+    if items:
+        new_cursor = min(items[-1].changed_at, new_cursor)
+    if cursor is not None:
+        new_cursor = max(new_cursor, cursor)
+    return [incident_dict(i) for i in items], new_cursor
+
+
+@receiver([post_save, post_delete], sender=Incident)
+def _incident_changed(**kwargs):
+    bump_version()
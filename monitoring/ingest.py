@@ -0,0 +1,180 @@
+# monitoring/ingest.py
+"""
+Запись метрик в БД пачками.
+
+Вместо Metric.objects.create() на каждую машину распарсенные сэмплы
+копятся в памяти и сбрасываются через bulk_create в одной транзакции:
+- по размеру — как только набралось batch_size объектов;
+- по времени — если с прошлого сброса прошло flush_interval секунд
+  (проверяется при добавлении очередного сэмпла).
+В той же транзакции обновляется последнее состояние машин (monitoring.state).
+После записи пачка передаётся в on_flush (например, потоковому детектору инцидентов).
+Если транзакция не прошла, исключение пробрасывается, а строки остаются в буфере.
+
+Сюда же сходятся оба способа получения метрик: опрос машин (pull, tasks.fetch_shard)
+и приём пачек от агентов (push, ingest_push) — строки Metric одинаковые.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import instrumentation, state
+from .models import Machine, Metric
+from .parser import ParseError, decode, parse_sample, parse_timestamp
+from .streaming import get_detector
+
+logger = logging.getLogger(__name__)
+
+
+def metric_from_sample(machine_id, sample):
+    return Metric(
+        machine_id=machine_id,
+        cpu=sample.cpu,
+        mem_percent=sample.mem,
+        disk_percent=sample.disk,
+        uptime_sec=sample.uptime_sec,
+    )
+
+
+def record_parse_errors(errors):
+    """errors — {machine_id: сколько ответов не разобрано}; копится в Machine.parse_errors."""
+    by_count = defaultdict(list)
+    for mid, count in errors.items():
+        by_count[count].append(mid)
+    for count, ids in by_count.items():
+        Machine.objects.filter(id__in=ids).update(parse_errors=F("parse_errors") + count)
+
+
+def detection_hook(machine_ids):
+    """on_flush для MetricBuffer: потоковый детектор инцидентов (или None, если выключен)."""
+    if not settings.MONITORING_STREAMING_DETECTION or not machine_ids:
+        return None
+    detector = get_detector()
+    detector.sync(list(machine_ids), timezone.now())
+    return detector.process
+
+
+class MetricBuffer:
+    def __init__(self, batch_size=None, flush_interval=None, on_flush=None):
+        self.on_flush = on_flush
+        self.batch_size = batch_size or settings.MONITORING_INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.MONITORING_INGEST_FLUSH_INTERVAL
+        self.written = 0
+        self.flushes = []  # сколько строк записано каждым сбросом
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, metric: Metric):
+        self._pending.append(metric)
+        if (len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return 0
+        batch = self._pending
+        try:
+            with transaction.atomic():
+                Metric.objects.bulk_create(batch, batch_size=self.batch_size)
+                state.record_samples(batch)
+        except Exception:
+            # id, выданные откаченной вставкой, не должны попасть в повторный flush
+            for metric in batch:
+                metric.pk = None
+            raise
+        self._pending = []
+        self.written += len(batch)
+        self.flushes.append(len(batch))
+        logger.info("ingest: flushed %s metrics", len(batch))
+        if self.on_flush is not None:
+            self.on_flush(batch)
+        return len(batch)
+
+
+def sample_time(value, now):
+    """
+    received_at сэмпла из поля "at"; None — время приёма.
+    Допускается отставание до MONITORING_INGEST_MAX_AGE_SEC (буфер ретранслятора)
+    и опережение до MONITORING_INGEST_MAX_SKEW_SEC (расхождение часов).
+    """
+    if value is None:
+        return now
+    at = parse_timestamp(value)
+    if at > now + timedelta(seconds=settings.MONITORING_INGEST_MAX_SKEW_SEC):
+        raise ParseError(f"at: more than {settings.MONITORING_INGEST_MAX_SKEW_SEC}s in the future")
+    if at < now - timedelta(seconds=settings.MONITORING_INGEST_MAX_AGE_SEC):
+        raise ParseError(f"at: older than {settings.MONITORING_INGEST_MAX_AGE_SEC}s")
+    return at
+
+
+def ingest_push(body):
+    """
+    Приём пачки сэмплов от агентов: JSON lines, по объекту на строку,
+    {"machine": <id>, "cpu": ..., "mem": ..., "disk": ..., "uptime": ..., "at": ...} —
+    те же поля, что отдаёт /metrics машины, и необязательное время сэмпла "at"
+    (unix-время или ISO 8601, см. sample_time): ретранслятор, копивший сэмплы,
+    передаёт их настоящее время, иначе окна правил считались бы по времени приёма.
+    Принимаются только активные машины в режиме push. Ошибочные строки
+    пропускаются и возвращаются в отчёте (ошибки схемы копятся и в
+    Machine.parse_errors); ValueError — пачка целиком некорректна.
+    """
+    lines = body.splitlines()
+    if len(lines) > settings.MONITORING_INGEST_MAX_SAMPLES:
+        raise ValueError(f"at most {settings.MONITORING_INGEST_MAX_SAMPLES} samples per request")
+
+    now = timezone.now()
+    rejected = []
+    parsed = []
+    bad = Counter()
+    for n, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        machine_id = None
+        try:
+            data = decode(line)
+            machine_id = data.get("machine") if isinstance(data, dict) else None
+            if not isinstance(machine_id, int) or isinstance(machine_id, bool):
+                machine_id = None
+                raise ParseError("machine: expected machine id")
+            metric = metric_from_sample(machine_id, parse_sample(data))
+            metric.received_at = sample_time(data.get("at"), now)
+            parsed.append(metric)
+        except ParseError as e:
+            rejected.append({"line": n, "error": str(e)})
+            if machine_id is not None:
+                bad[machine_id] += 1
+
+    allowed = set(
+        Machine.objects.filter(
+            id__in={m.machine_id for m in parsed} | set(bad), active=True, collection_mode=Machine.Mode.PUSH,
+        ).values_list("id", flat=True)
+    )
+    metrics = [m for m in parsed if m.machine_id in allowed]
+    unknown = len(parsed) - len(metrics)
+    record_parse_errors({mid: n for mid, n in bad.items() if mid in allowed})
+
+    with MetricBuffer(on_flush=detection_hook({m.machine_id for m in metrics})) as buffer:
+        for metric in metrics:
+            buffer.add(metric)
+
+    instrumentation.METRICS_WRITTEN.labels("push").inc(buffer.written)
+    logger.info("ingest_push: accepted=%s rejected=%s unknown=%s", len(metrics), len(rejected), unknown)
+    return {"accepted": len(metrics), "rejected": rejected, "unknown_machines": unknown}
@@ -0,0 +1,161 @@
+# monitoring/instrumentation.py
+"""
+Метрики самого мониторинга в формате Prometheus (prometheus_client).
+
+- fetch: задержка опроса машины по статусу, ошибки опроса по классу;
+- sweep: длительность шарда и прохода целиком;
+- evaluation: длительность проверки правил (пакетной и потоковой),
+  переходы инцидентов;
+- db: число запросов и суммарное время в БД за запуск задачи.
+
+Веб (gunicorn) и воркеры Celery работают в нескольких процессах, поэтому
+используется multiprocess-режим: переменная окружения PROMETHEUS_MULTIPROC_DIR
+должна быть задана до старта процессов и указывать на пустой каталог
+(свой в каждом контейнере). Отдаёт метрики:
+- веб — /metrics (см. views.prometheus_metrics);
+- воркер — отдельный HTTP-порт MONITORING_WORKER_METRICS_PORT
+  (поднимается в главном процессе воркера по сигналу worker_init);
+завершившиеся процессы помечаются через gunicorn.conf.py (child_exit)
+и сигнал worker_process_shutdown.
+Без PROMETHEUS_MULTIPROC_DIR метрики считаются в памяти процесса (dev-режим).
+
+Машины в метках не фигурируют: тысячи endpoint-ов дали бы тысячи рядов.
+"""
+import functools
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # каталог должен существовать до создания первой метрики
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from celery.signals import worker_init, worker_process_shutdown  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
+
+FETCH_LATENCY = Histogram(
+    "monitoring_fetch_latency_seconds", "Время опроса одной машины",
+    ["status"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+FETCH_ERRORS = Counter(
+    "monitoring_fetch_errors_total", "Неудачные опросы по классу ошибки (timeout, http, connect, invalid)",
+    ["reason"],
+)
+SWEEP_DURATION = Histogram(
+    "monitoring_sweep_duration_seconds", "Длительность шарда (stage=shard) и прохода целиком (stage=sweep)",
+    ["stage"], buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900),
+)
+EVALUATION_DURATION = Histogram(
+    "monitoring_evaluation_duration_seconds", "Длительность проверки правил инцидентов",
+    ["mode"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+INCIDENT_TRANSITIONS = Counter(
+    "monitoring_incident_transitions_total", "Переходы инцидентов (open, touch, resolve)", ["kind"],
+)
+METRICS_WRITTEN = Counter(
+    "monitoring_metrics_written_total", "Записано строк Metric (source=pull|push)", ["source"],
+)
+DB_QUERIES = Histogram(
+    "monitoring_db_queries", "Число SQL-запросов за запуск задачи",
+    ["task"], buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+DB_TIME = Histogram(
+    "monitoring_db_time_seconds", "Суммарное время SQL-запросов за запуск задачи",
+    ["task"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+def observe_fetch(result, reason=None):
+    """result — collector.FetchResult; reason задаётся, если ответ отвергнут разбором."""
+    FETCH_LATENCY.labels(result.status).observe(result.elapsed)
+    if reason is None and result.status != "ok":
+        if result.status == "timeout":
+            reason = "timeout"
+        elif result.error.startswith("HTTP "):
+            reason = "http"
+        else:
+            reason = "connect"
+    if reason is not None:
+        FETCH_ERRORS.labels(reason).inc()
+
+
+def observe_transitions(tr):
+    for kind, items in (("open", tr.opens), ("touch", tr.touches), ("resolve", tr.resolves)):
+        if items:
+            INCIDENT_TRANSITIONS.labels(kind).inc(len(items))
+
+
+@contextmanager
+def track_db(task):
+    """Считает запросы и время в БД внутри блока (текущее соединение потока)."""
+    totals = {"queries": 0, "seconds": 0.0}
+
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            totals["queries"] += 1
+            totals["seconds"] += time.perf_counter() - started
+
+    with connection.execute_wrapper(wrapper):
+        yield totals
+    DB_QUERIES.labels(task).observe(totals["queries"])
+    DB_TIME.labels(task).observe(totals["seconds"])
+
+
+def tracked(task):
+    """Декоратор задачи: track_db на всё время выполнения."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with track_db(task):
+                return fn(*args, **kwargs)
+        return inner
+    return decorator
+
+
+def _registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render():
+    """(тело, content type) для ответа на scrape."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def clear_multiproc_dir():
+    """Файлы прошлого запуска иначе попадут в сумму; вызывать до старта дочерних процессов."""
+    if MULTIPROC_DIR:
+        shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+
+@worker_init.connect
+def _start_worker_exporter(**kwargs):
+    # главный процесс воркера: дочерние процессы пула ещё не запущены
+    clear_multiproc_dir()
+    port = settings.MONITORING_WORKER_METRICS_PORT
+    if port:
+        start_http_server(port, registry=_registry())
+        logger.info("instrumentation: worker metrics on :%s", port)
+
+
+@worker_process_shutdown.connect
+def _worker_process_exited(pid=None, **kwargs):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
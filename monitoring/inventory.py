@@ -0,0 +1,219 @@
+# monitoring/inventory.py
+"""
+Синхронизация парка машин с инвентарём (CSV или JSON lines).
+
+Машина инвентаря — name (уникальный ключ), endpoint, active, mode:
+- CSV — с заголовком, колонки name,endpoint[,active][,mode];
+- JSON lines — объект на строку: {"name": ..., "endpoint": ..., "active": true, "mode": "pull"}.
+endpoint обязателен для pull-машин; active по умолчанию true, mode — pull.
+
+Инвентарь сравнивается с таблицей Machine в памяти (один SELECT нескольких
+колонок), разница применяется пачками в одной транзакции:
+- новые машины — bulk_create с обработкой конфликта по name (параллельный
+  импорт той же машины не падает, а обновляет её);
+- изменившиеся endpoint / active / mode — bulk_update; расписание опроса
+  таких машин сбрасывается, и они опрашиваются в ближайший проход;
+- машины, которых нет в инвентаре, выключаются (UPDATE по пачкам id),
+  их метрики и инциденты остаются.
+Число запросов зависит от числа изменений, а не от размера парка.
+
+Имена сравниваются без учёта регистра (name_key), как их сравнивает
+уникальный индекс в MySQL: "Node-01" и "node-01" — одна машина, имя в
+таблице приводится к написанию из инвентаря.
+"""
+import csv
+import io
+import logging
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from django.db import connection, transaction
+
+from .models import Machine
+from .parser import decode
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+SYNC_FIELDS = ["endpoint", "active", "collection_mode"]
+BATCH_SIZE = 1000
+
+_TRUE = {"1", "true", "yes", "y", "on"}
+_FALSE = {"0", "false", "no", "n", "off"}
+_NAME_MAX = Machine._meta.get_field("name").max_length
+
+
+def name_key(name):
+    """Ключ сравнения имён машин — регистр не различается (collation MySQL *_ci)."""
+    return name.casefold()
+
+
+@dataclass(frozen=True)
+class Host:
+    name: str
+    endpoint: str
+    active: bool = True
+    mode: str = Machine.Mode.PULL
+
+
+def _flag(value):
+    if value is None or value == "":
+        return True
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"active: expected true/false, got {str(value)[:16]!r}")
+
+
+def host_from_dict(data):
+    """Host из строки инвентаря; ValueError с коротким описанием, если строка некорректна."""
+    if not isinstance(data, dict):
+        raise ValueError(f"expected JSON object, got {type(data).__name__}")
+    name = str(data.get("name") or "").strip()
+    if not name:
+        raise ValueError("name: missing")
+    if len(name) > _NAME_MAX:
+        raise ValueError(f"name: longer than {_NAME_MAX} characters")
+    mode = str(data.get("mode") or data.get("collection_mode") or Machine.Mode.PULL).strip().lower()
+    if mode not in Machine.Mode.values:
+        raise ValueError(f"mode: expected one of {', '.join(Machine.Mode.values)}")
+    endpoint = str(data.get("endpoint") or "").strip()
+    if endpoint:
+        # URLValidator не пропускает внутренние имена без домена (http://node17:9100/...)
+        parts = urlsplit(endpoint)
+        if parts.scheme not in ("http", "https") or not parts.hostname or " " in endpoint:
+            raise ValueError(f"endpoint: not a valid http(s) URL: {endpoint[:64]!r}")
+    elif mode == Machine.Mode.PULL:
+        raise ValueError("endpoint: required for pull machines")
+    return Host(name=name, endpoint=endpoint, active=_flag(data.get("active")), mode=mode)
+
+
+def _rows(raw, fmt):
+    """(номер строки, dict) — без проверки полей; ValueError — файл нельзя прочитать вовсе."""
+    if fmt == "csv":
+        text = raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "name" not in [f.strip().lower() for f in reader.fieldnames]:
+            raise ValueError("csv: header with a 'name' column is required")
+        reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for n, line in enumerate(raw.splitlines(), start=1):
+            if line.strip():
+                try:
+                    yield n, decode(line)
+                except ValueError as e:
+                    yield n, e
+    else:
+        raise ValueError(f"unknown inventory format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def parse_inventory(raw, fmt):
+    """
+    ([Host], [{"line", "error"}]) из содержимого файла инвентаря.
+    Повтор имени — ошибка строки (первое вхождение остаётся).
+    """
+    hosts = {}
+    rejected = []
+    for n, data in _rows(raw, fmt):
+        try:
+            if isinstance(data, Exception):
+                raise data
+            host = host_from_dict(data)
+            if name_key(host.name) in hosts:
+                raise ValueError(f"name: duplicate {host.name!r}")
+        except ValueError as e:
+            rejected.append({"line": n, "error": str(e)})
+            continue
+        hosts[name_key(host.name)] = host
+    return list(hosts.values()), rejected
+
+
+def sync_inventory(hosts, deactivate_missing=True, dry_run=False, batch_size=BATCH_SIZE, create_only=False):
+    """
+    Приводит таблицу Machine к инвентарю hosts; возвращает счётчики изменений.
+    create_only — только добавить отсутствующие машины: существующие (выключенные
+    оператором, переведённые в push, с их расписанием опроса) не трогаются вовсе.
+    """
+    wanted = {name_key(h.name): h for h in hosts}
+    existing = {
+        name_key(name): (mid, name, endpoint, active, mode)
+        for mid, name, endpoint, active, mode in Machine.objects.values_list(
+            "id", "name", "endpoint", "active", "collection_mode"
+        )
+    }
+
+    new, changed, unchanged = [], [], 0
+    for key, host in wanted.items():
+        row = existing.get(key)
+        if row is None:
+            new.append(Machine(name=host.name, endpoint=host.endpoint, active=host.active, collection_mode=host.mode))
+        elif row[1:] != (host.name, host.endpoint, host.active, host.mode) and not create_only:
+            changed.append(Machine(
+                id=row[0], name=host.name, endpoint=host.endpoint, active=host.active, collection_mode=host.mode,
+                next_poll_at=None, poll_failures=0,
+            ))
+        else:
+            unchanged += 1
+    missing = []
+    if deactivate_missing and not create_only:
+        missing = [mid for key, (mid, _, _, active, _) in existing.items() if active and key not in wanted]
+
+    report = {
+        "total": len(wanted),
+        "created": len(new),
+        "updated": len(changed),
+        "unchanged": unchanged,
+        "deactivated": len(missing),
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        return report
+
+    with transaction.atomic():
+        if create_only:
+            # машина, добавленная параллельно, остаётся как есть
+            Machine.objects.bulk_create(new, batch_size=batch_size, ignore_conflicts=True)
+        else:
+            Machine.objects.bulk_create(
+                new,
+                batch_size=batch_size,
+                update_conflicts=True,
+                # MySQL не указывает цель конфликта: ON DUPLICATE KEY срабатывает по любому уникальному ключу
+                unique_fields=["name"] if connection.features.supports_update_conflicts_with_target else None,
+                update_fields=SYNC_FIELDS,
+            )
+        Machine.objects.bulk_update(
+            changed, ["name", *SYNC_FIELDS, "next_poll_at", "poll_failures"], batch_size=batch_size
+        )
+        for i in range(0, len(missing), batch_size):
+            Machine.objects.filter(id__in=missing[i:i + batch_size]).update(active=False)
+    logger.info(
+        "inventory: %s hosts, created=%s updated=%s unchanged=%s deactivated=%s",
+        report["total"], report["created"], report["updated"], report["unchanged"], report["deactivated"],
+    )
+    return report
+
+
+def import_inventory(raw, fmt, deactivate_missing=True, dry_run=False):
+    """
+    Разбор и синхронизация. Если хоть одна строка некорректна, ничего не применяется:
+    иначе машина из этой строки считалась бы отсутствующей и была бы выключена.
+    """
+    hosts, rejected = parse_inventory(raw, fmt)
+    if rejected:
+        return {"applied": False, "total": len(hosts) + len(rejected), "rejected": rejected}
+    report = sync_inventory(hosts, deactivate_missing=deactivate_missing, dry_run=dry_run)
+    return {"applied": not dry_run, **report, "rejected": []}
+
+
+def detect_format(filename="", content_type=""):
+    """csv для *.csv и text/csv, иначе jsonl."""
+    if filename.lower().endswith(".csv") or content_type.split(";")[0].strip().lower() == "text/csv":
+        return "csv"
+    return "jsonl"
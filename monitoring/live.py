@@ -0,0 +1,124 @@
+# monitoring/live.py
+"""
+Живая лента инцидентов для браузеров (Server-Sent Events под ASGI).
+
+В каждом веб-процессе работает один IncidentHub:
+- одно подключение к Redis pub/sub (канал feed.EVENTS_CHANNEL), куда воркеры
+  Celery публикуют событие после каждого изменения инцидентов;
+- по событию hub один раз читает изменения из БД (feed.changes_since со своим
+  курсором), один раз сериализует их и раскладывает по очередям клиентов.
+Клиент — это asyncio.Queue и корутина, которая ждёт на ней; потоков на клиента
+нет, поэтому тысячи простаивающих соединений стоят дёшево. Нагрузка на БД
+не зависит от числа подключённых браузеров.
+"""
+import asyncio
+import json
+import logging
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from . import feed
+
+logger = logging.getLogger(__name__)
+
+CLIENT_QUEUE_SIZE = 100
+KEEPALIVE_SEC = 25
+RECONNECT_SEC = 5
+
+# сигнал клиенту завершить поток (не успевает читать) — браузер переподключится с курсором
+_CLOSE = None
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@sync_to_async
+def changes_since(cursor):
+    # соединение hub-а живёт вне цикла запроса Django — закрываем протухшие сами
+    close_old_connections()
+    return feed.changes_since(cursor)
+
+
+def encode_changes(items, cursor):
+    return json.dumps({"items": items, "cursor": cursor.isoformat()}, cls=DjangoJSONEncoder)
+
+
+class IncidentHub:
+    def __init__(self):
+        self.clients = set()
+        self.cursor = None
+        self._task = None
+
+    def subscribe(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.discard(queue)
+
+    def broadcast(self, message):
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.clients.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(_CLOSE)
+
+    async def _poll_changes(self):
+        items, self.cursor = await changes_since(self.cursor)
+        if items:
+            self.broadcast(encode_changes(items, self.cursor))
+
+    async def _run(self):
+        while self.clients:
+            client = aioredis.Redis.from_url(settings.MONITORING_EVENTS_REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(feed.EVENTS_CHANNEL)
+                    if self.cursor is None:
+                        _, self.cursor = await changes_since(self.cursor)
+                    else:
+                        # за время переподключения могли пропустить события
+                        await self._poll_changes()
+                    while self.clients:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_SEC)
+                        if message is not None:
+                            await self._poll_changes()
+            except (aioredis.RedisError, OSError) as e:
+                logger.warning("live: redis subscription failed: %s", e)
+                await asyncio.sleep(RECONNECT_SEC)
+            finally:
+                await client.aclose()
+
+
+hub = IncidentHub()
+
+
+async def stream(cursor=None):
+    """Асинхронный генератор SSE для одного клиента."""
+    queue = hub.subscribe()
+    try:
+        yield f"retry: {RECONNECT_SEC * 1000}\n\n"
+        if cursor is not None:
+            items, new_cursor = await changes_since(cursor)
+            yield sse("incidents", encode_changes(items, new_cursor))
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), KEEPALIVE_SEC)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if message is _CLOSE:
+                break
+            yield sse("incidents", message)
+    finally:
+        hub.unsubscribe(queue)
@@ -0,0 +1,60 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test.utils import override_settings
+from monitoring import benchmark
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон без внешних сервисов: парк машин, встроенный мок, история метрик, "
+        "проходы сбора, проверка правил и API инцидентов; результат — JSON-отчёт"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=1000, help="Размер парка")
+        parser.add_argument("--days", type=float, default=7, help="Глубина синтетической истории, дней (0 — без неё)")
+        parser.add_argument("--interval", type=int, help="Шаг истории, сек (по умолчанию — интервал опроса)")
+        parser.add_argument("--hot-rate", type=float, default=0.05, help="Доля машин выше порогов правил")
+        parser.add_argument("--sweeps", type=int, default=3, help="Сколько проходов сбора замерить")
+        parser.add_argument("--evaluations", type=int, default=2, help="Сколько проверок правил замерить")
+        parser.add_argument("--api-requests", type=int, default=200, help="Запросов на каждый эндпоинт API (0 — без API)")
+        parser.add_argument("--concurrency", type=int, default=4, help="Потоков, одновременно нагружающих API")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генераторов случайных чисел")
+        parser.add_argument("--output", default="benchmark-report.json", help="Куда записать JSON-отчёт")
+
+        mock = parser.add_argument_group("мок машин")
+        mock.add_argument("--mock-host", help="Внешний мок (напр. mock/main.py или python -m monitoring.mockserver) вместо встроенного")
+        mock.add_argument("--latency-ms", type=float, default=20, help="Медиана задержки ответа, мс")
+        mock.add_argument("--latency-sigma", type=float, default=0.5, help="Разброс задержки (логнормальное)")
+        mock.add_argument("--error-rate", type=float, default=0.01, help="Доля ответов HTTP 500")
+        mock.add_argument("--timeout-rate", type=float, default=0.0, help="Доля «зависающих» запросов")
+        mock.add_argument("--invalid-rate", type=float, default=0.01, help="Доля некорректных ответов")
+        mock.add_argument("--fetch-timeout", type=float, help="MONITORING_FETCH_TIMEOUT на время прогона, сек")
+
+    def handle(self, *args, **opts):
+        overrides = {}
+        if opts["fetch_timeout"]:
+            overrides["MONITORING_FETCH_TIMEOUT"] = opts["fetch_timeout"]
+        with override_settings(**overrides):
+            mock = {
+                "latency_ms": opts["latency_ms"],
+                "latency_sigma": opts["latency_sigma"],
+                "error_rate": opts["error_rate"],
+                "timeout_rate": opts["timeout_rate"],
+                "invalid_rate": opts["invalid_rate"],
+                # «зависший» запрос должен гарантированно упереться в таймаут опроса
+                "hang_sec": settings.MONITORING_FETCH_TIMEOUT + 5,
+            }
+            report = benchmark.run(
+                machines=opts["machines"], days=opts["days"], interval_sec=opts["interval"],
+                hot_rate=opts["hot_rate"], sweeps=opts["sweeps"], evaluations=opts["evaluations"],
+                api_requests=opts["api_requests"], concurrency=opts["concurrency"],
+                mock=mock, mock_host=opts["mock_host"], seed=opts["seed"],
+            )
+
+        with open(opts["output"], "w", encoding="utf-8") as f:
+            json.dump(report, f, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
+        for line in benchmark.summary_lines(report):
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"OK: отчёт записан в {opts['output']}"))
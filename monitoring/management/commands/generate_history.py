@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from monitoring.benchmark import BENCH_PREFIX, generate_history
+from monitoring.models import Machine
+
+class Command(BaseCommand):
+    help = "Генерирует синтетическую историю метрик для машин парка (bulk_create пачками)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=7, help="Глубина истории, дней")
+        parser.add_argument("--interval", type=int, help="Шаг между точками, сек (по умолчанию — интервал опроса)")
+        parser.add_argument("--hot-rate", type=float, default=0.05, help="Доля машин с эпизодами перегрузки")
+        parser.add_argument("--prefix", default=BENCH_PREFIX, help="Префикс имён машин парка")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Строк в одном INSERT")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора случайных чисел")
+
+    def handle(self, *args, **opts):
+        ids = list(
+            Machine.objects.filter(name__startswith=opts["prefix"], active=True)
+            .order_by("id").values_list("id", flat=True)
+        )
+        if not ids:
+            self.stdout.write(self.style.WARNING("Нет машин парка — сначала seed_fleet"))
+            return
+        started = time.monotonic()
+        rows = generate_history(
+            ids, opts["days"], opts["interval"],
+            hot_rate=opts["hot_rate"], seed=opts["seed"], batch_size=opts["batch_size"],
+        )
+        seconds = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"OK: {rows} метрик для {len(ids)} машин за {seconds:.1f} с ({rows / max(seconds, 1e-9):.0f} строк/с)"
+        ))
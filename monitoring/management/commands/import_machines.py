@@ -0,0 +1,38 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from monitoring.inventory import FORMATS, detect_format, import_inventory
+
+class Command(BaseCommand):
+    help = (
+        "Синхронизирует парк машин с инвентарём (CSV или JSON lines): создаёт новые, "
+        "обновляет изменившиеся, выключает отсутствующие (история сохраняется)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл инвентаря; '-' — читать из stdin")
+        parser.add_argument("--format", choices=FORMATS, help="Формат файла (по умолчанию — по расширению)")
+        parser.add_argument("--keep-missing", action="store_true", help="Не выключать машины, которых нет в файле")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать изменения")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or detect_format(path)
+        try:
+            if path == "-":
+                raw = sys.stdin.buffer.read()
+            else:
+                with open(path, "rb") as f:
+                    raw = f.read()
+            report = import_inventory(raw, fmt, deactivate_missing=not opts["keep_missing"], dry_run=opts["dry_run"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if report["rejected"]:
+            for item in report["rejected"][:20]:
+                self.stderr.write(f"  line {item['line']}: {item['error']}")
+            raise CommandError(f"{len(report['rejected'])} invalid lines, nothing imported")
+        self.stdout.write(self.style.SUCCESS(
+            ("DRY RUN: " if opts["dry_run"] else "OK: ")
+            + f"машин в инвентаре {report['total']}: создано {report['created']}, обновлено {report['updated']}, "
+            f"без изменений {report['unchanged']}, выключено {report['deactivated']}"
+        ))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from monitoring import partitions
+
+class Command(BaseCommand):
+    help = (
+        "Секционирование таблицы метрик по received_at (MySQL): без флагов — создать секции "
+        "вперёд и удалить устаревшие; --enable / --disable — перевести таблицу в режим и обратно"
+    )
+
+    def add_arguments(self, parser):
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument("--enable", action="store_true", help="Секционировать таблицу (перестраивает её целиком)")
+        mode.add_argument("--disable", action="store_true", help="Вернуть обычную таблицу с внешним ключом")
+        parser.add_argument("--scheme", choices=sorted(partitions.SCHEMES), help="Период секции (по умолчанию из настроек)")
+        parser.add_argument("--metric-days", type=int, help="Хранить метрики, дней")
+        parser.add_argument("--ahead-days", type=int, help="На сколько дней вперёд создавать секции")
+
+    def handle(self, *args, **opts):
+        scheme = opts["scheme"] or settings.MONITORING_METRIC_PARTITIONING or "daily"
+        try:
+            if opts["enable"]:
+                count = partitions.enable(scheme, opts["metric_days"], opts["ahead_days"])
+                self.stdout.write(self.style.SUCCESS(f"OK: таблица метрик разбита на {count} секций ({scheme})"))
+            elif opts["disable"]:
+                partitions.disable()
+                self.stdout.write(self.style.SUCCESS("OK: секционирование снято"))
+            else:
+                report = partitions.maintain(opts["metric_days"], opts["ahead_days"], scheme)
+                if report is None:
+                    raise CommandError("metrics table is not partitioned, run with --enable first")
+                self.stdout.write(self.style.SUCCESS(
+                    f"OK: создано секций {report['created']}, удалено {report['dropped']} "
+                    f"(~{report['rows_dropped_estimate']} строк), всего {report['partitions']}"
+                ))
+        except partitions.PartitioningError as e:
+            raise CommandError(str(e))
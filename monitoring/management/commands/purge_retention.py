@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from monitoring.retention import purge_expired
+
+class Command(BaseCommand):
+    help = "Удаляет устаревшие метрики и закрытые инциденты порциями по первичному ключу"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--metric-days", type=int, help="Хранить метрики, дней")
+        parser.add_argument("--incident-days", type=int, help="Хранить закрытые инциденты, дней")
+        parser.add_argument("--batch-size", type=int, help="Строк за одну порцию")
+        parser.add_argument("--pause", type=float, help="Пауза между порциями, сек")
+        parser.add_argument("--time-budget", type=float, help="Максимальное время работы, сек")
+
+    def handle(self, *args, **opts):
+        report = purge_expired(
+            metric_days=opts["metric_days"],
+            incident_days=opts["incident_days"],
+            batch_size=opts["batch_size"],
+            pause=opts["pause"],
+            time_budget=opts["time_budget"],
+        )
+        style = self.style.SUCCESS if report["complete"] else self.style.WARNING
+        self.stdout.write(style(
+            f"OK: удалено метрик {report['metrics_deleted']}, инцидентов {report['incidents_deleted']} "
+            f"за {report['seconds']} с" + ("" if report["complete"] else " (бюджет времени исчерпан)")
+        ))
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone as tz
 from datetime import timedelta as td
+from monitoring import state
+from monitoring.inventory import Host, sync_inventory
 from monitoring.models import Machine, Metric
 from monitoring.tasks import evaluate_incidents_all
 import requests
@@ -17,13 +19,14 @@ class Command(BaseCommand):
             r = requests.get(f"{host}/m/list", timeout=5)
             if r.status_code == 200:
                 data = r.json()
-                Machine.objects.all().delete()
-                for item in data:
-                    Machine.objects.create(
-                        name=item["name"],
-                        endpoint=f"{host}/m/{item['id']}/metrics",
-                    )
-                self.stdout.write(self.style.SUCCESS(f"✅ Created {len(data)} machines"))
+                # машины не из списка мока выключаются, их история остаётся
+                report = sync_inventory(
+                    [Host(name=item["name"], endpoint=f"{host}/m/{item['id']}/metrics") for item in data]
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Machines: {report['created']} created, {report['updated']} updated, "
+                    f"{report['deactivated']} deactivated"
+                ))
             else:
                 self.stdout.write(self.style.WARNING("⚠️ Mock server not responding, skipping"))
         except Exception as e:
@@ -41,16 +44,18 @@ class Command(BaseCommand):
 
         if m1:
             Metric.objects.create(machine=m1, cpu=96, mem_percent=20, disk_percent=20,
-                                  uptime='cpu_spike', received_at=now)
+                                  uptime_sec=3600, received_at=now)
         if m2:
             Metric.objects.create(machine=m2, cpu=10, mem_percent=95, disk_percent=20,
-                                  uptime='mem1', received_at=now - td(minutes=15))
+                                  uptime_sec=3600, received_at=now - td(minutes=15))
             Metric.objects.create(machine=m2, cpu=12, mem_percent=96, disk_percent=25,
-                                  uptime='mem2', received_at=now)
+                                  uptime_sec=4500, received_at=now)
         if m3:
             for i in range(8):
                 Metric.objects.create(machine=m3, cpu=8, mem_percent=30, disk_percent=98,
-                                      uptime=f'disk{i}', received_at=now - td(minutes=15*i))
+                                      uptime_sec=7200 - 900 * i, received_at=now - td(minutes=15*i))
+        # метрики записаны напрямую, минуя MetricBuffer, — пересчитываем последнее состояние
+        state.rebuild([m.id for m in (m1, m2, m3) if m])
         self.stdout.write(self.style.SUCCESS("✅ Demo metrics added"))
 
         # 3. Пересчёт инцидентов
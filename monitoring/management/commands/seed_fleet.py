@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from monitoring.benchmark import BENCH_PREFIX, seed_fleet
+
+class Command(BaseCommand):
+    help = "Создаёт (или переиспользует) синтетический парк из N машин bench-00001… для нагрузочных проверок"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1000, help="Сколько машин в парке")
+        parser.add_argument(
+            "--host",
+            default="http://127.0.0.1:8001",
+            help="Базовый хост мок-сервера, напр. http://127.0.0.1:8001",
+        )
+        parser.add_argument("--prefix", default=BENCH_PREFIX, help="Префикс имён машин парка")
+
+    def handle(self, *args, **opts):
+        ids = seed_fleet(opts["count"], opts["host"], prefix=opts["prefix"])
+        self.stdout.write(self.style.SUCCESS(f"OK: в парке {len(ids)} активных машин {opts['prefix']}*"))
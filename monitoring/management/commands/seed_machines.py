@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from monitoring.models import Machine
+from monitoring.inventory import Host, sync_inventory
 
 class Command(BaseCommand):
     help = "Создаёт 30 машин с endpoint-ами мок-сервера"
@@ -13,13 +13,10 @@ class Command(BaseCommand):
 
     def handle(self, *args, **opts):
         host = opts["host"].rstrip("/")
-        created = 0
-        for i in range(1, 31):
-            name = f"node-{i:02d}"
-            endpoint = f"{host}/m/{i}/metrics"
-            _, is_created = Machine.objects.get_or_create(
-                name=name, endpoint=endpoint, defaults={"active": True}
-            )
-            if is_created:
-                created += 1
-        self.stdout.write(self.style.SUCCESS(f"OK: создано {created} машин"))
+        hosts = [Host(name=f"node-{i:02d}", endpoint=f"{host}/m/{i}/metrics") for i in range(1, 31)]
+        # запускается при каждом старте контейнера: только недостающие машины,
+        # существующие (их active, режим сбора, расписание опроса) не трогаем
+        report = sync_inventory(hosts, create_only=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"OK: создано {report['created']} машин, уже были {report['unchanged']}"
+        ))
@@ -8,6 +8,9 @@ EXEMPT_URLS = [
     r"^/static/.*$",
     r"^/admin/.*$",          # если нужно заходить в админку
     r"^/api/health/?$",      # пригодится для будущих проверок
+    r"^/metrics/?$",         # scrape Prometheus (см. monitoring.instrumentation)
+    r"^/api/ingest/?$",      # агенты авторизуются токеном (MONITORING_INGEST_TOKEN)
+    r"^/api/machines/import/?$",  # импорт инвентаря по токену (MONITORING_INVENTORY_TOKEN)
 ]
 
 class SimpleAuthMiddleware:
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Прежние захардкоженные правила из monitoring/tasks.py
+DEFAULT_RULES = [
+    {"code": "CPU_HIGH", "metric": "cpu", "threshold": 85, "window_min": 0},
+    {"code": "MEM_HIGH", "metric": "mem_percent", "threshold": 90, "window_min": 30},
+    {"code": "DISK_HIGH", "metric": "disk_percent", "threshold": 95, "window_min": 120},
+]
+
+
+def seed_rules(apps, schema_editor):
+    IncidentRule = apps.get_model("monitoring", "IncidentRule")
+    for rule in DEFAULT_RULES:
+        IncidentRule.objects.get_or_create(code=rule["code"], defaults=rule)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_incident'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=32, unique=True)),
+                ('metric', models.CharField(choices=[('cpu', 'CPU'), ('mem_percent', 'MEM %'), ('disk_percent', 'DISK %')], max_length=16)),
+                ('comparator', models.CharField(choices=[('>', '>'), ('>=', '>='), ('<', '<'), ('<=', '<=')], default='>', max_length=2)),
+                ('threshold', models.FloatField()),
+                ('window_min', models.PositiveIntegerField(default=0, help_text='0 — только последняя метрика')),
+                ('enabled', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IncidentRuleOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.FloatField(blank=True, help_text='Пусто — порог правила', null=True)),
+                ('enabled', models.BooleanField(default=True)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rule_overrides', to='monitoring.machine')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overrides', to='monitoring.incidentrule')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='incidentruleoverride',
+            constraint=models.UniqueConstraint(fields=('rule', 'machine'), name='uniq_rule_override'),
+        ),
+        migrations.RunPython(seed_rules, migrations.RunPython.noop),
+    ]
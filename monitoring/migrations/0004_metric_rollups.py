@@ -0,0 +1,81 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_incident_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('last_metric_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetricDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('cpu_min', models.FloatField()),
+                ('cpu_max', models.FloatField()),
+                ('cpu_avg', models.FloatField()),
+                ('cpu_p95', models.FloatField()),
+                ('mem_min', models.FloatField()),
+                ('mem_max', models.FloatField()),
+                ('mem_avg', models.FloatField()),
+                ('mem_p95', models.FloatField()),
+                ('disk_min', models.FloatField()),
+                ('disk_max', models.FloatField()),
+                ('disk_avg', models.FloatField()),
+                ('disk_p95', models.FloatField()),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitoring.machine')),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('cpu_min', models.FloatField()),
+                ('cpu_max', models.FloatField()),
+                ('cpu_avg', models.FloatField()),
+                ('cpu_p95', models.FloatField()),
+                ('mem_min', models.FloatField()),
+                ('mem_max', models.FloatField()),
+                ('mem_avg', models.FloatField()),
+                ('mem_p95', models.FloatField()),
+                ('disk_min', models.FloatField()),
+                ('disk_max', models.FloatField()),
+                ('disk_avg', models.FloatField()),
+                ('disk_p95', models.FloatField()),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitoring.machine')),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='metricdaily',
+            constraint=models.UniqueConstraint(fields=('machine', 'bucket_start'), name='uniq_metricdaily_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='metrichourly',
+            constraint=models.UniqueConstraint(fields=('machine', 'bucket_start'), name='uniq_metrichourly_bucket'),
+        ),
+    ]
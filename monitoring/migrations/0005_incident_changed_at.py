@@ -0,0 +1,30 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+
+def fill_changed_at(apps, schema_editor):
+    Incident = apps.get_model("monitoring", "Incident")
+    Incident.objects.update(
+        changed_at=Case(
+            When(resolved_at__gt=F("last_seen_at"), then=F("resolved_at")),
+            default=F("last_seen_at"),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_metric_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incident',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_changed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_incident_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='collection_mode',
+            field=models.CharField(choices=[('pull', 'Опрос (pull)'), ('push', 'Агент присылает сам (push)')], default='pull', max_length=8),
+        ),
+        migrations.AlterField(
+            model_name='machine',
+            name='endpoint',
+            field=models.URLField(blank=True, help_text='HTTP URL вида http://host:port/metrics (для pull)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_machine_collection_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='poll_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
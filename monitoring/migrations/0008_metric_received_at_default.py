@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-17 20:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0007_machine_poll_schedule'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='metric',
+            name='received_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
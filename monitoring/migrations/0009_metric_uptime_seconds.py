@@ -0,0 +1,61 @@
+import re
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+BATCH = 5000
+
+# копия разбора uptime на момент миграции (monitoring.parser может меняться)
+UPTIME_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+UPTIME_PART = re.compile(r"(\d+)\s*([dhms])")
+
+
+def uptime_seconds(raw):
+    """Секунды из "3600" или "3d 4h 5m 6s"; None — пусто или не разбирается."""
+    text = (raw or "").strip()
+    if text.isdigit():
+        return int(text)
+    parts = UPTIME_PART.findall(text)
+    if not parts or UPTIME_PART.sub("", text).strip():
+        return None
+    return sum(int(n) * UPTIME_UNITS[unit] for n, unit in parts)
+
+
+def fill_uptime_sec(apps, schema_editor):
+    # порциями по диапазонам id, чтобы не держать всю таблицу в памяти
+    Metric = apps.get_model("monitoring", "Metric")
+    bounds = Metric.objects.aggregate(first=Min("id"), last=Max("id"))
+    if bounds["first"] is None:
+        return
+    for lo in range(bounds["first"], bounds["last"] + 1, BATCH):
+        changed = []
+        for pk, raw in Metric.objects.filter(id__gte=lo, id__lt=lo + BATCH).values_list("id", "uptime"):
+            seconds = uptime_seconds(raw)
+            if seconds is not None:
+                changed.append(Metric(id=pk, uptime_sec=seconds))
+        Metric.objects.bulk_update(changed, ["uptime_sec"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0008_metric_received_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='parse_errors',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='uptime_sec',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_uptime_sec, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='metric',
+            name='uptime',
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicates(apps, schema_editor):
+    # имя становится ключом инвентаря; у повторов (кроме первой машины) к имени
+    # добавляется id — машины и их история не удаляются
+    Machine = apps.get_model("monitoring", "Machine")
+    names = (
+        Machine.objects.values("name").annotate(n=Count("id")).filter(n__gt=1).values_list("name", flat=True)
+    )
+    for name in list(names):
+        for machine in Machine.objects.filter(name=name).order_by("-active", "id")[1:]:
+            suffix = f" #{machine.id}"
+            machine.name = name[:128 - len(suffix)] + suffix
+            machine.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0009_metric_uptime_seconds'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='machine',
+            name='name',
+            field=models.CharField(max_length=128, unique=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.7 on 2026-10-17 20:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH = 1000
+
+
+def fill_state(apps, schema_editor):
+    # последняя метрика каждой машины — по индексу (machine, received_at), запрос на машину
+    Machine = apps.get_model("monitoring", "Machine")
+    Metric = apps.get_model("monitoring", "Metric")
+    MachineState = apps.get_model("monitoring", "MachineState")
+    states = []
+    for mid in Machine.objects.values_list("id", flat=True).iterator():
+        last = (
+            Metric.objects.filter(machine_id=mid)
+            .order_by("-received_at")
+            .values_list("cpu", "mem_percent", "disk_percent", "uptime_sec", "received_at")
+            .first()
+        )
+        if last is not None:
+            cpu, mem, disk, uptime, at = last
+            states.append(MachineState(
+                machine_id=mid, cpu=cpu, mem_percent=mem, disk_percent=disk, uptime_sec=uptime,
+                sampled_at=at, fetched_at=at,
+            ))
+        if len(states) >= BATCH:
+            MachineState.objects.bulk_create(states)
+            states = []
+    MachineState.objects.bulk_create(states)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0010_machine_name_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineState',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='monitoring.machine')),
+                ('cpu', models.IntegerField(blank=True, null=True)),
+                ('mem_percent', models.FloatField(blank=True, null=True)),
+                ('disk_percent', models.FloatField(blank=True, null=True)),
+                ('uptime_sec', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('sampled_at', models.DateTimeField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, default='', max_length=255)),
+                ('last_error_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_state, migrations.RunPython.noop),
+    ]
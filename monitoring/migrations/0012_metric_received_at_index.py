@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-17 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0011_machine_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['received_at'], name='monitoring__receive_aecd96_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.utils import timezone
+
+
+def fill_active_key(apps, schema_editor):
+    # у закрытых инцидентов ключа нет; из повторных активных (machine, type)
+    # остаётся самый ранний, остальные закрываются
+    Incident = apps.get_model("monitoring", "Incident")
+    Incident.objects.filter(is_active=False).update(active_key=None)
+    duplicates = (
+        Incident.objects.filter(is_active=True)
+        .values("machine_id", "type")
+        .annotate(n=Count("id"), first=Min("id"))
+        .filter(n__gt=1)
+    )
+    now = timezone.now()
+    for row in list(duplicates):
+        Incident.objects.filter(machine_id=row["machine_id"], type=row["type"], is_active=True).exclude(
+            id=row["first"]
+        ).update(is_active=False, active_key=None, resolved_at=now, changed_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitoring", "0012_metric_received_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="incident",
+            name="active_key",
+            field=models.BooleanField(default=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_active_key, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="incident",
+            constraint=models.UniqueConstraint(fields=("machine", "type", "active_key"), name="incident_one_active"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-17 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0013_incident_one_active'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['is_active'], name='monitoring__is_acti_cb35e4_idx'),
+        ),
+    ]
@@ -0,0 +1,159 @@
+# monitoring/mockserver.py
+"""
+Эмулятор машин (/m/<id>/metrics) для нагрузочных прогонов.
+
+Поведение задаётся параметрами: логнормальная задержка ответа (медиана и
+разброс), доля ответов HTTP 500, «зависаний» (ответ через hang_sec — сборщик
+должен упереться в свой таймаут) и некорректных тел. У «горячих» машин
+(каждая round(1 / hot_rate)-я по id) значения выше порогов правил.
+
+Модуль не зависит от Django. MockProcess запускает сервер в отдельном
+процессе: в одном процессе со сборщиком мок делил бы с ним GIL, и задержки
+переключения потоков попадали бы в замеры. Отдельно:
+    python -m monitoring.mockserver --port 8001 --latency-ms 50 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import re
+
+import orjson
+
+_REQUEST_LINE = re.compile(rb"^GET /m/(\d+)/metrics")
+
+
+def is_hot(machine_id, hot_rate):
+    """Горячие машины — каждая round(1 / hot_rate)-я: у них бывают значения выше порогов."""
+    return hot_rate > 0 and machine_id % max(1, round(1 / hot_rate)) == 0
+
+
+class MockServer:
+    """asyncio-сервер; одно соединение обслуживает много запросов (keep-alive)."""
+
+    def __init__(self, latency_ms=0.0, latency_sigma=0.5, error_rate=0.0, timeout_rate=0.0,
+                 invalid_rate=0.0, hang_sec=60.0, hot_rate=0.05, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.invalid_rate = invalid_rate
+        self.hang_sec = hang_sec
+        self.hot_rate = hot_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+
+    async def serve(self, host="127.0.0.1", port=0, on_ready=None):
+        server = await asyncio.start_server(self._handle, host, port, backlog=4096)
+        if on_ready is not None:
+            on_ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                while await reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                status, body = await self.respond(line)
+                writer.write(
+                    b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                    % (status, b"OK" if status == 200 else b"Error", len(body)) + body
+                )
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, request_line):
+        """(HTTP-статус, тело) на строку запроса."""
+        self.requests += 1
+        match = _REQUEST_LINE.match(request_line)
+        if match is None:
+            return 404, b'{"error": "not found"}'
+        rng = self._rng
+        roll = rng.random()
+        if roll < self.timeout_rate:
+            await asyncio.sleep(self.hang_sec)
+        if self.latency_ms:
+            await asyncio.sleep(rng.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000)
+        roll -= self.timeout_rate
+        if 0 <= roll < self.error_rate:
+            return 500, b'{"error": "internal"}'
+        roll -= self.error_rate
+        if 0 <= roll < self.invalid_rate:
+            return 200, b"<html>maintenance</html>"
+        if is_hot(int(match.group(1)), self.hot_rate):
+            cpu, mem, disk = rng.randint(86, 100), rng.uniform(91, 99), rng.uniform(96, 99)
+        else:
+            cpu, mem, disk = rng.randint(1, 80), rng.uniform(10, 85), rng.uniform(5, 90)
+        return 200, orjson.dumps({
+            "cpu": cpu, "mem": f"{mem:.1f}%", "disk": f"{disk:.1f}%", "uptime": rng.randint(0, 90 * 86400),
+        })
+
+
+def _serve_in_child(options, host, port, ready):
+    asyncio.run(MockServer(**options).serve(host, port, ready.put))
+
+
+class MockProcess:
+    """MockServer в дочернем процессе; url доступен после start()."""
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        self.host = host
+        self.port = port
+        self.options = options
+        self.url = None
+        self._process = None
+
+    def start(self, wait=10):
+        # spawn, а не fork: дочернему процессу не нужны соединения с БД и потоки родителя
+        ctx = multiprocessing.get_context("spawn")
+        ready = ctx.Queue()
+        self._process = ctx.Process(
+            target=_serve_in_child, args=(self.options, self.host, self.port, ready),
+            name="benchmark-mock", daemon=True,
+        )
+        self._process.start()
+        self.url = f"http://{self.host}:{ready.get(timeout=wait)}"
+        return self
+
+    def stop(self):
+        if self._process is not None and self._process.is_alive():
+            self._process.terminate()
+            self._process.join(10)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Эмулятор машин для нагрузочных прогонов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Медиана задержки ответа, мс")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Разброс задержки (логнормальное)")
+    parser.add_argument("--error-rate", type=float, default=0, help="Доля ответов HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0, help="Доля «зависающих» запросов")
+    parser.add_argument("--hang-sec", type=float, default=60, help="Сколько «зависает» запрос, сек")
+    parser.add_argument("--invalid-rate", type=float, default=0, help="Доля некорректных ответов")
+    parser.add_argument("--hot-rate", type=float, default=0.05, help="Доля машин выше порогов правил")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    server = MockServer(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, invalid_rate=args.invalid_rate, hang_sec=args.hang_sec,
+        hot_rate=args.hot_rate, seed=args.seed,
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port, lambda port: print(f"mock on {args.host}:{port}")))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
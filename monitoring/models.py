@@ -1,9 +1,20 @@
 from django.db import models
+from django.utils import timezone
 
 class Machine(models.Model):
-    name = models.CharField(max_length=128)
-    endpoint = models.URLField(help_text="HTTP URL вида http://host:port/metrics")
+    class Mode(models.TextChoices):
+        PULL = "pull", "Опрос (pull)"
+        PUSH = "push", "Агент присылает сам (push)"
+
+    name = models.CharField(max_length=128, unique=True)
+    endpoint = models.URLField(blank=True, help_text="HTTP URL вида http://host:port/metrics (для pull)")
     active = models.BooleanField(default=True)
+    collection_mode = models.CharField(max_length=8, choices=Mode.choices, default=Mode.PULL)
+    # расписание опроса (см. monitoring.polling)
+    next_poll_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    poll_failures = models.PositiveIntegerField(default=0)
+    # сколько ответов машины не прошло разбор (см. monitoring.parser)
+    parse_errors = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -14,13 +25,83 @@ class Metric(models.Model):
     cpu = models.IntegerField()
     mem_percent = models.FloatField()
     disk_percent = models.FloatField()
-    uptime = models.CharField(max_length=64)
-    received_at = models.DateTimeField(auto_now_add=True)
+    uptime_sec = models.PositiveBigIntegerField(null=True, blank=True)
+    # по умолчанию — момент записи; задаётся явно при загрузке истории
+    received_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        indexes = [models.Index(fields=["machine", "received_at"])]
+        indexes = [
+            models.Index(fields=["machine", "received_at"]),
+            # диапазон по времени по всему парку (админка: date_hierarchy)
+            models.Index(fields=["received_at"]),
+        ]
         ordering = ["-received_at"]
 
+class MachineState(models.Model):
+    """
+    Последнее известное состояние машины — одна строка на машину (см. monitoring.state).
+    Обновляется при записи метрик в той же транзакции и при неудачном опросе.
+    """
+    machine = models.OneToOneField(Machine, on_delete=models.CASCADE, primary_key=True, related_name="state")
+    cpu = models.IntegerField(null=True, blank=True)
+    mem_percent = models.FloatField(null=True, blank=True)
+    disk_percent = models.FloatField(null=True, blank=True)
+    uptime_sec = models.PositiveBigIntegerField(null=True, blank=True)
+    # received_at последнего сэмпла; пусто — сэмплов ещё не было
+    sampled_at = models.DateTimeField(null=True, blank=True)
+    # последняя попытка получить метрики — удачная или нет
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    # ошибка последней неудачной попытки; очищается при успешной
+    last_error = models.CharField(max_length=255, blank=True, default="")
+    last_error_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"state of machine {self.machine_id}"
+
+class MetricRollup(models.Model):
+    """Агрегаты метрик машины за интервал [bucket_start, bucket_start + период)."""
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name="+")
+    bucket_start = models.DateTimeField()
+    samples = models.PositiveIntegerField()
+
+    cpu_min = models.FloatField()
+    cpu_max = models.FloatField()
+    cpu_avg = models.FloatField()
+    cpu_p95 = models.FloatField()
+    mem_min = models.FloatField()
+    mem_max = models.FloatField()
+    mem_avg = models.FloatField()
+    mem_p95 = models.FloatField()
+    disk_min = models.FloatField()
+    disk_max = models.FloatField()
+    disk_avg = models.FloatField()
+    disk_p95 = models.FloatField()
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(fields=["machine", "bucket_start"], name="uniq_%(class)s_bucket"),
+        ]
+        ordering = ["-bucket_start"]
+
+
+class MetricHourly(MetricRollup):
+    class Meta(MetricRollup.Meta):
+        pass
+
+
+class MetricDaily(MetricRollup):
+    class Meta(MetricRollup.Meta):
+        pass
+
+
+class RollupWatermark(models.Model):
+    """До какого Metric.id сырые метрики уже учтены в агрегатах."""
+    name = models.CharField(max_length=32, unique=True)
+    last_metric_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class Incident(models.Model):
     class Type(models.TextChoices):
         CPU_HIGH = "CPU_HIGH", "CPU > 85%"
@@ -30,10 +111,16 @@ class Incident(models.Model):
     machine = models.ForeignKey("Machine", on_delete=models.CASCADE, related_name="incidents")
     type = models.CharField(max_length=32, choices=Type.choices)
     is_active = models.BooleanField(default=True)
+    # True у активного инцидента, NULL у закрытого: уникальный ключ (machine, type, active_key)
+    # допускает один активный инцидент на машину и тип и сколько угодно закрытых
+    # (NULL-ы в уникальном индексе не совпадают; частичных индексов MySQL не умеет)
+    active_key = models.BooleanField(null=True, default=True, editable=False)
 
     started_at = models.DateTimeField(auto_now_add=True)
     last_seen_at = models.DateTimeField(auto_now=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
+    # когда инцидент в последний раз открывался/обновлялся/закрывался — курсор ленты изменений
+    changed_at = models.DateTimeField(auto_now=True, db_index=True)
 
     details = models.JSONField(null=True, blank=True)
 
@@ -41,8 +128,62 @@ class Incident(models.Model):
         indexes = [
             models.Index(fields=["machine", "type", "is_active"]),
             models.Index(fields=["started_at"]),
+            # активные инциденты по всем машинам (список в админке по умолчанию)
+            models.Index(fields=["is_active"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["machine", "type", "active_key"], name="incident_one_active"),
         ]
 
     def __str__(self):
         state = "ACTIVE" if self.is_active else "RESOLVED"
-        return f"{self.machine.name} {self.type} [{state}]"
\ No newline at end of file
+        return f"{self.machine.name} {self.type} [{state}]"
+
+    def save(self, *args, **kwargs):
+        # правка в админке; пакетные UPDATE (monitoring.evaluation) меняют active_key сами
+        self.active_key = True if self.is_active else None
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "is_active" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "active_key"}
+        super().save(*args, **kwargs)
+
+
+class IncidentRule(models.Model):
+    """
+    Правило инцидента: metric <comparator> threshold на протяжении window_min минут.
+    code становится типом инцидента (Incident.type).
+    """
+    class MetricField(models.TextChoices):
+        CPU = "cpu", "CPU"
+        MEM = "mem_percent", "MEM %"
+        DISK = "disk_percent", "DISK %"
+
+    class Comparator(models.TextChoices):
+        GT = ">", ">"
+        GE = ">=", ">="
+        LT = "<", "<"
+        LE = "<=", "<="
+
+    code = models.CharField(max_length=32, unique=True)
+    metric = models.CharField(max_length=16, choices=MetricField.choices)
+    comparator = models.CharField(max_length=2, choices=Comparator.choices, default=Comparator.GT)
+    threshold = models.FloatField()
+    window_min = models.PositiveIntegerField(default=0, help_text="0 — только последняя метрика")
+    enabled = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.code}: {self.metric} {self.comparator} {self.threshold} ({self.window_min}m)"
+
+
+class IncidentRuleOverride(models.Model):
+    """Порог правила для конкретной машины или отключение правила для неё."""
+    rule = models.ForeignKey(IncidentRule, on_delete=models.CASCADE, related_name="overrides")
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name="rule_overrides")
+    threshold = models.FloatField(null=True, blank=True, help_text="Пусто — порог правила")
+    enabled = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["rule", "machine"], name="uniq_rule_override")]
+
+    def __str__(self):
+        return f"{self.rule.code} @ {self.machine.name}"
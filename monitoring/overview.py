@@ -0,0 +1,107 @@
+# monitoring/overview.py
+"""
+Обзор парка (/fleet): тепловая карта cpu/mem/disk и перцентили по всему парку.
+
+Снимок строится из MachineState (один запрос, без чтения Metric) после каждого
+прохода сбора (tasks.finish_fetch_sweep) и кладётся в общий кэш целиком:
+посчитанные перцентили и уже отрисованный HTML клеток. Страница только
+достаёт его из кэша и вставляет в шаблон, поэтому время её отдачи не зависит
+от размера парка. Если снимка нет (первый запуск, истёк TTL — например, парк
+только из push-машин), страница строит его сама.
+"""
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import Machine
+from .rules import max_gap
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "fleet:overview"
+# метрика -> поле запроса к Machine
+METRICS = {
+    "cpu": "state__cpu",
+    "mem": "state__mem_percent",
+    "disk": "state__disk_percent",
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values отсортированы по возрастанию."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _summary(values):
+    if not values:
+        return None
+    values.sort()
+    out = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    out["max"] = values[-1]
+    out["avg"] = round(sum(values) / len(values), 1)
+    return out
+
+
+def _cell(name, value, stale):
+    # класс h0..h10 — значение с шагом 10%, s — сэмпл устарел, hn — данных нет
+    if value is None:
+        return f'<i class="hn" title="{name}: нет данных"></i>'
+    bucket = min(10, max(0, int(value // 10)))
+    return f'<i class="h{bucket}{" s" if stale else ""}" title="{name}: {value:.0f}%"></i>'
+
+
+def build_snapshot():
+    started = time.perf_counter()
+    now = timezone.now()
+    stale_before = now - timezone.timedelta(seconds=max_gap())
+    rows = Machine.objects.filter(active=True).order_by("name").values_list(
+        "name", "state__sampled_at", "state__last_error", *METRICS.values()
+    )
+
+    values = {metric: [] for metric in METRICS}
+    cells = {metric: [] for metric in METRICS}
+    count = stale = no_data = errors = 0
+    for name, sampled_at, last_error, *current in rows:
+        count += 1
+        name = escape(name)
+        is_stale = sampled_at is not None and sampled_at < stale_before
+        if sampled_at is None:
+            no_data += 1
+        elif is_stale:
+            stale += 1
+        if last_error:
+            errors += 1
+        for metric, value in zip(METRICS, current):
+            if value is not None:
+                values[metric].append(value)
+            cells[metric].append(_cell(name, value, is_stale))
+
+    snapshot = {
+        "generated_at": now,
+        "count": count,
+        "stale": stale,
+        "no_data": no_data,
+        "errors": errors,
+        "metrics": [
+            {"name": metric, "summary": _summary(values[metric]), "cells": "".join(cells[metric])}
+            for metric in METRICS
+        ],
+    }
+    logger.info("overview: snapshot of %s machines built in %.3fs", count, time.perf_counter() - started)
+    return snapshot
+
+
+def refresh():
+    snapshot = build_snapshot()
+    cache.set(SNAPSHOT_KEY, snapshot, settings.MONITORING_OVERVIEW_TTL)
+    return snapshot
+
+
+def get_snapshot():
+    return cache.get(SNAPSHOT_KEY) or refresh()
@@ -0,0 +1,127 @@
+# monitoring/parser.py
+"""
+Разбор ответа /metrics машины (и строк push-приёма).
+
+Ожидаемая схема (лишние поля игнорируются):
+    {"cpu": 0..100, "mem": "0..100%", "disk": "0..100%", "uptime": "3d 4h 5m 6s"}
+- cpu, mem, disk обязательны: число или строка с необязательным "%", в диапазоне 0..100;
+- uptime необязателен: целое число секунд или строка из частей "<n>d/h/m/s".
+JSON декодируется orjson (байты ответа без промежуточной str), результат —
+компактный Sample со __slots__. Любое нарушение схемы — ParseError с коротким
+описанием, без трейсбека: вызывающий код считает ошибки по машинам.
+"""
+import math
+import re
+from datetime import datetime, timezone as dt_timezone
+
+import orjson
+from django.utils.dateparse import parse_datetime
+
+UPTIME_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+_UPTIME_PART = re.compile(r"(\d+)\s*([dhms])")
+# верхняя граница BIGINT: больше не примет ни SQLite, ни MySQL, и вставка упадёт на всём буфере
+UPTIME_MAX = 2**63 - 1
+
+
+class ParseError(ValueError):
+    pass
+
+
+class Sample:
+    __slots__ = ("cpu", "mem", "disk", "uptime_sec")
+
+    def __init__(self, cpu, mem, disk, uptime_sec=None):
+        self.cpu = cpu
+        self.mem = mem
+        self.disk = disk
+        self.uptime_sec = uptime_sec
+
+    def __repr__(self):
+        return f"Sample(cpu={self.cpu}, mem={self.mem}, disk={self.disk}, uptime_sec={self.uptime_sec})"
+
+
+def _number(data, name):
+    if name not in data:
+        raise ParseError(f"{name}: missing")
+    value = data[name]
+    if isinstance(value, str):
+        text = value.strip().removesuffix("%")
+        try:
+            value = float(text)
+        except ValueError:
+            raise ParseError(f"{name}: not a number: {value[:32]!r}") from None
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ParseError(f"{name}: expected number, got {type(value).__name__}")
+    if not 0 <= value <= 100:
+        raise ParseError(f"{name}: {value} is out of range 0..100")
+    return value
+
+
+def parse_uptime(value):
+    """Секунды из 3600, "3600" или "3d 4h 5m 6s"; None — не передано."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ParseError("uptime: expected seconds or '<n>d <n>h <n>m <n>s'")
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ParseError(f"uptime: {value} is not finite")
+        if value < 0:
+            raise ParseError("uptime: negative")
+        return _uptime_in_range(int(value))
+    if not isinstance(value, str):
+        raise ParseError(f"uptime: expected string, got {type(value).__name__}")
+    text = value.strip()
+    if text.isdigit():
+        return _uptime_in_range(int(text))
+    parts = _UPTIME_PART.findall(text)
+    if not parts or _UPTIME_PART.sub("", text).strip():
+        raise ParseError(f"uptime: cannot parse {value[:32]!r}")
+    return _uptime_in_range(sum(int(n) * UPTIME_UNITS[unit] for n, unit in parts))
+
+
+def _uptime_in_range(seconds):
+    if seconds > UPTIME_MAX:
+        raise ParseError("uptime: too large")
+    return seconds
+
+
+def parse_sample(data):
+    """Sample из уже декодированного объекта."""
+    if not isinstance(data, dict):
+        raise ParseError(f"expected JSON object, got {type(data).__name__}")
+    return Sample(
+        cpu=int(_number(data, "cpu")),
+        mem=float(_number(data, "mem")),
+        disk=float(_number(data, "disk")),
+        uptime_sec=parse_uptime(data.get("uptime")),
+    )
+
+
+def parse_timestamp(value):
+    """Время сэмпла из unix-времени в секундах или ISO 8601 с часовым поясом."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ParseError(f"at: {value} is out of range") from None
+    if isinstance(value, str):
+        try:
+            at = parse_datetime(value.strip())
+        except ValueError:
+            at = None
+        if at is not None and at.tzinfo is not None:
+            return at
+    raise ParseError("at: expected unix time or ISO 8601 with timezone")
+
+
+def decode(raw):
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError as e:
+        raise ParseError(f"bad json: {e}") from None
+
+
+def parse_payload(raw):
+    """Sample из байтов ответа машины."""
+    return parse_sample(decode(raw))
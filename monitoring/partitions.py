@@ -0,0 +1,215 @@
+# monitoring/partitions.py
+"""
+Секционирование таблицы Metric по received_at (только MySQL, по желанию).
+
+MONITORING_METRIC_PARTITIONING = "daily" | "weekly" ("" — выключено).
+Таблица делится PARTITION BY RANGE COLUMNS(received_at) на секции p<YYYYMMDD>
+(по дате начала периода, UTC — в UTC Django хранит время в MySQL) и pmax
+(MAXVALUE) — в неё попадут строки, если обслуживание не успело создать секцию.
+
+- enable() — разовое преобразование существующей таблицы. ALTER TABLE
+  перестраивает её целиком, запускать в окно обслуживания (partition_metrics --enable);
+- maintain() — ежедневно, вместе с очисткой (tasks.purge_expired_data):
+  создаёт секции на MONITORING_PARTITION_AHEAD_DAYS вперёд (REORGANIZE пустой pmax —
+  только метаданные) и удаляет секции, целиком старше срока хранения:
+  DROP PARTITION за O(1) вместо удаления строк порциями.
+  Срок хранения выдерживается с точностью до периода секции.
+
+Ограничения MySQL для секционированных таблиц:
+- каждый уникальный ключ содержит received_at — первичный ключ становится
+  (id, received_at); для Django первичным ключом остаётся id (он уникален
+  благодаря AUTO_INCREMENT, поиск по id идёт по префиксу ключа);
+- внешние ключи не поддерживаются — ограничение machine_id снимается,
+  каскадное удаление метрик машины Django выполняет сам.
+
+MySQL читает только нужные секции, если запрос ограничивает received_at:
+окна правил (evaluation.load_windows), ряды (series) и пересчёт агрегатов
+(rollups) так и делают.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Metric
+
+logger = logging.getLogger(__name__)
+
+SCHEMES = {"daily": timedelta(days=1), "weekly": timedelta(days=7)}
+MAXVALUE = "pmax"
+_BOUND_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def _table():
+    return connection.ops.quote_name(Metric._meta.db_table)
+
+
+def enabled():
+    return bool(settings.MONITORING_METRIC_PARTITIONING) and connection.vendor == "mysql"
+
+
+def scheme_step(scheme=None):
+    scheme = scheme or settings.MONITORING_METRIC_PARTITIONING
+    if scheme not in SCHEMES:
+        raise PartitioningError(f"unknown partitioning scheme {scheme!r}, expected one of {', '.join(SCHEMES)}")
+    return SCHEMES[scheme]
+
+
+def period_start(dt, step):
+    """Начало периода (UTC) с моментом dt: полночь, для недель — понедельник."""
+    day = dt.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if step == SCHEMES["weekly"]:
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def _partition(start, step):
+    bound = (start + step).strftime(_BOUND_FORMAT)
+    return f"PARTITION p{start:%Y%m%d} VALUES LESS THAN ('{bound}')"
+
+
+def _partitions(first, last, step):
+    """Определения секций с началами first, first + step, ..., last."""
+    out = []
+    while first <= last:
+        out.append(_partition(first, step))
+        first += step
+    return out
+
+
+def existing():
+    """[(имя, верхняя граница или None для MAXVALUE, строк по оценке)] по порядку; [] — таблица не секционирована."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS"
+            " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL"
+            " ORDER BY PARTITION_ORDINAL_POSITION",
+            [Metric._meta.db_table],
+        )
+        rows = cursor.fetchall()
+    out = []
+    for name, description, table_rows in rows:
+        bound = None
+        if description != "MAXVALUE":
+            bound = datetime.strptime(description.strip("'")[:19], _BOUND_FORMAT).replace(tzinfo=dt_timezone.utc)
+        out.append((name, bound, table_rows or 0))
+    return out
+
+
+def _require_mysql():
+    if connection.vendor != "mysql":
+        raise PartitioningError(f"partitioning requires MySQL, not {connection.vendor}")
+
+
+def enable(scheme=None, retention_days=None, ahead_days=None):
+    """
+    Разовое преобразование таблицы: снять внешние ключи, первичный ключ (id, received_at),
+    секции от самой старой хранимой строки до ahead_days вперёд. Возвращает число секций.
+    """
+    _require_mysql()
+    if existing():
+        raise PartitioningError("metrics table is already partitioned")
+    step = scheme_step(scheme)
+    retention_days = settings.MONITORING_METRIC_RETENTION_DAYS if retention_days is None else retention_days
+    ahead_days = settings.MONITORING_PARTITION_AHEAD_DAYS if ahead_days is None else ahead_days
+    now = timezone.now()
+    table = _table()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS"
+            " WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [Metric._meta.db_table],
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {connection.ops.quote_name(name)}")
+        cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, received_at)")
+        cursor.execute(f"SELECT MIN(received_at) FROM {table}")
+        oldest = cursor.fetchone()[0]
+
+        # первая секция принимает и всё, что старше её начала (такие строки уйдут с ней)
+        first = now - timedelta(days=retention_days)
+        if oldest is not None:
+            oldest = oldest.replace(tzinfo=dt_timezone.utc) if timezone.is_naive(oldest) else oldest
+            first = max(min(first, oldest), now - timedelta(days=retention_days * 2))
+        parts = _partitions(period_start(first, step), period_start(now + timedelta(days=ahead_days), step), step)
+        parts.append(f"PARTITION {MAXVALUE} VALUES LESS THAN (MAXVALUE)")
+        cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(received_at) ({', '.join(parts)})")
+    logger.info("partitions: metrics table partitioned into %s partitions", len(parts))
+    return len(parts)
+
+
+def disable():
+    """Обратное преобразование: одна таблица, первичный ключ (id), внешний ключ на машину."""
+    _require_mysql()
+    table = _table()
+    machine_table = connection.ops.quote_name(Metric._meta.get_field("machine").related_model._meta.db_table)
+    with connection.cursor() as cursor:
+        if existing():
+            cursor.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+        cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {connection.ops.quote_name(Metric._meta.db_table + '_machine_fk')}"
+            f" FOREIGN KEY (machine_id) REFERENCES {machine_table} (id)"
+        )
+    logger.info("partitions: metrics table is no longer partitioned")
+
+
+def plan(parts, now, step, retention_days, ahead_days):
+    """
+    Что сделает maintain() с секциями parts (формат existing()):
+    (определения новых секций перед pmax, [(имя, строк по оценке)] удаляемых).
+    """
+    bounds = [bound for _, bound, _ in parts if bound is not None]
+    created = []
+    if bounds and parts[-1][0] == MAXVALUE:
+        created = _partitions(bounds[-1], period_start(now + timedelta(days=ahead_days), step), step)
+    cutoff = now - timedelta(days=retention_days)
+    # секция с границей <= cutoff целиком старше срока хранения; последняя не удаляется никогда
+    expired = [(name, rows) for name, bound, rows in parts[:-1] if bound is not None and bound <= cutoff]
+    return created, expired
+
+
+def maintain(retention_days=None, ahead_days=None, scheme=None):
+    """
+    Секции вперёд и удаление устаревших. Возвращает отчёт;
+    None — таблица не секционирована (очистка идёт построчно, см. monitoring.retention).
+    """
+    _require_mysql()
+    parts = existing()
+    if not parts:
+        return None
+    step = scheme_step(scheme)
+    retention_days = settings.MONITORING_METRIC_RETENTION_DAYS if retention_days is None else retention_days
+    ahead_days = settings.MONITORING_PARTITION_AHEAD_DAYS if ahead_days is None else ahead_days
+    table = _table()
+    created, expired = plan(parts, timezone.now(), step, retention_days, ahead_days)
+    if created:
+        # pmax обычно пуста, и REORGANIZE меняет только метаданные
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {table} REORGANIZE PARTITION {MAXVALUE} INTO"
+                f" ({', '.join(created)}, PARTITION {MAXVALUE} VALUES LESS THAN (MAXVALUE))"
+            )
+
+    if expired:
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(name for name, _ in expired)}")
+
+    report = {
+        "partitions": len(parts) + len(created) - len(expired),
+        "created": len(created),
+        "dropped": len(expired),
+        "rows_dropped_estimate": sum(rows for _, rows in expired),
+    }
+    logger.info(
+        "partitions: created %s, dropped %s (~%s rows), %s partitions now",
+        report["created"], report["dropped"], report["rows_dropped_estimate"], report["partitions"],
+    )
+    return report
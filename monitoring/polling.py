@@ -0,0 +1,88 @@
+# monitoring/polling.py
+"""
+Адаптивное расписание опроса машин (режим pull).
+
+У каждой машины есть next_poll_at и poll_failures. Beat раз в минуту запускает
+schedule_fetch_all, а тот берёт только машины, у которых next_poll_at наступил:
+- успешный опрос — poll_failures = 0, следующий через MONITORING_POLL_INTERVAL_SEC,
+  а при активном инциденте — через MONITORING_POLL_INCIDENT_INTERVAL_SEC (0 — как обычно);
+- неудача — интервал удваивается с каждой неудачей подряд;
+- после MONITORING_POLL_CIRCUIT_FAILURES неудач подряд цепь «размыкается»:
+  машина проверяется одной пробой раз в MONITORING_POLL_CIRCUIT_COOLDOWN_SEC,
+  пока не ответит, и не тратит таймаут в каждом проходе.
+Время следующего опроса отсчитывается от минуты запуска (tick), а не от конца
+опроса, поэтому расписание не «уплывает» на длительность прохода.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Incident, Machine
+
+logger = logging.getLogger(__name__)
+
+
+def current_tick(now):
+    return now.replace(second=0, microsecond=0)
+
+
+def next_delay(failures, has_incident=False):
+    """Через сколько секунд опрашивать машину после failures неудач подряд."""
+    base = settings.MONITORING_POLL_INTERVAL_SEC
+    cooldown = settings.MONITORING_POLL_CIRCUIT_COOLDOWN_SEC
+    if failures >= settings.MONITORING_POLL_CIRCUIT_FAILURES:
+        return cooldown
+    if failures:
+        return min(base * 2 ** failures, cooldown)
+    if has_incident and settings.MONITORING_POLL_INCIDENT_INTERVAL_SEC:
+        return min(base, settings.MONITORING_POLL_INCIDENT_INTERVAL_SEC)
+    return base
+
+
+def claim_due(tick, chunk_size=1000):
+    """
+    id активных pull-машин, которым пора опрашиваться. Им сразу сдвигается
+    next_poll_at на обычный интервал — пока идёт опрос, следующий tick их не возьмёт,
+    а если шард потеряется, машина вернётся в очередь сама.
+    """
+    ids = list(
+        Machine.objects.filter(active=True, collection_mode=Machine.Mode.PULL)
+        .filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=tick))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    lease = tick + timedelta(seconds=settings.MONITORING_POLL_INTERVAL_SEC)
+    for i in range(0, len(ids), chunk_size):
+        Machine.objects.filter(id__in=ids[i:i + chunk_size]).update(next_poll_at=lease)
+    return ids
+
+
+def record(outcomes, failures, tick):
+    """
+    Обновляет расписание по итогам опроса.
+    outcomes — {machine_id: успех?}, failures — {machine_id: poll_failures до опроса}.
+    Машины с одинаковым результатом обновляются одним UPDATE на группу.
+    """
+    with_incident = set()
+    if settings.MONITORING_POLL_INCIDENT_INTERVAL_SEC:
+        with_incident = set(
+            Incident.objects.filter(machine_id__in=[mid for mid, ok in outcomes.items() if ok], is_active=True)
+            .values_list("machine_id", flat=True)
+        )
+
+    groups = defaultdict(list)  # (новое poll_failures, задержка) -> [machine_id]
+    for mid, ok in outcomes.items():
+        count = 0 if ok else failures.get(mid, 0) + 1
+        groups[(count, next_delay(count, mid in with_incident))].append(mid)
+        if count == settings.MONITORING_POLL_CIRCUIT_FAILURES:
+            logger.warning("polling: machine %s failed %s times in a row, circuit open", mid, count)
+        elif ok and failures.get(mid, 0) >= settings.MONITORING_POLL_CIRCUIT_FAILURES:
+            logger.info("polling: machine %s is back, circuit closed", mid)
+
+    for (count, delay), ids in groups.items():
+        Machine.objects.filter(id__in=ids).update(
+            poll_failures=count, next_poll_at=tick + timedelta(seconds=delay)
+        )
@@ -0,0 +1,134 @@
+# monitoring/retention.py
+"""
+Удаление устаревших данных небольшими порциями.
+
+Один DELETE по всей таблице Metric держит блокировки InnoDB минутами и раздувает
+undo log, мешая задачам сбора. Поэтому:
+- верхняя граница по id — id самой поздней устаревшей строки, один запрос по
+  индексу received_at (строка, вставленная позже с более старым временем,
+  удалится в один из следующих запусков, когда граница её догонит);
+- удаление идёт диапазонами первичного ключа [lo, lo + batch_size),
+  каждый диапазон — отдельная короткая транзакция;
+- между порциями пауза, общий бюджет времени на запуск ограничен —
+  недоделанное продолжится в следующий раз.
+Агрегаты (MetricHourly / MetricDaily) не удаляются.
+
+Закрытые инциденты удаляются без post_delete на каждую строку (на него
+подписана лента, см. monitoring.feed): лента оповещается один раз на порцию.
+
+Если таблица метрик секционирована (см. monitoring.partitions), устаревшие
+метрики удаляются целыми секциями, а построчная очистка не нужна.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import feed, partitions
+from .models import Incident, Metric
+
+logger = logging.getLogger(__name__)
+
+
+class _Budget:
+    def __init__(self, seconds, pause):
+        self.deadline = time.monotonic() + seconds
+        self.pause = pause
+
+    def left(self):
+        return time.monotonic() < self.deadline
+
+    def sleep(self):
+        if self.pause:
+            time.sleep(self.pause)
+
+
+def _metric_id_bounds(cutoff):
+    """[min id, id самой поздней устаревшей строки] или None, если удалять нечего."""
+    first = Metric.objects.order_by("id").values_list("id", flat=True).first()
+    if first is None:
+        return None
+    upper = (
+        Metric.objects.filter(received_at__lt=cutoff)
+        .order_by("-received_at", "-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    return None if upper is None else (first, upper)
+
+
+def purge_metrics(cutoff, batch_size, budget):
+    bounds = _metric_id_bounds(cutoff)
+    if bounds is None:
+        return 0, True
+    lo, upper = bounds
+    deleted = 0
+    while lo <= upper:
+        if not budget.left():
+            return deleted, False
+        hi = lo + batch_size
+        # received_at в условии — на случай строк, вставленных не по порядку времени
+        n, _ = Metric.objects.filter(id__gte=lo, id__lt=hi, received_at__lt=cutoff).delete()
+        deleted += n
+        lo = hi
+        if n:
+            budget.sleep()
+    return deleted, True
+
+
+def purge_incidents(cutoff, batch_size, budget):
+    deleted = 0
+    while budget.left():
+        ids = list(
+            Incident.objects.filter(started_at__lt=cutoff, is_active=False, resolved_at__lt=cutoff)
+            .order_by("started_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted, True
+        # у Incident нет зависимых строк, так что обход delete() со сбором связей не нужен
+        n = Incident.objects.filter(id__in=ids)._raw_delete(Incident.objects.db)
+        feed.bump_version()
+        deleted += n
+        budget.sleep()
+    return deleted, False
+
+
+def purge_expired(metric_days=None, incident_days=None, batch_size=None, pause=None, time_budget=None):
+    """Удаляет устаревшие метрики и закрытые инциденты. Возвращает отчёт."""
+    # 0 дней — явное «удалить всё, что старше текущего момента», а не значение по умолчанию
+    metric_days = settings.MONITORING_METRIC_RETENTION_DAYS if metric_days is None else metric_days
+    incident_days = settings.MONITORING_INCIDENT_RETENTION_DAYS if incident_days is None else incident_days
+    batch_size = batch_size or settings.MONITORING_PURGE_BATCH_SIZE
+    pause = settings.MONITORING_PURGE_PAUSE if pause is None else pause
+    time_budget = time_budget or settings.MONITORING_PURGE_TIME_BUDGET
+
+    started = time.monotonic()
+    budget = _Budget(time_budget, pause)
+    now = timezone.now()
+    dropped = None
+    if partitions.enabled():
+        dropped = partitions.maintain(retention_days=metric_days)
+        if dropped is None:
+            logger.warning("retention: metric partitioning is enabled but the table is not partitioned yet")
+    if dropped is None:
+        metrics, metrics_done = purge_metrics(now - timedelta(days=metric_days), batch_size, budget)
+    else:
+        metrics, metrics_done = dropped["rows_dropped_estimate"], True
+    incidents, incidents_done = purge_incidents(now - timedelta(days=incident_days), batch_size, budget)
+
+    report = {
+        "metrics_deleted": metrics,
+        "incidents_deleted": incidents,
+        "seconds": round(time.monotonic() - started, 3),
+        "complete": metrics_done and incidents_done,
+    }
+    if dropped is not None:
+        report["partitions"] = dropped
+    logger.info(
+        "retention: deleted %s metrics and %s incidents in %.1fs%s",
+        metrics, incidents, report["seconds"], "" if report["complete"] else " (time budget exhausted)",
+    )
+    return report
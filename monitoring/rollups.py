@@ -0,0 +1,176 @@
+# monitoring/rollups.py
+"""
+Часовые и дневные агрегаты метрик (MetricHourly / MetricDaily).
+
+Обновление инкрементальное: берутся только строки Metric с id больше
+водяного знака (RollupWatermark), по ним определяются затронутые часы,
+и только эти часы пересчитываются из сырых строк (диапазонный запрос по
+индексу (machine, received_at)). Дневные агрегаты пересчитываются из часовых:
+min/max/avg/samples точные, p95 — взвешенный 95-й перцентиль часовых p95
+(приближение, зато без повторного чтения сырых строк за весь день).
+
+Строки моложе MONITORING_ROLLUP_LAG секунд не берутся, чтобы не перепрыгнуть
+id ещё не закоммиченных вставок: водяной знак останавливается перед первой
+(по id) такой строкой и дальше неё не сдвигается.
+"""
+import logging
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Metric, MetricDaily, MetricHourly, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+# префикс поля агрегата -> поле Metric
+SERIES = (("cpu", "cpu"), ("mem", "mem_percent"), ("disk", "disk_percent"))
+AGGREGATES = ("min", "max", "avg", "p95")
+ROLLUP_FIELDS = ["samples"] + [f"{p}_{a}" for p, _ in SERIES for a in AGGREGATES]
+
+WATERMARK = "metric"
+
+
+def hour_start(dt):
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(dt):
+    return timezone.localtime(dt).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def percentile(values, q):
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def weighted_percentile(pairs, q):
+    """pairs — [(value, weight)]."""
+    pairs = sorted(pairs)
+    target = q * sum(w for _, w in pairs)
+    acc = 0
+    for value, weight in pairs:
+        acc += weight
+        if acc >= target:
+            return value
+    return pairs[-1][0]
+
+
+def _from_raw(points):
+    """points — [(cpu, mem, disk)] одного бакета."""
+    out = {"samples": len(points)}
+    for i, (prefix, _) in enumerate(SERIES):
+        values = sorted(p[i] for p in points)
+        out[f"{prefix}_min"] = values[0]
+        out[f"{prefix}_max"] = values[-1]
+        out[f"{prefix}_avg"] = sum(values) / len(values)
+        out[f"{prefix}_p95"] = percentile(values, 0.95)
+    return out
+
+
+def _from_hourly(hours):
+    samples = sum(h.samples for h in hours)
+    out = {"samples": samples}
+    for prefix, _ in SERIES:
+        out[f"{prefix}_min"] = min(getattr(h, f"{prefix}_min") for h in hours)
+        out[f"{prefix}_max"] = max(getattr(h, f"{prefix}_max") for h in hours)
+        out[f"{prefix}_avg"] = sum(getattr(h, f"{prefix}_avg") * h.samples for h in hours) / samples
+        out[f"{prefix}_p95"] = weighted_percentile([(getattr(h, f"{prefix}_p95"), h.samples) for h in hours], 0.95)
+    return out
+
+
+def _upsert(model, objs):
+    model.objects.bulk_create(
+        objs,
+        batch_size=1000,
+        update_conflicts=True,
+        # MySQL не указывает цель конфликта: ON DUPLICATE KEY срабатывает по уникальному ключу
+        unique_fields=["machine", "bucket_start"] if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=ROLLUP_FIELDS,
+    )
+    return len(objs)
+
+
+def _rebuild_hourly(buckets):
+    machine_ids = {mid for mid, _ in buckets}
+    starts = [start for _, start in buckets]
+    rows = (
+        Metric.objects.filter(
+            machine_id__in=machine_ids,
+            received_at__gte=min(starts),
+            received_at__lt=max(starts) + timedelta(hours=1),
+        )
+        .order_by()
+        .values_list("machine_id", "received_at", *[f for _, f in SERIES])
+    )
+    grouped = defaultdict(list)
+    for mid, at, *values in rows:
+        key = (mid, hour_start(at))
+        if key in buckets:
+            grouped[key].append(values)
+    return _upsert(MetricHourly, [
+        MetricHourly(machine_id=mid, bucket_start=start, **_from_raw(points))
+        for (mid, start), points in grouped.items()
+    ])
+
+
+def _rebuild_daily(buckets):
+    machine_ids = {mid for mid, _ in buckets}
+    starts = [start for _, start in buckets]
+    hours = MetricHourly.objects.filter(
+        machine_id__in=machine_ids,
+        bucket_start__gte=min(starts),
+        bucket_start__lt=max(starts) + timedelta(days=1),
+    ).order_by()
+    grouped = defaultdict(list)
+    for h in hours:
+        key = (h.machine_id, day_start(h.bucket_start))
+        if key in buckets:
+            grouped[key].append(h)
+    return _upsert(MetricDaily, [
+        MetricDaily(machine_id=mid, bucket_start=start, **_from_hourly(items))
+        for (mid, start), items in grouped.items()
+    ])
+
+
+def update_rollups(batch_size=None, lag=None):
+    """Досчитывает агрегаты по новым строкам Metric. Возвращает отчёт."""
+    batch_size = batch_size or settings.MONITORING_ROLLUP_BATCH_SIZE
+    lag = settings.MONITORING_ROLLUP_LAG if lag is None else lag
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+
+    report = {"rows": 0, "hourly": 0, "daily": 0}
+    while True:
+        new = list(
+            Metric.objects.filter(id__gt=watermark.last_metric_id)
+            .order_by("id")
+            .values_list("id", "machine_id", "received_at")[:batch_size]
+        )
+        fetched = len(new)
+        # шарды пишут пачки не по порядку времени: строка новее cutoff может стоять
+        # перед более старыми — водяной знак останавливается перед ней, иначе она
+        # осталась бы позади него навсегда
+        fresh = next((n for n, (_, _, at) in enumerate(new) if at > cutoff), None)
+        if fresh is not None:
+            new = new[:fresh]
+        if not new:
+            break
+        hours = {(mid, hour_start(at)) for _, mid, at in new}
+        report["hourly"] += _rebuild_hourly(hours)
+        report["daily"] += _rebuild_daily({(mid, day_start(start)) for mid, start in hours})
+
+        watermark.last_metric_id = new[-1][0]
+        watermark.save(update_fields=["last_metric_id", "updated_at"])
+        report["rows"] += len(new)
+        if fresh is not None or fetched < batch_size:
+            break
+
+    logger.info(
+        "rollups: %s new rows, %s hourly and %s daily buckets updated",
+        report["rows"], report["hourly"], report["daily"],
+    )
+    return report
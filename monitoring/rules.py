@@ -0,0 +1,203 @@
+# monitoring/rules.py
+"""
+Движок правил инцидентов.
+
+Правила хранятся в БД (IncidentRule + IncidentRuleOverride) и компилируются
+в RuleSet: для каждого правила заранее выбраны колонка, оператор сравнения,
+окно и пороги по машинам. Окно правила — это время по received_at, а не число
+сэмплов: машины опрашиваются с разным интервалом (см. monitoring.polling),
+пропуски опроса не растягивают и не сжимают окно. Компиляция делается один раз при
+старте воркера и затем не чаще раза в MONITORING_RULES_TTL секунд (или сразу
+после изменения правил в этом процессе), так что число запросов к БД
+не зависит ни от количества правил, ни от количества машин.
+"""
+import logging
+import operator
+import time
+from dataclasses import dataclass, field
+
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import IncidentRule, IncidentRuleOverride
+
+logger = logging.getLogger(__name__)
+
+# Позиции полей в кортеже точки окна: (cpu, mem_percent, disk_percent, received_at)
+COLUMNS = {"cpu": 0, "mem_percent": 1, "disk_percent": 2}
+AT = 3
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# Погрешность сравнения покрытого времени с окном: моменты опроса «плавают» на секунды
+WINDOW_TOLERANCE_SEC = 60
+
+
+def sample_interval():
+    """Номинальный интервал опроса (сек) — столько «покрывает» точка без известной предыдущей."""
+    return settings.MONITORING_POLL_INTERVAL_SEC
+
+
+def max_gap():
+    """Разрыв между соседними точками больше этого прерывает серию нарушений."""
+    return settings.MONITORING_WINDOW_MAX_GAP_MIN * 60
+
+
+def coverage(at, prev_at):
+    """
+    Сколько секунд представляет точка: время с предыдущей точки машины.
+    Возвращает (секунды, непрерывно ли с предыдущей); без предыдущей или после
+    разрыва — номинальный интервал.
+    """
+    if prev_at is None:
+        return sample_interval(), False
+    delta = (at - prev_at).total_seconds()
+    if delta > max_gap():
+        return sample_interval(), False
+    return delta, True
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    code: str
+    metric: str
+    col: int
+    op: object
+    threshold: float
+    window_min: int
+    # machine_id -> свой порог; None — правило для машины выключено
+    overrides: dict = field(default_factory=dict)
+
+    def threshold_for(self, machine_id):
+        return self.overrides.get(machine_id, self.threshold)
+
+    def satisfied(self, covered):
+        """Серия нарушений, покрывающая covered секунд, — уже инцидент?"""
+        return not self.window_min or covered >= self.window_min * 60 - WINDOW_TOLERANCE_SEC
+
+    def details(self, points, samples=1):
+        if not self.window_min:
+            return {self.metric: points[0][self.col], "at": points[0][AT].isoformat()}
+        return {"window_min": self.window_min, "samples": samples}
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        # сколько секунд истории нужно для проверки: самое длинное окно плюс запас
+        # на предыдущую точку самой старой точки серии и на свежесть последней
+        self.span = max((r.window_min * 60 for r in self.rules), default=0) + 2 * max_gap()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __eq__(self, other):
+        return isinstance(other, RuleSet) and self.rules == other.rules
+
+    __hash__ = None
+
+    def needs_history(self, machine_id, point):
+        """
+        Нужны ли точки кроме последней: только если последняя нарушает правило с окном.
+        Серия нарушений всегда заканчивается последней точкой, поэтому иначе
+        evaluate по одной последней точке даёт тот же результат.
+        """
+        for rule in self.rules:
+            threshold = rule.threshold_for(machine_id)
+            if rule.window_min and threshold is not None and rule.op(point[rule.col], threshold):
+                return True
+        return False
+
+    def evaluate(self, machine_id, points):
+        """
+        Проверяет все правила за один проход по точкам машины (свежие первыми).
+        Правило нарушено, если его условие выполняется на последних точках,
+        которые вместе покрывают не меньше window_min минут по received_at
+        (каждая точка — время с предыдущей; разрыв больше max_gap() прерывает серию).
+        Возвращает {code: details} для нарушенных правил.
+        """
+        live = []
+        for rule in self.rules:
+            threshold = rule.threshold_for(machine_id)
+            if threshold is not None:
+                live.append((rule, threshold))
+
+        found = {}
+        covered = 0.0
+        for i, point in enumerate(points):
+            if not live:
+                break
+            prev_at = points[i + 1][AT] if i + 1 < len(points) else None
+            seconds, contiguous = coverage(point[AT], prev_at)
+            covered += seconds
+            still = []
+            for rule, threshold in live:
+                if not rule.op(point[rule.col], threshold):
+                    continue  # серия нарушений прервалась
+                if rule.satisfied(covered):
+                    found[rule.code] = rule.details(points, i + 1)
+                elif contiguous:
+                    still.append((rule, threshold))
+            live = still
+        return found
+
+
+def compile_rules():
+    overrides = {}
+    for o in IncidentRuleOverride.objects.all():
+        value = o.threshold if o.enabled else None
+        if o.enabled and value is None:
+            continue
+        overrides.setdefault(o.rule_id, {})[o.machine_id] = value
+
+    compiled = [
+        CompiledRule(
+            code=r.code,
+            metric=r.metric,
+            col=COLUMNS[r.metric],
+            op=OPERATORS[r.comparator],
+            threshold=r.threshold,
+            window_min=r.window_min,
+            overrides=overrides.get(r.id, {}),
+        )
+        for r in IncidentRule.objects.filter(enabled=True).order_by("id")
+    ]
+    logger.info("rules: compiled %s incident rules", len(compiled))
+    return RuleSet(compiled)
+
+
+_cache = {"ruleset": None, "loaded_at": 0.0}
+
+
+def get_ruleset():
+    ruleset = _cache["ruleset"]
+    if ruleset is None or time.monotonic() - _cache["loaded_at"] > settings.MONITORING_RULES_TTL:
+        ruleset = compile_rules()
+        _cache.update(ruleset=ruleset, loaded_at=time.monotonic())
+    return ruleset
+
+
+def invalidate_rules():
+    _cache["ruleset"] = None
+
+
+@receiver([post_save, post_delete], sender=IncidentRule)
+@receiver([post_save, post_delete], sender=IncidentRuleOverride)
+def _rules_changed(**kwargs):
+    invalidate_rules()
+
+
+@worker_process_init.connect
+def _warm_rules(**kwargs):
+    try:
+        get_ruleset()
+    except DatabaseError as e:  # БД ещё не готова — скомпилируем при первой проверке
+        logger.warning("rules: cannot compile on worker start: %s", e)
@@ -0,0 +1,110 @@
+# monitoring/series.py
+"""
+Временные ряды метрик для графиков с прореживанием на сервере.
+
+Шаг бакета выбирается из фиксированной сетки (1м … 1н) так, чтобы на диапазон
+пришлось не больше points точек. Источник зависит от шага:
+- шаг < 1 ч   → сырые Metric (короткие диапазоны, строк немного);
+- шаг < 1 сут → MetricHourly;
+- иначе       → MetricDaily.
+Так 30-дневный график читает сотни агрегированных строк, а не десятки тысяч
+сырых; досвёртка до шага в Python идёт по уже агрегированным строкам.
+Границы бакетов выровнены по сетке шага (в локальном часовом поясе),
+поэтому повторные запросы одного диапазона дают одинаковый ключ кэша.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import Metric, MetricDaily, MetricHourly
+
+STEPS = [60, 300, 900, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400]
+AGGS = ("avg", "max")
+# имя ряда в ответе -> поле Metric / префикс полей агрегатов
+SERIES = {"cpu": ("cpu", "cpu"), "mem": ("mem_percent", "mem"), "disk": ("disk_percent", "disk")}
+
+
+def choose_step(span_sec, points):
+    target = span_sec / max(1, points)
+    for step in STEPS:
+        if step >= target:
+            return step
+    return STEPS[-1]
+
+
+def source_for(step):
+    if step >= 86400:
+        return "daily"
+    if step >= 3600:
+        return "hourly"
+    return "raw"
+
+
+class Grid:
+    """Выравнивание времени по сетке шага с учётом смещения локального пояса."""
+
+    def __init__(self, step, at):
+        self.step = step
+        self.offset = int(timezone.localtime(at).utcoffset().total_seconds())
+
+    def floor(self, epoch):
+        return (epoch + self.offset) // self.step * self.step - self.offset
+
+    def ceil(self, epoch):
+        return self.floor(epoch + self.step - 1)
+
+
+def align(start, end, points):
+    """Возвращает (grid, start_epoch, end_epoch) — границы, выровненные по шагу."""
+    grid = Grid(choose_step((end - start).total_seconds(), points), end)
+    return grid, grid.floor(int(start.timestamp())), grid.ceil(int(end.timestamp()))
+
+
+def _rows(source, machine_ids, start, end, agg):
+    """Строки (machine_id, время, вес, cpu, mem, disk) из выбранного источника."""
+    if source == "raw":
+        qs = Metric.objects.filter(machine_id__in=machine_ids, received_at__gte=start, received_at__lt=end)
+        return qs.order_by().values_list("machine_id", "received_at", *[f for f, _ in SERIES.values()]), False
+    model = MetricDaily if source == "daily" else MetricHourly
+    qs = model.objects.filter(machine_id__in=machine_ids, bucket_start__gte=start, bucket_start__lt=end)
+    fields = [f"{prefix}_{agg}" for _, prefix in SERIES.values()]
+    return qs.order_by().values_list("machine_id", "bucket_start", "samples", *fields), True
+
+
+def downsample(machine_ids, start, end, points, agg="avg"):
+    grid, lo, hi = align(start, end, points)
+    step = grid.step
+    source = source_for(step)
+    start_dt = datetime.fromtimestamp(lo, tz=dt_timezone.utc)
+    end_dt = start_dt + timedelta(seconds=hi - lo)
+    rows, weighted = _rows(source, machine_ids, start_dt, end_dt, agg)
+
+    n = len(SERIES)
+    # machine_id -> бакет -> [вес, значения...]
+    acc = defaultdict(dict)
+    for row in rows:
+        mid, at = row[0], row[1]
+        weight, values = (row[2], row[3:]) if weighted else (1, row[2:])
+        b = grid.floor(int(at.timestamp()))
+        cell = acc[mid].get(b)
+        if cell is None:
+            cell = acc[mid][b] = [0] + ([0.0] * n if agg == "avg" else [None] * n)
+        cell[0] += weight
+        for i, v in enumerate(values, start=1):
+            if agg == "avg":
+                cell[i] += v * weight
+            elif cell[i] is None or v > cell[i]:
+                cell[i] = v
+
+    series = {}
+    for mid in machine_ids:
+        buckets = sorted(acc.get(mid, {}).items())
+        out = {"t": [b for b, _ in buckets]}
+        for i, name in enumerate(SERIES, start=1):
+            if agg == "avg":
+                out[name] = [round(c[i] / c[0], 2) for _, c in buckets]
+            else:
+                out[name] = [round(c[i], 2) for _, c in buckets]
+        series[mid] = out
+    return {"step": step, "source": source, "from": lo, "to": hi, "agg": agg, "series": series}
@@ -0,0 +1,104 @@
+# monitoring/state.py
+"""
+Последнее известное состояние машин (MachineState) — текущие значения без
+чтения Metric.
+
+- record_samples — вызывается MetricBuffer.flush в той же транзакции, что и
+  bulk_create метрик: состояние никогда не расходится с таблицей Metric;
+- record_failures — неудачные опросы (таймаут, HTTP-ошибка, некорректный ответ):
+  время попытки и текст ошибки, последние значения остаются;
+- rebuild — пересчёт из Metric для машин, метрики которых записаны в обход
+  MetricBuffer (загрузка истории, демо-данные).
+Запись — upsert пачкой (bulk_create с обработкой конфликта по machine),
+чтение всего парка — один запрос по первичному ключу.
+"""
+import logging
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Machine, MachineState, Metric
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FIELDS = ["cpu", "mem_percent", "disk_percent", "uptime_sec", "sampled_at", "fetched_at", "last_error"]
+ERROR_FIELDS = ["fetched_at", "last_error", "last_error_at"]
+ERROR_MAX = MachineState._meta.get_field("last_error").max_length
+
+
+def _upsert(states, fields):
+    MachineState.objects.bulk_create(
+        states,
+        batch_size=1000,
+        update_conflicts=True,
+        # MySQL не указывает цель конфликта: ON DUPLICATE KEY срабатывает по первичному ключу
+        unique_fields=["machine"] if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=fields,
+    )
+
+
+def record_samples(metrics):
+    """
+    Последний по received_at сэмпл каждой машины из пачки записанных Metric.
+    Сэмплы старше уже записанного состояния (push с "at" из буфера агента)
+    состояние не откатывают.
+    """
+    latest = {}
+    for m in metrics:
+        if m.machine_id not in latest or m.received_at >= latest[m.machine_id].received_at:
+            latest[m.machine_id] = m
+    current = dict(
+        MachineState.objects.filter(machine_id__in=list(latest), sampled_at__isnull=False)
+        .values_list("machine_id", "sampled_at")
+    )
+    latest = {mid: m for mid, m in latest.items() if mid not in current or m.received_at >= current[mid]}
+    _upsert([
+        MachineState(
+            machine_id=mid, cpu=m.cpu, mem_percent=m.mem_percent, disk_percent=m.disk_percent,
+            uptime_sec=m.uptime_sec, sampled_at=m.received_at, fetched_at=m.received_at, last_error="",
+        )
+        for mid, m in latest.items()
+    ], SAMPLE_FIELDS)
+
+
+def record_failures(errors, at=None):
+    """errors — {machine_id: текст ошибки} по неудачным опросам."""
+    if not errors:
+        return
+    at = at or timezone.now()
+    _upsert([
+        MachineState(machine_id=mid, fetched_at=at, last_error=error[:ERROR_MAX], last_error_at=at)
+        for mid, error in errors.items()
+    ], ERROR_FIELDS)
+
+
+def rebuild(machine_ids):
+    """Состояние из последней строки Metric каждой машины (запрос на машину, по индексу)."""
+    states = []
+    for mid in machine_ids:
+        last = (
+            Metric.objects.filter(machine_id=mid)
+            .order_by("-received_at")
+            .values_list("cpu", "mem_percent", "disk_percent", "uptime_sec", "received_at")
+            .first()
+        )
+        if last is not None:
+            cpu, mem, disk, uptime, at = last
+            states.append(MachineState(
+                machine_id=mid, cpu=cpu, mem_percent=mem, disk_percent=disk, uptime_sec=uptime,
+                sampled_at=at, fetched_at=at, last_error="",
+            ))
+    _upsert(states, SAMPLE_FIELDS)
+    logger.info("state: rebuilt %s machines from metrics", len(states))
+    return len(states)
+
+
+def load_latest():
+    """
+    Последний сэмпл каждой активной машины в формате точки окна правил:
+    {machine_id: (cpu, mem, disk, sampled_at) или None — состояния ещё нет}.
+    """
+    rows = Machine.objects.filter(active=True).values_list(
+        "id", "state__cpu", "state__mem_percent", "state__disk_percent", "state__sampled_at",
+    )
+    return {mid: (cpu, mem, disk, at) if at is not None else None for mid, cpu, mem, disk, at in rows}
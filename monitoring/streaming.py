@@ -0,0 +1,193 @@
+# monitoring/streaming.py
+"""
+Потоковое обнаружение инцидентов в момент записи метрик.
+
+Для каждой машины процесс воркера держит MachineWindow — кольцевой буфер
+точек за последние ruleset.span секунд (array('d'); при частом опросе буфер
+растёт) и текущие серии нарушений
+по каждому правилу (число точек и покрытое ими время). Новая точка обновляет
+серии за O(число правил), без чтения истории из БД; правило нарушено, когда
+серия покрывает окно правила — так же, как у пакетной проверки
+(monitoring.evaluation, RuleSet.evaluate).
+
+Состояние восстанавливается из БД:
+- при первом обращении к машине (старт воркера);
+- если последняя точка в памяти не совпадает с последней точкой в БД —
+  шард мог обрабатываться другим воркером (sync() перед шардом, один запрос).
+"""
+import logging
+import time
+from array import array
+from datetime import timedelta
+
+from django.db.models import Max
+
+from . import instrumentation
+from .evaluation import apply_transitions, diff_transitions, load_active_incidents, load_windows
+from .models import Metric
+from .rules import coverage, get_ruleset
+
+logger = logging.getLogger(__name__)
+
+
+class MachineWindow:
+    """Кольцевой буфер точек машины за последние span секунд и серии нарушений по правилам."""
+    __slots__ = ("span", "size", "values", "times", "head", "count", "runs")
+
+    INITIAL_SIZE = 16
+
+    def __init__(self, span, size=INITIAL_SIZE):
+        self.span = timedelta(seconds=span)
+        self.size = size
+        self.values = array("d", bytes(8 * 3 * size))  # cpu, mem, disk подряд
+        self.times = [None] * size
+        self.head = 0   # куда писать следующую точку
+        self.count = 0
+        self.runs = {}  # code -> (точек, секунд) текущей серии нарушений или None
+
+    @property
+    def last_at(self):
+        return self.times[self.head - 1] if self.count else None
+
+    def points(self):
+        """Точки за span до последней в формате evaluation.load_windows — свежие первыми."""
+        out = []
+        for k in range(1, self.count + 1):
+            i = (self.head - k) % self.size
+            if self.times[i] < self.last_at - self.span:
+                break
+            base = i * 3
+            out.append((self.values[base], self.values[base + 1], self.values[base + 2], self.times[i]))
+        return out
+
+    def _grow(self):
+        points, runs = self.points(), self.runs
+        self.__init__(self.span.total_seconds(), self.size * 2)
+        self.runs = runs
+        for point in reversed(points):
+            self._store(point)
+
+    def _store(self, point):
+        if self.count == self.size and self.times[self.head] >= point[3] - self.span:
+            # самая старая точка ещё нужна — расширяем буфер вместо перезаписи
+            self._grow()
+        base = self.head * 3
+        self.values[base], self.values[base + 1], self.values[base + 2] = point[0], point[1], point[2]
+        self.times[self.head] = point[3]
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def push(self, ruleset, machine_id, point):
+        prev_at = self.last_at
+        self._store(point)
+        self._advance(ruleset, machine_id, point, prev_at)
+
+    def _advance(self, ruleset, machine_id, point, prev_at):
+        seconds, contiguous = coverage(point[3], prev_at)
+        for rule in ruleset.rules:
+            threshold = rule.threshold_for(machine_id)
+            if threshold is not None and rule.op(point[rule.col], threshold):
+                samples, covered = (contiguous and self.runs.get(rule.code)) or (0, 0.0)
+                self.runs[rule.code] = (samples + 1, covered + seconds)
+            else:
+                self.runs[rule.code] = None
+
+    def recount(self, ruleset, machine_id):
+        """Пересчёт серий по буферу — после изменения правил с тем же span."""
+        self.runs = {}
+        prev_at = None
+        for point in reversed(self.points()):
+            self._advance(ruleset, machine_id, point, prev_at)
+            prev_at = point[3]
+
+    def breaches(self, ruleset, machine_id, latest):
+        found = {}
+        for rule in ruleset.rules:
+            run = self.runs.get(rule.code)
+            if run is not None and rule.satisfied(run[1]) and rule.threshold_for(machine_id) is not None:
+                found[rule.code] = rule.details([latest], run[0])
+        return found
+
+
+class StreamingDetector:
+    def __init__(self):
+        self.ruleset = None
+        self.windows = {}
+
+    def _refresh_rules(self):
+        ruleset = get_ruleset()
+        if ruleset == self.ruleset:
+            return ruleset
+        if self.ruleset is not None and ruleset.span == self.ruleset.span:
+            for mid, window in self.windows.items():
+                window.recount(ruleset, mid)
+        else:
+            self.windows = {}
+        self.ruleset = ruleset
+        return ruleset
+
+    def _rebuild(self, ruleset, machine_ids, now):
+        windows = load_windows(now - timedelta(seconds=ruleset.span), machine_ids)
+        for mid in machine_ids:
+            window = MachineWindow(ruleset.span)
+            for point in reversed(windows.get(mid, ())):
+                window.push(ruleset, mid, point)
+            self.windows[mid] = window
+
+    def sync(self, machine_ids, now):
+        """Сверяет состояние машин с БД (один агрегирующий запрос) и восстанавливает отставшие."""
+        ruleset = self._refresh_rules()
+        # старше окна точки всё равно не попадут в окно; граница по received_at
+        # ещё и отсекает лишние секции таблицы (см. monitoring.partitions)
+        latest = dict(
+            Metric.objects.filter(machine_id__in=machine_ids, received_at__gte=now - timedelta(seconds=ruleset.span))
+            .order_by()
+            .values("machine_id")
+            .annotate(last=Max("received_at"))
+            .values_list("machine_id", "last")
+        )
+        stale = [
+            mid for mid in machine_ids
+            if mid not in self.windows or self.windows[mid].last_at != latest.get(mid)
+        ]
+        if stale:
+            self._rebuild(ruleset, stale, now)
+        logger.info("streaming: synced %s machines, rebuilt %s", len(machine_ids), len(stale))
+
+    def process(self, metrics):
+        """
+        Обрабатывает только что записанные метрики: обновляет окна
+        и сразу открывает/закрывает инциденты по затронутым машинам.
+        """
+        if not metrics:
+            return None
+        started = time.perf_counter()
+        ruleset = self._refresh_rules()
+        now = max(m.received_at for m in metrics)
+        missing = list({m.machine_id for m in metrics if m.machine_id not in self.windows})
+        if missing:
+            # окно восстанавливается из БД уже вместе с этими метриками
+            self._rebuild(ruleset, missing, now)
+
+        latest = {}
+        for m in sorted(metrics, key=lambda x: x.received_at):
+            point = (m.cpu, m.mem_percent, m.disk_percent, m.received_at)
+            latest[m.machine_id] = point
+            window = self.windows[m.machine_id]
+            if window.last_at is not None and m.received_at <= window.last_at:
+                continue
+            window.push(ruleset, m.machine_id, point)
+
+        found = {mid: self.windows[mid].breaches(ruleset, mid, point) for mid, point in latest.items()}
+        tr = diff_transitions(found, load_active_incidents(list(found)))
+        if tr:
+            tr = apply_transitions(tr, now)
+        instrumentation.EVALUATION_DURATION.labels("streaming").observe(time.perf_counter() - started)
+        return tr
+
+
+_detector = StreamingDetector()
+
+
+def get_detector():
+    return _detector
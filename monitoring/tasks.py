@@ -1,154 +1,173 @@
 # monitoring/tasks.py
 import logging
-import requests
-from datetime import timedelta
+import time
+from datetime import datetime
+from django.conf import settings
 from django.utils import timezone
-from celery import shared_task
-from .models import Machine, Metric, Incident
+from celery import chord, shared_task
+from . import instrumentation, overview, polling, state
+from .collector import FAILED, OK, SweepStats, collect
+from .evaluation import evaluate_all, evaluation_lock
+from .ingest import MetricBuffer, detection_hook, metric_from_sample, record_parse_errors
+from .models import Machine
+from .parser import ParseError, parse_payload
+from .retention import purge_expired
+from .rollups import update_rollups
 
 logger = logging.getLogger(__name__)
 
-# Интервалы и окна анализа
-SAMPLE_INTERVAL_MIN = 15
-MEM_WINDOW_MIN = 30
-DISK_WINDOW_MIN = 120
+def _chunks(ids, size):
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
 
 
 @shared_task
 def schedule_fetch_all():
     """
     Фоновый сбор метрик с машин.
-    Каждые 15 минут Celery Beat вызывает эту задачу.
+    Celery Beat вызывает эту задачу раз в минуту; опрашиваются только машины,
+    которым пора по их собственному расписанию (см. monitoring.polling), и только
+    в режиме pull — push-машины присылают метрики сами.
+    Задача раскладывает их на шарды и запускает chord-ом: шарды выполняются
+    параллельно на всех воркерах, итог собирает finish_fetch_sweep.
     """
-    machines = Machine.objects.filter(active=True).only("id", "endpoint")
-    logger.info("schedule_fetch_all: %s machines", machines.count())
-
-    with requests.Session() as session:
-        for m in machines:
-            try:
-                resp = session.get(m.endpoint, timeout=10)
-                if resp.status_code != 200:
-                    logger.warning("non-200 from %s: %s", m.endpoint, resp.status_code)
-                    continue
-
-                data = resp.json()
-                cpu = int(data.get("cpu", 0))
-                mem = float(str(data.get("mem", "0")).rstrip("%"))
-                disk = float(str(data.get("disk", "0")).rstrip("%"))
-                uptime = str(data.get("uptime", ""))
-
-                Metric.objects.create(
-                    machine=m,
-                    cpu=cpu,
-                    mem_percent=mem,
-                    disk_percent=disk,
-                    uptime=uptime,
-                )
-                logger.info("saved metric for %s", m.name)
-
-            except Exception as e:
-                logger.exception("fetch error for %s: %s", m.endpoint, e)
+    tick = polling.current_tick(timezone.now())
+    ids = polling.claim_due(tick)
+    shards = _chunks(ids, settings.MONITORING_FETCH_SHARD_SIZE)
+    logger.info("schedule_fetch_all: %s machines due in %s shards", len(ids), len(shards))
+    if not shards:
+        return 0
 
-
-# ----------------------- Инциденты -----------------------
-
-def _get_or_none_active_incident(machine_id, itype):
-    return Incident.objects.filter(machine_id=machine_id, type=itype, is_active=True).first()
-
-
-def _open_incident(machine_id, itype, details=None):
-    Incident.objects.create(machine_id=machine_id, type=itype, is_active=True, details=details or {})
-    logger.info("Incident OPEN: %s on machine %s", itype, machine_id)
-
-
-def _touch_incident(incident: Incident):
-    incident.save(update_fields=["last_seen_at"])
+    chord(fetch_shard.s(shard, tick.isoformat()) for shard in shards)(
+        finish_fetch_sweep.s(time.time())
+    )
+    return len(shards)
 
 
-def _resolve_incident(incident: Incident):
-    if incident and incident.is_active:
-        incident.is_active = False
-        incident.resolved_at = timezone.now()
-        incident.save(update_fields=["is_active", "resolved_at"])
-        logger.info("Incident RESOLVED: %s on machine %s", incident.type, incident.machine_id)
-
-
-def _mem_required_samples():
-    return max(2, MEM_WINDOW_MIN // SAMPLE_INTERVAL_MIN)
-
-
-def _disk_required_samples():
-    return max(2, DISK_WINDOW_MIN // SAMPLE_INTERVAL_MIN)
-
-
-def _check_cpu_rule(machine_id):
-    latest = Metric.objects.filter(machine_id=machine_id).order_by("-received_at").first()
-    itype = Incident.Type.CPU_HIGH
-    active = _get_or_none_active_incident(machine_id, itype)
+@shared_task
+@instrumentation.tracked("fetch_shard")
+def fetch_shard(machine_ids, tick):
+    """
+    Опрос одного шарда — переданных машин (если они всё ещё активны и в режиме pull).
+    Машины опрашиваются параллельно (см. monitoring.collector),
+    режим "sync" оставлен как запасной. По итогам сдвигается расписание машин.
+    """
+    rows = list(
+        Machine.objects.filter(id__in=machine_ids, active=True, collection_mode=Machine.Mode.PULL)
+        .values_list("id", "endpoint", "poll_failures")
+    )
+    machines = [(mid, endpoint) for mid, endpoint, _ in rows]
+    failures = {mid: count for mid, _, count in rows}
+
+    on_flush = detection_hook([mid for mid, _ in machines])
+
+    stats = SweepStats()
+    outcomes = {}
+    invalid = {}  # machine_id -> ошибка разбора
+    errors = {}   # machine_id -> ошибка опроса (для MachineState)
+    with MetricBuffer(on_flush=on_flush) as buffer:
+        for res in collect(machines):
+            if res.status == OK:
+                try:
+                    buffer.add(metric_from_sample(res.machine_id, parse_payload(res.body)))
+                except ParseError as e:
+                    invalid[res.machine_id] = f"{res.endpoint}: {e}"
+                    errors[res.machine_id] = f"invalid: {e}"
+                    res.status = FAILED
+            else:
+                logger.warning("fetch %s for %s: %s", res.status, res.endpoint, res.error)
+                errors[res.machine_id] = res.error or res.status
+            instrumentation.observe_fetch(res, "invalid" if res.machine_id in invalid else None)
+            stats.add(res)
+            outcomes[res.machine_id] = res.status == OK
+
+    if invalid:
+        record_parse_errors(dict.fromkeys(invalid, 1))
+        logger.warning(
+            "fetch_shard: %s payloads failed validation, e.g. %s",
+            len(invalid), "; ".join(list(invalid.values())[:3]),
+        )
+    state.record_failures(errors)
+    polling.record(outcomes, failures, datetime.fromisoformat(tick))
+    stats.finish()
+    instrumentation.SWEEP_DURATION.labels("shard").observe(stats.duration)
+    instrumentation.METRICS_WRITTEN.labels("pull").inc(buffer.written)
+    first_id, last_id = machine_ids[0], machine_ids[-1]
+    logger.info(
+        "fetch_shard %s-%s: done in %.2fs, ok=%s failed=%s timed_out=%s, written=%s in %s flushes",
+        first_id, last_id, stats.duration, stats.ok, stats.failed, stats.timed_out,
+        buffer.written, len(buffer.flushes),
+    )
+    return {
+        "shard": [first_id, last_id],
+        **stats.as_dict(),
+        "invalid": len(invalid),
+        "written": buffer.written,
+        "flushes": buffer.flushes,
+    }
 
-    if latest and latest.cpu > 85:
-        if not active:
-            _open_incident(machine_id, itype, {"cpu": latest.cpu, "at": latest.received_at.isoformat()})
-        else:
-            _touch_incident(active)
-    else:
-        if active:
-            _resolve_incident(active)
 
+@shared_task
+def finish_fetch_sweep(shard_results, started_at):
+    """Callback chord-а: общее время прохода и сводка по шардам."""
+    summary = {
+        "duration": round(time.time() - started_at, 3),
+        "shards": len(shard_results),
+    }
+    for key in ("total", "ok", "failed", "timed_out", "invalid", "written"):
+        summary[key] = sum(r[key] for r in shard_results)
+    instrumentation.SWEEP_DURATION.labels("sweep").observe(summary["duration"])
+
+    for r in shard_results:
+        logger.info(
+            "sweep shard %s-%s: %.2fs, total=%s ok=%s failed=%s timed_out=%s",
+            *r["shard"], r["duration"], r["total"], r["ok"], r["failed"], r["timed_out"],
+        )
+    logger.info(
+        "sweep finished in %.2fs: %s shards, total=%s ok=%s failed=%s (invalid=%s) timed_out=%s written=%s",
+        summary["duration"], summary["shards"], summary["total"], summary["ok"],
+        summary["failed"], summary["invalid"], summary["timed_out"], summary["written"],
+    )
+    # снимок для страницы обзора парка — из MachineState, уже обновлённого шардами
+    overview.refresh()
+    return {**summary, "per_shard": shard_results}
 
-def _check_mem_rule(machine_id):
-    N = _mem_required_samples()
-    qs = Metric.objects.filter(machine_id=machine_id).order_by("-received_at")[:N]
-    points = list(qs)
-    itype = Incident.Type.MEM_HIGH
-    active = _get_or_none_active_incident(machine_id, itype)
 
-    if len(points) < N:
-        if active:
-            _resolve_incident(active)
-        return
+# ----------------------- Инциденты -----------------------
 
-    if all(p.mem_percent > 90.0 for p in points):
-        if not active:
-            _open_incident(machine_id, itype, {"window_min": MEM_WINDOW_MIN, "samples": N})
-        else:
-            _touch_incident(active)
-    else:
-        if active:
-            _resolve_incident(active)
+@shared_task
+@instrumentation.tracked("evaluate_incidents_all")
+def evaluate_incidents_all():
+    """
+    Запускается каждые 5 минут.
+    Проверяет все машины и применяет правила инцидентов
+    (пакетно, см. monitoring.evaluation).
+    """
+    # два прохода подряд (Beat догоняет после простоя воркера, ручной seed_all) не пересекаются
+    with evaluation_lock() as acquired:
+        if not acquired:
+            logger.warning("evaluate_incidents_all: previous run is still in progress, skipping")
+            return {"skipped": True}
+        result = evaluate_all()
+    logger.info(
+        "evaluate_incidents_all: opened=%s touched=%s resolved=%s",
+        result["opened"], result["touched"], result["resolved"],
+    )
+    return result
 
 
-def _check_disk_rule(machine_id):
-    N = _disk_required_samples()
-    qs = Metric.objects.filter(machine_id=machine_id).order_by("-received_at")[:N]
-    points = list(qs)
-    itype = Incident.Type.DISK_HIGH
-    active = _get_or_none_active_incident(machine_id, itype)
+# ----------------------- Агрегаты -----------------------
 
-    if len(points) < N:
-        if active:
-            _resolve_incident(active)
-        return
+@shared_task
+@instrumentation.tracked("update_metric_rollups")
+def update_metric_rollups():
+    """Досчитывает часовые и дневные агрегаты по новым метрикам (см. monitoring.rollups)."""
+    return update_rollups()
 
-    if all(p.disk_percent > 95.0 for p in points):
-        if not active:
-            _open_incident(machine_id, itype, {"window_min": DISK_WINDOW_MIN, "samples": N})
-        else:
-            _touch_incident(active)
-    else:
-        if active:
-            _resolve_incident(active)
 
+# ----------------------- Хранение -----------------------
 
 @shared_task
-def evaluate_incidents_all():
-    """
-    Запускается каждые 5 минут.
-    Проверяет все машины и применяет правила инцидентов.
-    """
-    ids = list(Machine.objects.filter(active=True).values_list("id", flat=True))
-    logger.info("evaluate_incidents_all: %s machines", len(ids))
-    for mid in ids:
-        _check_cpu_rule(mid)
-        _check_mem_rule(mid)
-        _check_disk_rule(mid)
+@instrumentation.tracked("purge_expired_data")
+def purge_expired_data():
+    """Ежедневная очистка устаревших метрик и закрытых инцидентов (см. monitoring.retention)."""
+    return purge_expired()
@@ -1,3 +1,839 @@
-from django.test import TestCase
+import asyncio
+import functools
+import io
+import json
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import feed, ingest, inventory, partitions, retention, rollups, rules, series, tasks, views
+from .collector import FAILED, OK, TIMEOUT, FetchResult, collect
+from .evaluation import (
+    Transitions, apply_transitions, compute_transitions, evaluation_lock, fresh_windows, load_active_incidents,
+    load_windows,
+)
+from .models import Incident, IncidentRule, Machine, MachineState, Metric, MetricDaily, MetricHourly, RollupWatermark
+from .parser import ParseError, parse_payload, parse_uptime
+from .polling import next_delay
+from .rules import OPERATORS, CompiledRule, RuleSet, coverage
+from .streaming import MachineWindow, StreamingDetector
+
+
+def make_machine(name="node-01", **kwargs):
+    return Machine.objects.create(name=name, endpoint=f"http://mock/m/{name}/metrics", **kwargs)
+
+
+class ChangesFeedTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+        self.incident = Incident.objects.create(machine=self.machine, type="CPU_HIGH")
+
+    def test_full_snapshot_and_cursor_lag(self):
+        items, cursor = feed.changes_since()
+        self.assertEqual([i["id"] for i in items], [self.incident.id])
+        self.assertLessEqual(cursor, timezone.now() - feed.CURSOR_LAG)
+
+    def test_cursor_excludes_seen_changes(self):
+        items, _ = feed.changes_since(self.incident.changed_at)
+        self.assertEqual(items, [])
+
+    def test_change_stamped_with_old_data_time_is_delivered(self):
+        # потоковая проверка передаёт время метрик, которое старше курсора клиента
+        _, cursor = feed.changes_since()
+        apply_transitions(Transitions(resolves=[self.incident]), now=timezone.now() - timedelta(minutes=10))
+        items, _ = feed.changes_since(cursor)
+        self.assertEqual([(i["id"], i["is_active"]) for i in items], [(self.incident.id, False)])
+
+    def test_cursor_never_moves_back(self):
+        cursor = timezone.now()
+        _, new_cursor = feed.changes_since(cursor)
+        self.assertEqual(new_cursor, cursor)
+
+    def test_parse_cursor_requires_timezone(self):
+        self.assertIsNone(feed.parse_cursor("2025-01-01T00:00:00"))
+        self.assertIsNone(feed.parse_cursor("yesterday"))
+        self.assertIsNotNone(feed.parse_cursor("2025-01-01T00:00:00+00:00"))
+
+
+class RollupWatermarkTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+
+    def metric(self, at):
+        return Metric.objects.create(machine=self.machine, cpu=10, mem_percent=20, disk_percent=30, received_at=at)
+
+    def watermark(self):
+        return RollupWatermark.objects.get(name=rollups.WATERMARK).last_metric_id
+
+    def test_rows_are_rolled_up_and_watermark_advances(self):
+        old = self.metric(timezone.now() - timedelta(hours=2))
+        report = rollups.update_rollups(lag=60)
+        self.assertEqual(report["rows"], 1)
+        self.assertEqual(self.watermark(), old.id)
+        self.assertEqual(MetricHourly.objects.get(machine=self.machine).samples, 1)
+
+    def test_watermark_stops_before_row_newer_than_cutoff(self):
+        # шард записал свежую строку раньше (меньший id), чем другой — старую
+        fresh = self.metric(timezone.now())
+        self.metric(timezone.now() - timedelta(hours=2))
+        report = rollups.update_rollups(lag=60)
+        self.assertEqual(report["rows"], 0)
+        self.assertEqual(self.watermark(), 0)
+
+        report = rollups.update_rollups(lag=0)
+        self.assertEqual(report["rows"], 2)
+        self.assertEqual(MetricHourly.objects.filter(machine=self.machine).count(), 2)
+        self.assertGreater(self.watermark(), fresh.id)
+
+    def test_batches_stop_at_fresh_row(self):
+        old = [self.metric(timezone.now() - timedelta(hours=3)) for _ in range(3)]
+        self.metric(timezone.now())
+        self.metric(timezone.now() - timedelta(hours=3))
+        report = rollups.update_rollups(batch_size=2, lag=60)
+        self.assertEqual(report["rows"], 3)
+        self.assertEqual(self.watermark(), old[-1].id)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if not m.endswith("SimpleAuthMiddleware")])
+@mock.patch.object(views, "HISTORY_CHUNK", 2)
+class IncidentHistoryTests(TestCase):
+    def setUp(self):
+        machine = make_machine()
+        for itype in ("CPU_HIGH", "MEM_HIGH", "DISK_HIGH"):
+            for _ in range(2):
+                Incident.objects.create(machine=machine, type=itype, is_active=False, active_key=None)
+        # одинаковое started_at — порядок страниц держится на id
+        Incident.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.expected = list(Incident.objects.order_by("-started_at", "-id").values_list("id", flat=True))
+
+    def read(self, body):
+        data = json.loads(body)
+        return [i["id"] for i in data["items"]], data["next"]
+
+    def test_pages_follow_cursor(self):
+        first, cursor = self.read(b"".join(self.client.get("/api/incidents/history?limit=4").streaming_content))
+        self.assertEqual(first, self.expected[:4])
+        response = self.client.get("/api/incidents/history", {"limit": 4, "cursor": cursor})
+        rest, cursor = self.read(b"".join(response.streaming_content))
+        self.assertEqual(rest, self.expected[4:])
+        self.assertIsNone(cursor)
+
+    def test_exact_page_has_no_next(self):
+        ids, cursor = self.read(b"".join(self.client.get("/api/incidents/history?limit=6").streaming_content))
+        self.assertEqual(ids, self.expected)
+        self.assertIsNone(cursor)
+
+    async def test_asgi_streams_asynchronously(self):
+        response = await AsyncClient().get("/api/incidents/history?limit=5")
+        self.assertTrue(response.is_async)
+        ids, cursor = self.read(b"".join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(ids, self.expected[:5])
+        self.assertIsNotNone(cursor)
+
+
+class InventoryTests(TestCase):
+    def test_parse_rejects_bad_lines(self):
+        raw = "name,endpoint,active\nn1,http://node1:9100/m,yes\nn1,http://x/m,\n,http://x/m,\nn2,ftp://x,\nn3,http://x/m,maybe\n"
+        hosts, rejected = inventory.parse_inventory(raw, "csv")
+        self.assertEqual(hosts, [inventory.Host("n1", "http://node1:9100/m")])
+        self.assertEqual([r["line"] for r in rejected], [3, 4, 5, 6])
+
+    def test_parse_jsonl_push_without_endpoint(self):
+        hosts, rejected = inventory.parse_inventory('{"name": "p1", "mode": "push"}\n{"name": "p2"}\nnot json\n', "jsonl")
+        self.assertEqual([h.name for h in hosts], ["p1"])
+        self.assertEqual([r["line"] for r in rejected], [2, 3])
+
+    def test_sync_updates_and_deactivates(self):
+        make_machine("a")
+        make_machine("b")
+        report = inventory.sync_inventory([inventory.Host("a", "http://new/m"), inventory.Host("c", "http://c/m")])
+        self.assertEqual((report["created"], report["updated"], report["deactivated"]), (1, 1, 1))
+        self.assertEqual(Machine.objects.get(name="a").endpoint, "http://new/m")
+        self.assertFalse(Machine.objects.get(name="b").active)
+
+    def test_names_differing_only_in_case_are_one_machine(self):
+        hosts, rejected = inventory.parse_inventory("name,endpoint\nn1,http://x/m\nN1,http://y/m\n", "csv")
+        self.assertEqual(([h.name for h in hosts], [r["line"] for r in rejected]), (["n1"], [3]))
+
+        machine = make_machine("Node-01")
+        report = inventory.sync_inventory([inventory.Host("node-01", "http://new/m")])
+        self.assertEqual((report["created"], report["updated"], report["deactivated"]), (0, 1, 0))
+        machine.refresh_from_db()
+        self.assertEqual((machine.name, machine.endpoint, machine.active), ("node-01", "http://new/m", True))
+
+        report = inventory.sync_inventory([inventory.Host("NODE-01", "http://other/m")], create_only=True)
+        self.assertEqual((report["created"], report["unchanged"]), (0, 1))
+        self.assertEqual(Machine.objects.count(), 1)
+
+    def test_seed_machines_keeps_existing_machines(self):
+        # оператор выключил машину и перевёл другую в push — перезапуск контейнера это не отменяет
+        make_machine("node-01", active=False)
+        make_machine("node-02", collection_mode=Machine.Mode.PUSH, poll_failures=3)
+        call_command("seed_machines", host="http://mock:8001", stdout=io.StringIO())
+        self.assertEqual(Machine.objects.filter(name__startswith="node-").count(), 30)
+        self.assertFalse(Machine.objects.get(name="node-01").active)
+        node2 = Machine.objects.get(name="node-02")
+        self.assertEqual((node2.collection_mode, node2.poll_failures), (Machine.Mode.PUSH, 3))
+
+
+class ApplyTransitionsTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+
+    def test_open_already_opened_elsewhere_is_not_counted(self):
+        Incident.objects.create(machine=self.machine, type="CPU_HIGH")
+        applied = apply_transitions(Transitions(opens=[(self.machine.id, "CPU_HIGH", {}), (self.machine.id, "MEM_HIGH", {})]))
+        self.assertEqual([itype for _, itype, _ in applied.opens], ["MEM_HIGH"])
+        self.assertEqual(Incident.objects.filter(is_active=True).count(), 2)
+
+    def test_resolve_already_resolved_elsewhere_is_not_counted(self):
+        incident = Incident.objects.create(machine=self.machine, type="CPU_HIGH")
+        Incident.objects.filter(id=incident.id).update(is_active=False, active_key=None)
+        applied = apply_transitions(Transitions(resolves=[incident]))
+        self.assertEqual(applied.resolves, [])
+
+    def test_touch_of_incident_resolved_elsewhere_is_not_counted(self):
+        kept, gone = (Incident.objects.create(machine=self.machine, type=itype) for itype in ("CPU_HIGH", "MEM_HIGH"))
+        Incident.objects.filter(id=gone.id).update(is_active=False, active_key=None)
+        seen = timezone.now() + timedelta(minutes=5)
+        applied = apply_transitions(Transitions(touches=[kept, gone]), now=seen)
+        self.assertEqual(applied.touches, [kept])
+        self.assertEqual(Incident.objects.get(id=kept.id).last_seen_at, seen)
+        self.assertNotEqual(Incident.objects.get(id=gone.id).last_seen_at, seen)
+
+    @override_settings(CACHE_URL="")
+    def test_lock_is_exclusive_and_released(self):
+        with evaluation_lock() as first:
+            with evaluation_lock() as second:
+                self.assertEqual((first, second), (True, False))
+        with evaluation_lock() as again:
+            self.assertTrue(again)
+
+
+@override_settings(MONITORING_STREAMING_DETECTION=False)
+class IngestPushTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine(collection_mode=Machine.Mode.PUSH)
+
+    def push(self, *samples):
+        return ingest.ingest_push("\n".join(json.dumps({"machine": self.machine.id, **s}) for s in samples).encode())
+
+    def test_sample_time_from_at(self):
+        at = timezone.now().replace(microsecond=0) - timedelta(minutes=30)
+        report = self.push(
+            {"cpu": 1, "mem": 2, "disk": 3, "at": at.timestamp()},
+            {"cpu": 4, "mem": 5, "disk": 6, "at": (at + timedelta(minutes=15)).isoformat()},
+            {"cpu": 7, "mem": 8, "disk": 9},
+        )
+        self.assertEqual(report["accepted"], 3)
+        times = list(Metric.objects.order_by("cpu").values_list("received_at", flat=True))
+        self.assertEqual(times[:2], [at, at + timedelta(minutes=15)])
+        self.assertGreater(times[2], timezone.now() - timedelta(minutes=1))
+
+    def test_at_out_of_bounds_is_rejected(self):
+        now = timezone.now()
+        report = self.push(
+            {"cpu": 1, "mem": 2, "disk": 3, "at": (now + timedelta(hours=1)).timestamp()},
+            {"cpu": 1, "mem": 2, "disk": 3, "at": (now - timedelta(days=2)).isoformat()},
+            {"cpu": 1, "mem": 2, "disk": 3, "at": "2025-01-01T00:00:00"},
+        )
+        self.assertEqual(report["accepted"], 0)
+        self.assertEqual([r["line"] for r in report["rejected"]], [1, 2, 3])
+
+    def test_backfilled_sample_does_not_roll_back_state(self):
+        self.push({"cpu": 50, "mem": 2, "disk": 3})
+        self.push({"cpu": 99, "mem": 2, "disk": 3, "at": (timezone.now() - timedelta(hours=1)).timestamp()})
+        self.assertEqual(MachineState.objects.get(machine=self.machine).cpu, 50)
+
+
+class ParserTests(TestCase):
+    def test_payload(self):
+        sample = parse_payload(b'{"cpu": 42, "mem": "55.5%", "disk": 12, "uptime": "1d 2h 3m 4s", "extra": 1}')
+        self.assertEqual((sample.cpu, sample.mem, sample.disk, sample.uptime_sec), (42, 55.5, 12.0, 93784))
+
+    def test_invalid_payloads(self):
+        for raw in (b"{", b"[]", b'{"mem": 1, "disk": 1}', b'{"cpu": 101, "mem": 1, "disk": 1}',
+                    b'{"cpu": true, "mem": 1, "disk": 1}', b'{"cpu": 1, "mem": "lots", "disk": 1}'):
+            with self.subTest(raw=raw), self.assertRaises(ParseError):
+                parse_payload(raw)
+
+    def test_uptime(self):
+        self.assertIsNone(parse_uptime(None))
+        self.assertEqual(parse_uptime(3600), 3600)
+        self.assertEqual(parse_uptime("3600"), 3600)
+        self.assertEqual(parse_uptime("2h 5s"), 7205)
+        for bad in ("2 hours", "-5", -5, True, [1]):
+            with self.subTest(value=bad), self.assertRaises(ParseError):
+                parse_uptime(bad)
+
+    def test_uptime_must_fit_bigint(self):
+        self.assertEqual(parse_uptime(2**63 - 1), 2**63 - 1)
+        for bad in (2**63, "99999999999999999999999", 1e300, float("inf"), float("nan"), "106751991167301d"):
+            with self.subTest(value=bad), self.assertRaises(ParseError):
+                parse_uptime(bad)
+
+
+@override_settings(MONITORING_STREAMING_DETECTION=False)
+class FetchShardTests(TestCase):
+    def test_bad_payload_does_not_stop_the_shard(self):
+        good, bad = make_machine("node-01"), make_machine("node-02")
+        results = [
+            FetchResult(bad.id, bad.endpoint, OK, body=b'{"cpu": 1, "mem": 1, "disk": 1, "uptime": 1e300}'),
+            FetchResult(good.id, good.endpoint, OK, body=b'{"cpu": 5, "mem": 6, "disk": 7, "uptime": 60}'),
+        ]
+        with mock.patch("monitoring.tasks.collect", return_value=iter(results)):
+            report = tasks.fetch_shard([good.id, bad.id], timezone.now().isoformat())
+        self.assertEqual((report["ok"], report["invalid"], report["written"]), (1, 1, 1))
+        self.assertEqual(list(Metric.objects.values_list("machine_id", flat=True)), [good.id])
+        bad.refresh_from_db()
+        self.assertEqual((bad.parse_errors, bad.poll_failures), (1, 1))
+        self.assertIn("uptime", MachineState.objects.get(machine=bad).last_error)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+        now = timezone.now()
+        for days in (50, 40, 35, 1):
+            Metric.objects.create(
+                machine=self.machine, cpu=1, mem_percent=1, disk_percent=1, received_at=now - timedelta(days=days)
+            )
+
+    def test_purges_expired_metrics(self):
+        report = retention.purge_expired(metric_days=30, pause=0)
+        self.assertEqual(report["metrics_deleted"], 3)
+        self.assertEqual(Metric.objects.count(), 1)
+
+    def test_zero_days_is_not_the_default(self):
+        report = retention.purge_expired(metric_days=0, incident_days=0, pause=0)
+        self.assertEqual(report["metrics_deleted"], 4)
+
+    def test_incidents_purged_with_one_feed_bump_per_batch(self):
+        old = timezone.now() - timedelta(days=100)
+        Incident.objects.bulk_create(
+            Incident(machine=self.machine, type=f"T{n}", is_active=False, active_key=None, resolved_at=old)
+            for n in range(5)
+        )
+        Incident.objects.update(started_at=old)
+        active = Incident.objects.create(machine=self.machine, type="CPU_HIGH")
+        with self.captureOnCommitCallbacks() as bumps:
+            deleted, done = retention.purge_incidents(timezone.now(), 2, retention._Budget(60, 0))
+        self.assertEqual((deleted, done), (5, True))
+        self.assertEqual(len(bumps), 3)
+        self.assertEqual(list(Incident.objects.values_list("id", flat=True)), [active.id])
+
+
+@override_settings(MONITORING_POLL_INTERVAL_SEC=900, MONITORING_WINDOW_MAX_GAP_MIN=30)
+class RulesTests(SimpleTestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.cpu = CompiledRule("CPU_HIGH", "cpu", 0, OPERATORS[">"], 85, 0)
+        self.mem = CompiledRule("MEM_HIGH", "mem_percent", 1, OPERATORS[">"], 90, 30, overrides={7: None, 8: 99})
+        self.rules = RuleSet([self.cpu, self.mem])
+
+    def points(self, *values, step_min=15):
+        # (cpu, mem, disk, at) свежие первыми, с шагом step_min минут
+        return [(cpu, mem, 10, self.now - timedelta(minutes=step_min * i)) for i, (cpu, mem) in enumerate(values)]
+
+    def test_coverage(self):
+        self.assertEqual(coverage(self.now, None), (900, False))
+        self.assertEqual(coverage(self.now, self.now - timedelta(minutes=10)), (600, True))
+        # разрыв больше MONITORING_WINDOW_MAX_GAP_MIN — серия прерывается
+        self.assertEqual(coverage(self.now, self.now - timedelta(minutes=31)), (900, False))
+
+    def test_satisfied_with_tolerance(self):
+        self.assertTrue(self.cpu.satisfied(0))
+        self.assertFalse(self.mem.satisfied(28 * 60))
+        self.assertTrue(self.mem.satisfied(29 * 60))
+
+    def test_window_rule_needs_continuous_breach(self):
+        self.assertEqual(set(self.rules.evaluate(1, self.points((90, 95), (10, 95), (10, 95)))), {"CPU_HIGH", "MEM_HIGH"})
+        self.assertEqual(self.rules.evaluate(1, self.points((10, 95), (10, 50), (10, 95))), {})
+        # 45 минут между точками — разрыв, одной точки на окно не хватает
+        self.assertEqual(self.rules.evaluate(1, self.points((10, 95), (10, 95), step_min=45)), {})
+
+    def test_overrides(self):
+        points = self.points((10, 95), (10, 95), (10, 95))
+        self.assertEqual(self.rules.evaluate(7, points), {})
+        self.assertEqual(self.rules.evaluate(8, points), {})
+        self.assertTrue(self.rules.needs_history(1, points[0]))
+        self.assertFalse(self.rules.needs_history(7, points[0]))
+
+
+@override_settings(
+    MONITORING_POLL_INTERVAL_SEC=60,
+    MONITORING_POLL_INCIDENT_INTERVAL_SEC=15,
+    MONITORING_POLL_CIRCUIT_FAILURES=5,
+    MONITORING_POLL_CIRCUIT_COOLDOWN_SEC=600,
+)
+class PollingTests(SimpleTestCase):
+    def test_base_and_incident_interval(self):
+        self.assertEqual(next_delay(0), 60)
+        self.assertEqual(next_delay(0, has_incident=True), 15)
+        with self.settings(MONITORING_POLL_INCIDENT_INTERVAL_SEC=0):
+            self.assertEqual(next_delay(0, has_incident=True), 60)
+
+    def test_backoff_is_capped_and_circuit_opens(self):
+        self.assertEqual(next_delay(1), 120)
+        self.assertEqual(next_delay(2, has_incident=True), 240)
+        self.assertEqual(next_delay(4), 600)
+        self.assertEqual(next_delay(5), 600)
+
+
+@override_settings(MONITORING_POLL_INTERVAL_SEC=900, MONITORING_WINDOW_MAX_GAP_MIN=30)
+class MachineWindowTests(SimpleTestCase):
+    def setUp(self):
+        # окно 3 часа: DISK_HIGH 120 минут плюс два допустимых разрыва
+        self.ruleset = self.make_ruleset(mem=90, disk=95)
+        self.start = timezone.now() - timedelta(days=1)
+
+    def make_ruleset(self, mem, disk):
+        return RuleSet([
+            CompiledRule("CPU_HIGH", "cpu", 0, OPERATORS[">"], 85, 0),
+            CompiledRule("MEM_HIGH", "mem_percent", 1, OPERATORS[">"], mem, 30, overrides={2: None}),
+            CompiledRule("DISK_HIGH", "disk_percent", 2, OPERATORS[">="], disk, 120, overrides={3: 97}),
+        ])
+
+    def random_points(self, rnd, steps):
+        at = self.start
+        for _ in range(steps):
+            at += timedelta(minutes=rnd.choice([5, 5, 15, 15, 15, 40]), seconds=rnd.randint(-20, 20))
+            yield (rnd.choice([50, 90]), rnd.choice([50, 91, 95]), rnd.choice([10, 96, 97, 98, 99]), at)
+
+    def test_buffer_grows_and_wraps(self):
+        window = MachineWindow(self.ruleset.span)
+        pushed = []
+        for n in range(100):
+            pushed.append((n, 10, 10, self.start + timedelta(minutes=5 * n)))
+            window.push(self.ruleset, 1, pushed[-1])
+        # 3 часа по 5 минут — 37 точек: буфер вырос 16 -> 32 -> 64, дальше старые перезаписываются
+        self.assertEqual(window.size, 64)
+        self.assertEqual(window.points(), pushed[::-1][:37])
+
+    def test_breaches_match_batch_evaluation(self):
+        rnd = random.Random(20240601)
+        span = timedelta(seconds=self.ruleset.span)
+        for n in range(300):
+            mid = n % 5
+            window = MachineWindow(self.ruleset.span)
+            history = []
+            for step, point in enumerate(self.random_points(rnd, 60)):
+                history.insert(0, point)
+                window.push(self.ruleset, mid, point)
+                points = [p for p in history if p[3] >= point[3] - span]
+                self.assertEqual(window.points(), points, (n, step))
+                self.assertEqual(
+                    window.breaches(self.ruleset, mid, point).keys(),
+                    self.ruleset.evaluate(mid, points).keys(),
+                    (n, step),
+                )
+
+    def test_recount_after_rule_change(self):
+        changed = self.make_ruleset(mem=92, disk=98)
+        self.assertEqual(changed.span, self.ruleset.span)
+        rnd = random.Random(7)
+        for mid in range(5):
+            window = MachineWindow(self.ruleset.span)
+            for point in self.random_points(rnd, 40):
+                window.push(self.ruleset, mid, point)
+            window.recount(changed, mid)
+            self.assertEqual(
+                window.breaches(changed, mid, point).keys(), changed.evaluate(mid, window.points()).keys(), mid
+            )
+
+
+class StreamingDetectorTests(TestCase):
+    def setUp(self):
+        rules.invalidate_rules()
+        self.addCleanup(rules.invalidate_rules)
+        self.machine = make_machine()
+        self.now = timezone.now()
+        for minutes in (30, 15):
+            self.metric(self.now - timedelta(minutes=minutes))
+
+    def metric(self, at, mem=95):
+        return Metric.objects.create(machine=self.machine, cpu=10, mem_percent=mem, disk_percent=10, received_at=at)
+
+    def test_sync_rebuilds_window_behind_db(self):
+        detector = StreamingDetector()
+        detector.sync([self.machine.id], self.now)
+        window = detector.windows[self.machine.id]
+        self.assertEqual(window.last_at, self.now - timedelta(minutes=15))
+
+        # точку записал другой воркер — окно в памяти отстало
+        self.metric(self.now)
+        detector.sync([self.machine.id], self.now)
+        self.assertIsNot(detector.windows[self.machine.id], window)
+        since = self.now - timedelta(seconds=detector.ruleset.span)
+        self.assertEqual(detector.windows[self.machine.id].points(), load_windows(since, [self.machine.id])[self.machine.id])
+
+    def test_rule_change_recounts_or_resets_windows(self):
+        detector = StreamingDetector()
+        detector.sync([self.machine.id], self.now)
+        window = detector.windows[self.machine.id]
+        self.assertIsNotNone(window.runs["MEM_HIGH"])
+
+        # тот же span — окна остаются, серии пересчитываются
+        rule = IncidentRule.objects.get(code="MEM_HIGH")
+        rule.threshold = 99
+        rule.save()
+        detector.sync([self.machine.id], self.now)
+        self.assertIs(detector.windows[self.machine.id], window)
+        self.assertIsNone(window.runs["MEM_HIGH"])
+
+        # другой span — окна строятся заново
+        rule = IncidentRule.objects.get(code="DISK_HIGH")
+        rule.window_min = 60
+        rule.save()
+        detector.sync([self.machine.id], self.now)
+        self.assertIsNot(detector.windows[self.machine.id], window)
+        self.assertEqual(detector.windows[self.machine.id].span, timedelta(seconds=detector.ruleset.span))
+
+    @override_settings(MONITORING_STREAMING_DETECTION=True)
+    def test_process_agrees_with_batch_evaluation(self):
+        detector = StreamingDetector()
+        with mock.patch("monitoring.ingest.get_detector", return_value=detector):
+            with ingest.MetricBuffer(on_flush=ingest.detection_hook([self.machine.id])) as buffer:
+                buffer.add(Metric(machine=self.machine, cpu=90, mem_percent=95, disk_percent=10, received_at=self.now))
+        self.assertEqual(
+            set(Incident.objects.filter(is_active=True).values_list("type", flat=True)), {"CPU_HIGH", "MEM_HIGH"}
+        )
+        ruleset = rules.get_ruleset()
+        windows = fresh_windows(load_windows(self.now - timedelta(seconds=ruleset.span)), self.now)
+        tr = compute_transitions(ruleset, windows, load_active_incidents())
+        self.assertFalse(tr.opens or tr.resolves)
+
+
+@override_settings(
+    TIME_ZONE="Asia/Dushanbe",
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if not m.endswith("SimpleAuthMiddleware")],
+)
+class SeriesTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+        # полночь 10.03.2024 по Душанбе (UTC+5)
+        self.midnight = datetime(2024, 3, 9, 19, tzinfo=dt_timezone.utc)
+        self.epoch = int(self.midnight.timestamp())
+
+    def metric(self, offset, cpu, mem=0, disk=0):
+        Metric.objects.create(
+            machine=self.machine, cpu=cpu, mem_percent=mem, disk_percent=disk, received_at=self.midnight + offset
+        )
+
+    def rollup(self, model, offset, samples, avg, top):
+        values = {}
+        for prefix in ("cpu", "mem", "disk"):
+            values.update({f"{prefix}_min": 0, f"{prefix}_avg": avg, f"{prefix}_max": top, f"{prefix}_p95": top})
+        model.objects.create(machine=self.machine, bucket_start=self.midnight + offset, samples=samples, **values)
+
+    def test_source_per_range(self):
+        for span, step, source in (
+            (timedelta(hours=6), 300, "raw"),
+            (timedelta(days=1), 300, "raw"),
+            (timedelta(days=7), 3600, "hourly"),
+            (timedelta(days=90), 12 * 3600, "hourly"),
+            (timedelta(days=365), 7 * 86400, "daily"),
+        ):
+            with self.subTest(span=span):
+                step_chosen = series.choose_step(span.total_seconds(), 300)
+                self.assertEqual((step_chosen, series.source_for(step_chosen)), (step, source))
+
+    def test_buckets_follow_local_midnight(self):
+        grid = series.Grid(86400, self.midnight)
+        self.assertEqual(grid.floor(self.epoch + 3600), self.epoch)
+        self.assertEqual(grid.floor(self.epoch - 1), self.epoch - 86400)
+        self.assertEqual((grid.ceil(self.epoch), grid.ceil(self.epoch + 1)), (self.epoch, self.epoch + 86400))
+
+        grid, lo, hi = series.align(self.midnight + timedelta(hours=10), self.midnight + timedelta(days=3, hours=2), 3)
+        self.assertEqual((grid.step, lo, hi), (86400, self.epoch, self.epoch + 4 * 86400))
+
+    def test_raw_avg_and_max(self):
+        self.metric(-timedelta(seconds=1), 99)  # до начала диапазона
+        self.metric(timedelta(minutes=0), 10, mem=20)
+        self.metric(timedelta(minutes=2), 30, mem=40)
+        self.metric(timedelta(minutes=4, seconds=59), 50, mem=90)
+        self.metric(timedelta(minutes=5), 70, mem=10)
+        end = self.midnight + timedelta(minutes=15)
+
+        data = series.downsample([self.machine.id], self.midnight, end, 3)
+        self.assertEqual((data["step"], data["source"], data["from"], data["to"]), (300, "raw", self.epoch, self.epoch + 900))
+        out = data["series"][self.machine.id]
+        self.assertEqual(out["t"], [self.epoch, self.epoch + 300])
+        self.assertEqual((out["cpu"], out["mem"]), ([30.0, 70.0], [50.0, 10.0]))
+
+        out = series.downsample([self.machine.id], self.midnight, end, 3, "max")["series"][self.machine.id]
+        self.assertEqual((out["cpu"], out["mem"]), ([50, 70], [90, 10]))
+
+    def test_hourly_rows_weighted_by_samples(self):
+        for hours, samples, avg, top in ((0, 4, 10, 20), (1, 1, 60, 90), (2, 3, 20, 30), (3, 2, 50, 55)):
+            self.rollup(MetricHourly, timedelta(hours=hours), samples, avg, top)
+        self.rollup(MetricDaily, timedelta(0), 10, 99, 99)  # не тот источник
+
+        data = series.downsample([self.machine.id], self.midnight, self.midnight + timedelta(days=3), 24)
+        self.assertEqual((data["step"], data["source"]), (3 * 3600, "hourly"))
+        out = data["series"][self.machine.id]
+        self.assertEqual(out["t"], [self.epoch, self.epoch + 3 * 3600])
+        # (4*10 + 1*60 + 3*20) / 8
+        self.assertEqual(out["cpu"], [20.0, 50.0])
+        out = series.downsample([self.machine.id], self.midnight, self.midnight + timedelta(days=3), 24, "max")
+        self.assertEqual(out["series"][self.machine.id]["disk"], [90, 55])
+
+    def test_view(self):
+        self.metric(timedelta(minutes=1), 40)
+        params = {
+            "machine": str(self.machine.id),
+            "from": self.midnight.isoformat(),
+            "to": (self.midnight + timedelta(minutes=15)).isoformat(),
+            "points": 3,
+        }
+        data = self.client.get("/api/metrics/series", params).json()
+        self.assertEqual((data["step"], data["source"]), (300, "raw"))
+        self.assertEqual(data["series"][str(self.machine.id)]["cpu"], [40.0])
+        self.assertEqual(self.client.get("/api/metrics/series", {**params, "agg": "p99"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/metrics/series", {**params, "machine": ""}).status_code, 400)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if not m.endswith("SimpleAuthMiddleware")])
+class IncidentsJsonTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+        with self.captureOnCommitCallbacks(execute=True):
+            Incident.objects.create(machine=self.machine, type="CPU_HIGH")
+
+    def test_not_modified_on_matching_etag(self):
+        response = self.client.get("/api/incidents/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 1)
+        etag = response["ETag"]
+
+        response = self.client.get("/api/incidents/json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_etag_changes_after_incident_write(self):
+        etag = self.client.get("/api/incidents/json")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Incident.objects.create(machine=self.machine, type="MEM_HIGH")
+        response = self.client.get("/api/incidents/json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["count"], 2)
+
+
+class MetricBufferTests(TestCase):
+    def setUp(self):
+        self.machine = make_machine()
+        self.now = timezone.now()
+
+    def metric(self, cpu=10, seconds=0):
+        return Metric(
+            machine=self.machine, cpu=cpu, mem_percent=20, disk_percent=30, received_at=self.now + timedelta(seconds=seconds)
+        )
+
+    def test_flush_on_size(self):
+        buffer = ingest.MetricBuffer(batch_size=3, flush_interval=3600)
+        for n in range(4):
+            buffer.add(self.metric(seconds=n))
+        self.assertEqual((buffer.flushes, buffer.written, len(buffer)), ([3], 3, 1))
+        self.assertEqual(Metric.objects.count(), 3)
+
+    def test_flush_on_time(self):
+        with mock.patch("monitoring.ingest.time.monotonic", side_effect=[0, 5, 11, 11]):
+            buffer = ingest.MetricBuffer(batch_size=100, flush_interval=10)
+            buffer.add(self.metric())
+            self.assertEqual(len(buffer), 1)
+            buffer.add(self.metric(seconds=1))
+        self.assertEqual((buffer.flushes, len(buffer)), ([2], 0))
+
+    def test_flush_on_exit_only_without_error(self):
+        with ingest.MetricBuffer(batch_size=100, flush_interval=3600) as buffer:
+            buffer.add(self.metric())
+        self.assertEqual(buffer.flushes, [1])
+        with self.assertRaises(KeyError), ingest.MetricBuffer(batch_size=100, flush_interval=3600) as buffer:
+            buffer.add(self.metric())
+            raise KeyError
+        self.assertEqual((buffer.flushes, len(buffer)), ([], 1))
+
+    def test_on_flush_and_state_upsert(self):
+        on_flush = mock.Mock()
+        with ingest.MetricBuffer(batch_size=100, flush_interval=3600, on_flush=on_flush) as buffer:
+            buffer.add(self.metric(cpu=40, seconds=1))
+            buffer.add(self.metric(cpu=70, seconds=2))
+        (batch,), _ = on_flush.call_args
+        self.assertEqual([m.cpu for m in batch], [40, 70])
+        self.assertTrue(all(m.pk for m in batch))
+        state = MachineState.objects.get(machine=self.machine)
+        self.assertEqual((state.cpu, state.sampled_at), (70, self.now + timedelta(seconds=2)))
+
+        with ingest.MetricBuffer(batch_size=100, flush_interval=3600) as buffer:
+            buffer.add(self.metric(cpu=90, seconds=3))
+        state.refresh_from_db()
+        self.assertEqual(state.cpu, 90)
+
+    def test_failed_flush_keeps_rows(self):
+        buffer = ingest.MetricBuffer(batch_size=100, flush_interval=3600)
+        buffer.add(self.metric(seconds=1))
+        buffer.add(self.metric(seconds=2))
+        with mock.patch("monitoring.state.record_samples", side_effect=DatabaseError("boom")):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertEqual((len(buffer), buffer.written, Metric.objects.count()), (2, 0, 0))
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(Metric.objects.count(), 2)
+        self.assertTrue(MachineState.objects.filter(machine=self.machine).exists())
+
+
+class CollectorTests(SimpleTestCase):
+    machines = [(n, f"http://mock/m/node-{n:02}/metrics") for n in range(1, 9)]
+
+    def stub(self, handler):
+        """Подменяет транспорт httpx.AsyncClient, который создаёт collector."""
+        client = functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(handler))
+        return mock.patch("monitoring.collector.httpx.AsyncClient", client)
+
+    def test_async_results_and_errors(self):
+        async def handler(request):
+            node = int(request.url.path.split("-")[1].split("/")[0])
+            if node == 2:
+                return httpx.Response(500)
+            if node == 3:
+                raise httpx.ConnectError("refused", request=request)
+            if node == 4:
+                await asyncio.sleep(1)
+            return httpx.Response(200, content=b'{"node": %d}' % node)
+
+        with self.stub(handler):
+            results = {r.machine_id: r for r in collect(self.machines[:5], mode="async", concurrency=5, timeout=0.2)}
+        self.assertEqual({mid: r.status for mid, r in results.items()}, {1: OK, 2: FAILED, 3: FAILED, 4: TIMEOUT, 5: OK})
+        self.assertEqual(results[1].body, b'{"node": 1}')
+        self.assertEqual(results[2].error, "HTTP 500")
+        self.assertEqual(results[3].error, "refused")
+        self.assertEqual(results[4].error, "timeout")
+
+    def test_async_concurrency_limit(self):
+        running = peak = 0
+
+        async def handler(request):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return httpx.Response(200, content=b"{}")
+
+        with self.stub(handler):
+            results = list(collect(self.machines, mode="async", concurrency=3, timeout=5))
+        self.assertEqual(len(results), len(self.machines))
+        self.assertEqual(peak, 3)
+
+    def test_sync_fallback(self):
+        def get(url, timeout):
+            if url.endswith("node-02/metrics"):
+                raise requests.Timeout()
+            if url.endswith("node-03/metrics"):
+                raise requests.ConnectionError("refused")
+            return mock.Mock(status_code=404 if url.endswith("node-04/metrics") else 200, content=b"{}")
+
+        with mock.patch("monitoring.collector.requests.Session.get", side_effect=get):
+            results = list(collect(self.machines[:4], mode="sync", timeout=1))
+        self.assertEqual([(r.machine_id, r.status) for r in results], [(1, OK), (2, TIMEOUT), (3, FAILED), (4, FAILED)])
+        self.assertEqual((results[2].error, results[3].error), ("refused", "HTTP 404"))
+
+    def test_nothing_to_poll_and_unknown_mode(self):
+        self.assertEqual(list(collect([], mode="async")), [])
+        with self.assertRaises(ValueError):
+            collect(self.machines, mode="threads")
+
+
+class PartitionsTests(TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 3, 10, 12, tzinfo=dt_timezone.utc)
+        # дневные секции с 01.03 по 11.03 и pmax
+        self.parts = [
+            (f"p202403{day:02}", datetime(2024, 3, day + 1, tzinfo=dt_timezone.utc), 100 * day) for day in range(1, 12)
+        ] + [(partitions.MAXVALUE, None, 0)]
+
+    def test_period_start(self):
+        at = datetime(2024, 3, 10, 23, 30, tzinfo=dt_timezone(timedelta(hours=-5)))  # 11.03 04:30 UTC
+        self.assertEqual(partitions.period_start(at, partitions.SCHEMES["daily"]), datetime(2024, 3, 11, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.period_start(at, partitions.SCHEMES["weekly"]), datetime(2024, 3, 11, tzinfo=dt_timezone.utc))
+        self.assertEqual(
+            partitions.period_start(self.now, partitions.SCHEMES["weekly"]), datetime(2024, 3, 4, tzinfo=dt_timezone.utc)
+        )
+
+    def test_plan_creates_ahead_and_drops_expired(self):
+        created, expired = partitions.plan(self.parts, self.now, partitions.SCHEMES["daily"], 7, 3)
+        self.assertEqual(created, [
+            "PARTITION p20240312 VALUES LESS THAN ('2024-03-13 00:00:00')",
+            "PARTITION p20240313 VALUES LESS THAN ('2024-03-14 00:00:00')",
+        ])
+        # срок хранения до 03.03 12:00: секция 02.03 заканчивается ровно в 03.03 00:00
+        self.assertEqual(expired, [("p20240301", 100), ("p20240302", 200)])
+
+    def test_plan_keeps_last_partition_and_needs_pmax(self):
+        created, expired = partitions.plan(self.parts[:-1], self.now, partitions.SCHEMES["daily"], 0, 30)
+        self.assertEqual(created, [])
+        self.assertEqual([name for name, _ in expired], [f"p202403{day:02}" for day in range(1, 10)])
+
+    def test_maintain_issues_planned_statements(self):
+        fake = mock.MagicMock(vendor="mysql")
+        fake.ops.quote_name = lambda name: f"`{name}`"
+        cursor = fake.cursor.return_value.__enter__.return_value
+        with mock.patch.object(partitions, "connection", fake), \
+                mock.patch.object(partitions, "existing", return_value=self.parts), \
+                mock.patch("monitoring.partitions.timezone.now", return_value=self.now):
+            report = partitions.maintain(retention_days=7, ahead_days=3, scheme="daily")
+        reorganize, drop = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertIn("REORGANIZE PARTITION pmax INTO (PARTITION p20240312 ", reorganize)
+        self.assertTrue(drop.endswith("DROP PARTITION p20240301, p20240302"))
+        self.assertEqual(report, {"partitions": 12, "created": 2, "dropped": 2, "rows_dropped_estimate": 300})
+
+    @override_settings(MONITORING_METRIC_PARTITIONING="daily")
+    def test_nothing_happens_on_other_backends(self):
+        self.assertNotEqual(connection.vendor, "mysql")
+        self.assertFalse(partitions.enabled())
+        with CaptureQueriesContext(connection) as queries:
+            for action in (partitions.maintain, partitions.enable, partitions.disable):
+                with self.subTest(action=action.__name__), self.assertRaises(partitions.PartitioningError):
+                    action()
+        self.assertEqual(len(queries), 0)
+        with mock.patch.object(partitions, "maintain") as maintain:
+            retention.purge_expired(pause=0)
+        maintain.assert_not_called()
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if not m.endswith("SimpleAuthMiddleware")])
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "x"))
+        machine = make_machine()
+        self.old = Incident.objects.create(machine=machine, type="CPU_HIGH")
+        Incident.objects.filter(id=self.old.id).update(started_at=timezone.now() - timedelta(days=3))
+        self.resolved = Incident.objects.create(machine=machine, type="MEM_HIGH", is_active=False)
+
+    def test_incidents_open_on_active_ones(self):
+        response = self.client.get("/admin/monitoring/incident/")
+        self.assertRedirects(response, "/admin/monitoring/incident/?is_active__exact=1")
+        response = self.client.get("/admin/monitoring/incident/?is_active__exact=1")
+        self.assertEqual([i.id for i in response.context["cl"].result_list], [self.old.id])
+
+    def test_metrics_open_on_today(self):
+        today = timezone.localdate()
+        response = self.client.get("/admin/monitoring/metric/")
+        self.assertRedirects(
+            response,
+            f"/admin/monitoring/metric/?received_at__year={today.year}&received_at__month={today.month}"
+            f"&received_at__day={today.day}",
+        )
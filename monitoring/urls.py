@@ -5,5 +5,14 @@ urlpatterns = [
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("incidents", views.incidents_page, name="incidents"),
+    path("fleet", views.fleet_page, name="fleet"),
     path("api/incidents/json", views.incidents_json, name="incidents_json"),
+    path("api/incidents/changes", views.incidents_changes, name="incidents_changes"),
+    path("api/incidents/stream", views.incidents_stream, name="incidents_stream"),
+    path("api/incidents/history", views.incidents_history, name="incidents_history"),
+    path("metrics", views.prometheus_metrics, name="prometheus_metrics"),
+    path("api/ingest", views.ingest_metrics, name="ingest_metrics"),
+    path("api/machines/import", views.import_machines, name="import_machines"),
+    path("api/metrics/series", views.metrics_series, name="metrics_series"),
+    path("api/fleet/status", views.fleet_status, name="fleet_status"),
 ]
\ No newline at end of file
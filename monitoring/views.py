@@ -1,32 +1,328 @@
+import hmac
+import json
 import os
-from django.http import JsonResponse, HttpResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Q
 from django.shortcuts import render, redirect
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
-from .models import Incident
+from . import feed, ingest, instrumentation, inventory, live, overview, series
+from .models import Incident, Machine
+from .rules import max_gap
 
 def incidents_page(request):
     return render(request, "monitoring/incidents.html")
 
-def incidents_json(request):
+def fleet_page(request):
+    # снимок готовится после прохода сбора (см. monitoring.overview); здесь только вставка в шаблон
+    return render(request, "monitoring/fleet.html", {"snapshot": overview.get_snapshot()})
+
+def _incidents_payload():
     # Сначала активные, затем закрытые (последние 24 часа для компактности)
     since = timezone.now() - timezone.timedelta(days=1)
     qs = Incident.objects.select_related("machine").filter(started_at__gte=since).order_by("-is_active", "-last_seen_at")
-    data = [
-        {
-            "id": i.id,
-            "machine": i.machine.name,
-            "type": i.type,
-            "is_active": i.is_active,
-            "started_at": i.started_at.isoformat(),
-            "last_seen_at": i.last_seen_at.isoformat(),
-            "resolved_at": i.resolved_at.isoformat() if i.resolved_at else None,
-        }
-        for i in qs
-    ]
-    return JsonResponse({"items": data, "count": len(data)})
+    data = [feed.incident_dict(i) for i in qs]
+    return json.dumps({"items": data, "count": len(data)}, cls=DjangoJSONEncoder).encode()
+
+@require_http_methods(["GET", "HEAD"])
+def incidents_json(request):
+    # Тело берётся из кэша (см. monitoring.feed); неизменившийся ответ → 304 без тела
+    entry = feed.cached_payload(_incidents_payload)
+    response = get_conditional_response(request, etag=entry["etag"], last_modified=entry["last_modified"])
+    if response is None:
+        response = HttpResponse(entry["body"], content_type="application/json")
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+@require_http_methods(["GET"])
+def incidents_changes(request):
+    """
+    Лента изменений: инциденты (за последние 24 часа), открытые, обновлённые
+    или закрытые после cursor, и новый курсор. Без cursor — полный снимок.
+    """
+    cursor = None
+    if request.GET.get("cursor"):
+        cursor = feed.parse_cursor(request.GET["cursor"])
+        if cursor is None:
+            return JsonResponse({"error": "cursor must be an ISO 8601 timestamp with timezone"}, status=400)
+    items, new_cursor = feed.changes_since(cursor)
+    return JsonResponse({"items": items, "cursor": new_cursor.isoformat(), "full": cursor is None})
+
+HISTORY_DEFAULT_LIMIT = 500
+HISTORY_MAX_LIMIT = 5000
+HISTORY_CHUNK = 500
+# ключ в ответе -> поле запроса
+HISTORY_COLUMNS = {
+    "id": "id",
+    "machine_id": "machine_id",
+    "machine": "machine__name",
+    "type": "type",
+    "is_active": "is_active",
+    "started_at": "started_at",
+    "last_seen_at": "last_seen_at",
+    "resolved_at": "resolved_at",
+    "details": "details",
+}
+
+def _parse_time(raw, name):
+    value = feed.parse_cursor(raw)
+    if value is None:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp with timezone")
+    return value
+
+def _history_queryset(params):
+    """Фильтры истории инцидентов; ValueError — некорректный параметр."""
+    qs = Incident.objects.all()
+    if params.get("machine"):
+        if not params["machine"].isdigit():
+            raise ValueError("machine must be a machine id")
+        qs = qs.filter(machine_id=int(params["machine"]))
+    if params.get("type"):
+        qs = qs.filter(type=params["type"])
+    if params.get("active") in ("1", "true"):
+        qs = qs.filter(is_active=True)
+    elif params.get("active") in ("0", "false"):
+        qs = qs.filter(is_active=False)
+    if params.get("since"):
+        qs = qs.filter(started_at__gte=_parse_time(params["since"], "since"))
+    if params.get("until"):
+        qs = qs.filter(started_at__lt=_parse_time(params["until"], "until"))
+    if params.get("cursor"):
+        at, _, last_id = params["cursor"].rpartition(",")
+        if not last_id.isdigit():
+            raise ValueError("cursor must be '<started_at>,<id>' from the previous page")
+        qs = _history_after(qs, _parse_time(at, "cursor"), int(last_id))
+    return qs.order_by("-started_at", "-id")
+
+def _history_after(qs, at, last_id):
+    # keyset: строго «после» строки (at, last_id) в порядке (-started_at, -id)
+    return qs.filter(Q(started_at__lt=at) | Q(started_at=at, id__lt=last_id))
+
+def _history_rows(qs, limit):
+    """Не больше limit + 1 строк пачками по HISTORY_CHUNK — каждая пачка отдельным keyset-запросом."""
+    left, page = limit + 1, qs
+    while left:
+        size = min(HISTORY_CHUNK, left)
+        rows = list(page.values_list(*HISTORY_COLUMNS.values())[:size])
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        left -= size
+        last = dict(zip(HISTORY_COLUMNS, rows[-1]))
+        page = _history_after(qs, last["started_at"], last["id"])
+
+class _HistoryWriter:
+    """JSON страницы истории по частям; строка сверх limit означает, что есть следующая страница."""
+
+    def __init__(self, limit):
+        self.limit, self.sent, self.last, self.more = limit, 0, None, False
+        self.encoder = DjangoJSONEncoder()
+
+    def head(self):
+        return '{"items":['
+
+    def rows(self, rows):
+        parts = []
+        for row in rows:
+            if self.sent == self.limit:
+                self.more = True
+                break
+            self.last = dict(zip(HISTORY_COLUMNS, row))
+            parts.append(("," if self.sent else "") + self.encoder.encode(self.last))
+            self.sent += 1
+        return "".join(parts)
+
+    def tail(self):
+        if not self.more:
+            return '],"next":null}'
+        # курсор по последней отданной строке
+        return '],"next":%s}' % self.encoder.encode(f"{self.last['started_at'].isoformat()},{self.last['id']}")
+
+def _history_stream(qs, limit):
+    writer = _HistoryWriter(limit)
+    yield writer.head()
+    for rows in _history_rows(qs, limit):
+        yield writer.rows(rows)
+    yield writer.tail()
+
+async def _history_stream_async(qs, limit):
+    # под ASGI Django собрал бы синхронный генератор в список целиком (sync_to_async(list));
+    # здесь каждая пачка читается из БД отдельным sync_to_async и сразу отдаётся
+    writer = _HistoryWriter(limit)
+    yield writer.head()
+    chunks = _history_rows(qs, limit)
+    while (rows := await sync_to_async(next)(chunks, None)) is not None:
+        yield writer.rows(rows)
+    yield writer.tail()
+
+@require_http_methods(["GET"])
+def incidents_history(request):
+    """
+    История инцидентов с фильтрами machine, type, active, since/until (по started_at)
+    и keyset-пагинацией по (started_at, id): ?cursor=<next из прошлой страницы>.
+    Ответ отдаётся потоком по HISTORY_CHUNK строк, память не зависит от размера
+    страницы; под ASGI — асинхронным генератором.
+    """
+    try:
+        qs = _history_queryset(request.GET)
+        limit = int(request.GET.get("limit", HISTORY_DEFAULT_LIMIT))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    stream = _history_stream_async if isinstance(request, ASGIRequest) else _history_stream
+    return StreamingHttpResponse(stream(qs, limit), content_type="application/json")
+
+SERIES_DEFAULT_POINTS = 300
+SERIES_MAX_POINTS = 2000
+SERIES_MAX_MACHINES = 50
+
+@require_http_methods(["GET"])
+def metrics_series(request):
+    """
+    Ряды cpu/mem/disk для одной или нескольких машин (?machine=1&machine=2 или machine=1,2)
+    за [from, to) не более чем в points точках, agg=avg|max (см. monitoring.series).
+    Ответ кэшируется по (машины, выровненный диапазон, шаг, agg).
+    """
+    try:
+        ids = sorted({int(x) for raw in request.GET.getlist("machine") for x in raw.split(",") if x})
+        points = int(request.GET.get("points", SERIES_DEFAULT_POINTS))
+        now = timezone.now()
+        end = _parse_time(request.GET["to"], "to") if request.GET.get("to") else now
+        start = _parse_time(request.GET["from"], "from") if request.GET.get("from") else end - timezone.timedelta(days=1)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    agg = request.GET.get("agg", "avg")
+    if not ids or len(ids) > SERIES_MAX_MACHINES:
+        return JsonResponse({"error": f"pass 1..{SERIES_MAX_MACHINES} machine ids"}, status=400)
+    if agg not in series.AGGS or start >= end:
+        return JsonResponse({"error": "agg must be avg|max and from < to"}, status=400)
+    points = max(1, min(points, SERIES_MAX_POINTS))
+
+    grid, lo, hi = series.align(start, end, points)
+    key = "series:%s:%s:%s:%s:%s" % (agg, grid.step, lo, hi, ",".join(map(str, ids)))
+    # закрытый в прошлом диапазон больше не меняется (с запасом на отставание агрегатов)
+    ttl = 24 * 3600 if hi < now.timestamp() - 3600 else 60
+    data = cache.get(key)
+    if data is None:
+        data = series.downsample(ids, start, end, points, agg)
+        cache.set(key, data, ttl)
+    response = JsonResponse(data)
+    response["Cache-Control"] = f"private, max-age={ttl}"
+    return response
+
+# ключ в ответе -> поле запроса к Machine (состояние — через MachineState, см. monitoring.state)
+FLEET_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "mode": "collection_mode",
+    "cpu": "state__cpu",
+    "mem": "state__mem_percent",
+    "disk": "state__disk_percent",
+    "uptime_sec": "state__uptime_sec",
+    "sampled_at": "state__sampled_at",
+    "fetched_at": "state__fetched_at",
+    "last_error": "state__last_error",
+}
+
+@require_http_methods(["GET"])
+def fleet_status(request):
+    """
+    Текущее состояние всех активных машин одним запросом (без чтения Metric):
+    последние значения, время последней попытки опроса и её ошибка.
+    stale — последний сэмпл старше допустимого разрыва (или его нет).
+    """
+    stale_before = timezone.now() - timezone.timedelta(seconds=max_gap())
+    rows = Machine.objects.filter(active=True).order_by("id").values_list(*FLEET_COLUMNS.values())
+    items = []
+    for row in rows:
+        item = dict(zip(FLEET_COLUMNS, row))
+        item["last_error"] = item["last_error"] or ""
+        item["stale"] = item["sampled_at"] is None or item["sampled_at"] < stale_before
+        items.append(item)
+    return JsonResponse({"items": items, "count": len(items)})
+
+@require_http_methods(["GET"])
+def prometheus_metrics(request):
+    # метрики самого мониторинга для Prometheus (см. monitoring.instrumentation)
+    body, content_type = instrumentation.render()
+    return HttpResponse(body, content_type=content_type)
+
+def _check_token(request, token, disabled):
+    # "Authorization: Bearer <token>"; None — можно продолжать, иначе ответ с ошибкой
+    if not token:
+        return JsonResponse({"error": disabled}, status=503)
+    given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        return JsonResponse({"error": "invalid token"}, status=401)
+    return None
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def ingest_metrics(request):
+    """
+    Приём метрик от агентов пачкой (JSON lines, см. monitoring.ingest.ingest_push).
+    Авторизация — "Authorization: Bearer <MONITORING_INGEST_TOKEN>", не сессия.
+    """
+    denied = _check_token(request, settings.MONITORING_INGEST_TOKEN, "ingestion is disabled")
+    if denied is not None:
+        return denied
+    try:
+        report = ingest.ingest_push(request.body)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(report, status=200 if report["accepted"] or not report["rejected"] else 400)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def import_machines(request):
+    """
+    Синхронизация парка с инвентарём (CSV или JSON lines в теле, см. monitoring.inventory).
+    Формат — ?format=csv|jsonl или по Content-Type (text/csv); ?keep_missing=1 — не выключать
+    отсутствующие машины, ?dry_run=1 — только посчитать изменения.
+    Авторизация — "Authorization: Bearer <MONITORING_INVENTORY_TOKEN>".
+    """
+    denied = _check_token(request, settings.MONITORING_INVENTORY_TOKEN, "inventory import is disabled")
+    if denied is not None:
+        return denied
+    fmt = request.GET.get("format") or inventory.detect_format(content_type=request.content_type or "")
+    try:
+        report = inventory.import_inventory(
+            request.body, fmt,
+            deactivate_missing=request.GET.get("keep_missing") not in ("1", "true"),
+            dry_run=request.GET.get("dry_run") in ("1", "true"),
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(report, status=400 if report["rejected"] else 200)
+
+async def incidents_stream(request):
+    """
+    Server-Sent Events: изменения инцидентов по мере их появления (см. monitoring.live).
+    Работает только под ASGI; иначе 503 — страница откатится на опрос.
+    """
+    if not isinstance(request, ASGIRequest) or not settings.MONITORING_EVENTS_REDIS_URL:
+        return JsonResponse({"error": "live stream is not available"}, status=503)
+    cursor = None
+    if request.GET.get("cursor"):
+        cursor = feed.parse_cursor(request.GET["cursor"])
+        if cursor is None:
+            return JsonResponse({"error": "cursor must be an ISO 8601 timestamp with timezone"}, status=400)
+    response = StreamingHttpResponse(live.stream(cursor), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # не буферизовать в nginx
+    return response
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])